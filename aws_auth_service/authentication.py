@@ -0,0 +1,154 @@
+"""
+Cognito JWT authentication with process-wide caches.
+
+django_cognito_jwt builds a new TokenValidator on every request, so the
+JWKS of the user pool is downloaded again and the RS256 signature of the
+token is verified every time. Here the public keys are kept for the life
+of the process (refetched when a token is signed with an unknown key, i.e.
+after a key rotation) and the users of the tokens already verified are
+kept in a bounded LRU until the tokens expire.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+import requests
+from django.conf import settings
+from django_cognito_jwt import JSONWebTokenAuthentication
+from django_cognito_jwt.validator import TokenError, TokenValidator
+from jwt.algorithms import RSAAlgorithm
+from rest_framework import exceptions
+
+
+class VerifiedTokenCache:
+    """
+    LRU of token digest -> user. Only the SHA-256 of the tokens is stored
+    and an entry is never returned after the exp claim of its token.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token):
+        if isinstance(token, str):
+            token = token.encode()
+        return hashlib.sha256(token).hexdigest()
+
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, token, user, expires_at):
+        if self.max_size <= 0 or not expires_at:
+            return
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (user, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+verified_tokens = VerifiedTokenCache(settings.COGNITO_TOKEN_CACHE_SIZE)
+
+
+class CachedTokenValidator(TokenValidator):
+    """
+    TokenValidator sharing the parsed public keys of the user pool between
+    every request of the process
+    """
+
+    _keys = {}
+    _fetched_at = {}
+    _lock = threading.Lock()
+
+    def _fetch_keys(self):
+        response = requests.get(self.pool_url + "/.well-known/jwks.json", timeout=settings.AWS_CONNECT_TIMEOUT)
+        response.raise_for_status()
+        return {item["kid"]: RSAAlgorithm.from_jwk(item) for item in response.json()["keys"]}
+
+    def _refresh_keys(self):
+        with self._lock:
+            # A token with a made up kid must not trigger a download per request
+            fetched_at = self._fetched_at.get(self.pool_url)
+            if fetched_at is not None and time.monotonic() - fetched_at < settings.COGNITO_JWKS_MIN_REFRESH_INTERVAL:
+                return
+            try:
+                keys = self._fetch_keys()
+            except requests.RequestException as e:
+                if self.pool_url in self._keys:
+                    # Keep using the known keys until the next refresh
+                    self._fetched_at[self.pool_url] = time.monotonic()
+                    return
+                raise TokenError(f"Could not fetch the JWKS: {str(e)}")
+            self._keys[self.pool_url] = keys
+            self._fetched_at[self.pool_url] = time.monotonic()
+
+    def _get_public_key(self, token):
+        try:
+            headers = jwt.get_unverified_header(token)
+        except jwt.DecodeError as exc:
+            raise TokenError(str(exc))
+
+        kid = headers.get("kid")
+        public_key = self._keys.get(self.pool_url, {}).get(kid)
+        if public_key is None:
+            self._refresh_keys()
+            public_key = self._keys.get(self.pool_url, {}).get(kid)
+        return public_key
+
+
+class CachedJSONWebTokenAuthentication(JSONWebTokenAuthentication):
+    """
+    JSONWebTokenAuthentication that only verifies the signature of a token
+    the first time it is seen
+    """
+
+    def authenticate(self, request):
+        jwt_token = self.get_jwt_token(request)
+        if jwt_token is None:
+            return None
+
+        user = verified_tokens.get(jwt_token)
+        if user is not None:
+            return (user, jwt_token)
+
+        try:
+            jwt_payload = self.get_token_validator(request).validate(jwt_token)
+        except TokenError:
+            raise exceptions.AuthenticationFailed()
+
+        USER_MODEL = self.get_user_model()
+        user = USER_MODEL.objects.get_or_create_for_cognito(jwt_payload)
+        verified_tokens.set(jwt_token, user, jwt_payload.get("exp"))
+        return (user, jwt_token)
+
+    def get_token_validator(self, request):
+        return CachedTokenValidator(
+            settings.COGNITO_AWS_REGION,
+            settings.COGNITO_USER_POOL,
+            settings.COGNITO_AUDIENCE,
+        )
@@ -1,17 +1,12 @@
-import boto3
 from django.conf import settings
 
+from config.aws import get_client
 
 
 class AWSCognitoService:
-    def __init__(self):
-        self.cognito_client = boto3.client(
-            'cognito-idp',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-            
-        )
+    @property
+    def cognito_client(self):
+        return get_client('cognito-idp')
     
     def get_user(self):
         try:
@@ -1,3 +1,128 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import SimpleTestCase, override_settings
+from jwt.algorithms import RSAAlgorithm
+from rest_framework import exceptions
+from rest_framework.test import APIRequestFactory
+
+from aws_auth_service import authentication
+from aws_auth_service.authentication import CachedJSONWebTokenAuthentication, CachedTokenValidator, verified_tokens
+
+
+REGION = 'us-east-1'
+USER_POOL = 'us-east-1_test'
+AUDIENCE = 'test-client'
+ISSUER = f'https://cognito-idp.{REGION}.amazonaws.com/{USER_POOL}'
+
+
+def generate_key():
+    return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+
+@override_settings(
+    COGNITO_AWS_REGION=REGION,
+    COGNITO_USER_POOL=USER_POOL,
+    COGNITO_AUDIENCE=AUDIENCE,
+    COGNITO_JWKS_MIN_REFRESH_INTERVAL=60,
+)
+class CachedJSONWebTokenAuthenticationTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.key = generate_key()
+        cls.other_key = generate_key()
+
+    def setUp(self):
+        CachedTokenValidator._keys.clear()
+        CachedTokenValidator._fetched_at.clear()
+        verified_tokens.clear()
+
+        jwk = RSAAlgorithm.to_jwk(self.key.public_key(), as_dict=True)
+        jwk['kid'] = 'key-1'
+        response = mock.Mock()
+        response.json.return_value = {'keys': [jwk]}
+        patcher = mock.patch.object(authentication.requests, 'get', return_value=response)
+        self.jwks_get = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def token(self, key=None, kid='key-1', **claims):
+        payload = {
+            'username': 'alice',
+            'email': 'alice@example.com',
+            'aud': AUDIENCE,
+            'iss': ISSUER,
+            'exp': int(time.time()) + 3600,
+        }
+        payload.update(claims)
+        return jwt.encode(payload, key or self.key, algorithm='RS256', headers={'kid': kid})
+
+    def authenticate(self, token):
+        request = APIRequestFactory().get('/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        return CachedJSONWebTokenAuthentication().authenticate(request)
+
+    def assertRejected(self, token):
+        with self.assertRaises(exceptions.AuthenticationFailed):
+            self.authenticate(token)
+
+    def test_valid_token(self):
+        user, _ = self.authenticate(self.token())
+
+        self.assertEqual(user.username, 'alice')
+        self.assertEqual(user.email, 'alice@example.com')
+        self.assertEqual(self.jwks_get.call_count, 1)
+
+    def test_keys_are_fetched_once(self):
+        self.authenticate(self.token())
+        self.authenticate(self.token(username='bob'))
+
+        self.assertEqual(self.jwks_get.call_count, 1)
+
+    def test_forged_signature(self):
+        self.assertRejected(self.token(key=self.other_key))
+
+    def test_expired_token(self):
+        self.assertRejected(self.token(exp=int(time.time()) - 60))
+
+    def test_wrong_audience(self):
+        self.assertRejected(self.token(aud='other-client'))
+
+    def test_wrong_issuer(self):
+        self.assertRejected(self.token(iss='https://cognito-idp.us-east-1.amazonaws.com/us-east-1_other'))
+
+    def test_unknown_kid_refetch_is_throttled(self):
+        self.authenticate(self.token())
+
+        for _ in range(5):
+            self.assertRejected(self.token(kid='made-up'))
+        self.assertEqual(self.jwks_get.call_count, 1)
+
+        # The keys are downloaded again once the interval has passed
+        CachedTokenValidator._fetched_at[ISSUER] -= 61
+        self.assertRejected(self.token(kid='made-up'))
+        self.assertEqual(self.jwks_get.call_count, 2)
+
+    def test_cached_token_is_not_verified_again(self):
+        token = self.token()
+        with mock.patch.object(CachedTokenValidator, 'validate', wraps=CachedTokenValidator(REGION, USER_POOL, AUDIENCE).validate) as validate:
+            self.authenticate(token)
+            user, _ = self.authenticate(token)
+
+        self.assertEqual(user.username, 'alice')
+        self.assertEqual(validate.call_count, 1)
+
+    def test_cache_hit_does_not_bypass_expiry(self):
+        expires_at = int(time.time()) + 60
+        token = self.token(exp=expires_at)
+        self.authenticate(token)
+
+        clock = mock.Mock(wraps=time)
+        clock.time.return_value = expires_at + 1
+        with mock.patch.object(authentication, 'time', clock), \
+                mock.patch.object(CachedTokenValidator, 'validate', side_effect=authentication.TokenError('Signature has expired')) as validate:
+            self.assertRejected(token)
+
+        self.assertEqual(validate.call_count, 1)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class AwsFilesApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'aws_files_api'
+
+    def ready(self):
+        # Register the folder job handlers
+        from aws_files_api import jobs  # noqa: F401
@@ -0,0 +1,160 @@
+import queue
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+
+class ZipStreamSink:
+    """
+    Write-only file that zipfile writes the archive to and the response
+    reads it from. It has no tell() or seek(), so zipfile writes the sizes
+    and CRC of every member after its data instead of seeking back.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+class ObjectPrefetch:
+    """
+    Read an object in a pool thread into a queue of at most max_chunks
+    chunks. The thread waits while the queue is full, so an object is never
+    buffered further ahead than that.
+    """
+
+    def __init__(self, file_service, bucket_name, key, chunk_size, max_chunks, stopped):
+        self.file_service = file_service
+        self.bucket_name = bucket_name
+        self.key = key
+        self.chunk_size = chunk_size
+        self.queue = queue.Queue(maxsize=max_chunks)
+        self.stopped = stopped
+
+    def _put(self, item):
+        # Gives up when the response is closed, e.g. the client disconnected
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        try:
+            file = self.file_service.stream_file(self.bucket_name, self.key, chunk_size=self.chunk_size)
+        except Exception as e:
+            self._put(('error', e))
+            return
+
+        try:
+            if not self._put(('file', {'content_length': file['content_length'], 'last_modified': file['last_modified']})):
+                return
+            for chunk in file['chunks']:
+                if not self._put(('chunk', chunk)):
+                    return
+            self._put(('end', None))
+        except Exception as e:
+            self._put(('error', e))
+        finally:
+            file['chunks'].close()
+
+    def get(self):
+        kind, value = self.queue.get()
+        if kind == 'error':
+            raise Exception(f"Error reading {self.key}: {str(value)}")
+        return kind, value
+
+
+def zip_date_time(last_modified):
+    # ZIP dates start in 1980
+    if last_modified is None or last_modified.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    return last_modified.timetuple()[:6]
+
+
+def iter_zip_archive(file_service, bucket_name, entries):
+    """
+    Yield a ZIP archive (stored, PDFs are already compressed) of S3 objects
+    while it is built. The next ARCHIVE_PREFETCH_FILES objects are read
+    concurrently, each one buffering at most ARCHIVE_PREFETCH_BYTES, so the
+    memory used does not depend on the size of the archive.
+    @param file_service: AWSFileService
+    @param bucket_name: str
+    @param entries: iterable of (key, name in the archive) - may be a generator, it is consumed as the archive is written
+    @return: iterator of bytes
+    """
+    chunk_size = settings.AWS_S3_DOWNLOAD_CHUNK_SIZE
+    max_chunks = max(1, settings.ARCHIVE_PREFETCH_BYTES // chunk_size)
+    window = settings.ARCHIVE_PREFETCH_FILES
+
+    entries = iter(entries)
+    pending = deque()
+    stopped = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=window)
+    sink = ZipStreamSink()
+
+    def prefetch_next():
+        while len(pending) < window:
+            entry = next(entries, None)
+            if entry is None:
+                return
+            key, name = entry
+            prefetch = ObjectPrefetch(file_service, bucket_name, key, chunk_size, max_chunks, stopped)
+            executor.submit(prefetch.run)
+            pending.append((name, prefetch))
+
+    try:
+        with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as archive:
+            prefetch_next()
+            while pending:
+                name, prefetch = pending.popleft()
+                _, file = prefetch.get()
+
+                info = zipfile.ZipInfo(name, date_time=zip_date_time(file['last_modified']))
+                # Known before the data is written, so ZIP64 is used when the member needs it
+                info.file_size = file['content_length']
+                with archive.open(info, 'w') as member:
+                    while True:
+                        kind, chunk = prefetch.get()
+                        if kind == 'end':
+                            break
+                        member.write(chunk)
+                        yield from sink.drain()
+                yield from sink.drain()
+                prefetch_next()
+        # Central directory
+        yield from sink.drain()
+    finally:
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def archive_response(file_service, bucket_name, entries, file_name):
+    """
+    Build the streaming response of a ZIP archive. Its length is unknown
+    until the end, so it is sent without Content-Length.
+    @param file_service: AWSFileService
+    @param bucket_name: str
+    @param entries: iterable of (key, name in the archive)
+    @param file_name: str - name of the downloaded archive
+    @return: StreamingHttpResponse
+    """
+    response = StreamingHttpResponse(iter_zip_archive(file_service, bucket_name, entries), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
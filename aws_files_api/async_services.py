@@ -0,0 +1,105 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from aws_files_api.services import AWSFileService
+
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Return the bounded thread pool that runs the blocking boto3 calls of
+    the async views, created once per process
+    """
+    global _executor, _executor_pid
+
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.AWS_ASYNC_MAX_WORKERS,
+                    thread_name_prefix='aws-async',
+                )
+                _executor_pid = os.getpid()
+    return _executor
+
+
+def _call(func, *args, **kwargs):
+    # The pool threads outlive the requests, so they release their database
+    # connection after each call like a request thread would
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Run a blocking function in the shared thread pool and wait for its result
+    without blocking the event loop
+    @param func: callable
+    @return: result of func
+    """
+    loop = asyncio.get_running_loop()
+    # Copy the context so the call is counted in the metrics of the request
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), context.run, functools.partial(_call, func, *args, **kwargs))
+
+
+class AsyncAWSFileService:
+    """
+    Async counterpart of AWSFileService. The event loop only waits on the
+    S3 calls, which run in a bounded thread pool, so one ASGI worker can
+    serve as many concurrent requests as the pool and the connection pool
+    allow.
+    """
+
+    def __init__(self, file_service=None):
+        self.file_service = file_service or AWSFileService()
+
+    async def _run(self, method, *args, **kwargs):
+        return await run_blocking(getattr(self.file_service, method), *args, **kwargs)
+
+    async def get_files_by_folder_key(self, bucket_name, folder_key):
+        return await self._run('get_files_by_folder_key', bucket_name, folder_key)
+
+    async def get_files_page_by_folder_key(self, bucket_name, folder_key, page_size, cursor=None):
+        return await self._run('get_files_page_by_folder_key', bucket_name, folder_key, page_size, cursor)
+
+    async def get_principal_folders(self, bucket_name):
+        return await self._run('get_principal_folders', bucket_name)
+
+    async def head_file(self, bucket_name, file_name):
+        return await self._run('head_file', bucket_name, file_name)
+
+    async def stream_file(self, bucket_name, file_name, chunk_size=None, byte_range=None):
+        """
+        Same as AWSFileService.stream_file but the chunks are an async
+        iterator, every read of the S3 body happens in the thread pool
+        """
+        file = await self._run('stream_file', bucket_name, file_name, chunk_size, byte_range)
+        file['chunks'] = self._aiter_chunks(file['chunks'])
+        return file
+
+    @staticmethod
+    async def _aiter_chunks(chunks):
+        loop = asyncio.get_running_loop()
+        executor = get_executor()
+        try:
+            while True:
+                chunk = await loop.run_in_executor(executor, next, chunks, None)
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            await loop.run_in_executor(executor, chunks.close)
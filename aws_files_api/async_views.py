@@ -0,0 +1,73 @@
+from django.http import JsonResponse
+from rest_framework import status
+
+from aws_files_api.async_services import AsyncAWSFileService
+from aws_files_api.downloads import abuild_download_response
+from aws_files_api.serializers import DownloadFileSerializer, GetFilesByFolderSerializer
+from config.async_views import AsyncAPIView
+from config.renderers import FastJsonResponse
+
+async_file_service = AsyncAWSFileService()
+
+
+class AsyncFilesView(AsyncAPIView):
+    """
+    Async version of FilesView.get
+    """
+
+    async def get(self, request):
+        try:
+            serializer = GetFilesByFolderSerializer(data=request.GET)
+            if serializer.is_valid():
+                folder_key = serializer.validated_data['folder_key']
+            else:
+                return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            folder_key = f"{folder_key}/" if folder_key else ""
+
+            if 'page_size' in serializer.validated_data or 'cursor' in serializer.validated_data:
+                page = await async_file_service.get_files_page_by_folder_key(
+                    f'{request.user.username}-security-project',
+                    folder_key,
+                    serializer.validated_data.get('page_size', 100),
+                    serializer.validated_data.get('cursor'),
+                )
+                return FastJsonResponse(page, status=status.HTTP_200_OK)
+
+            documentos = await async_file_service.get_files_by_folder_key(f'{request.user.username}-security-project', folder_key)
+            return FastJsonResponse(documentos, status=status.HTTP_200_OK)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncDownloadFile(AsyncAPIView):
+    """
+    Async version of DownloadFile, the body is streamed from S3 without
+    holding a thread between chunks
+    """
+
+    async def get(self, request):
+        serializer = DownloadFileSerializer(data=request.GET)
+        if serializer.is_valid():
+            file_key = serializer.validated_data['file_key']
+        else:
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            return await abuild_download_response(request, async_file_service, f"{request.user.username}-security-project", file_key)
+
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncPrincipalFolder(AsyncAPIView):
+    """
+    Async version of PrincipalFolder
+    """
+
+    async def get(self, request):
+        try:
+            response = await async_file_service.get_principal_folders(f'{request.user.username}-security-project')
+            return FastJsonResponse(response, status=status.HTTP_200_OK)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
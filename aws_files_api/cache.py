@@ -0,0 +1,93 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class ListingCache:
+    """
+    Cache of the serialized folder listings, keyed by bucket and prefix.
+
+    Every (bucket, prefix) pair has a generation stamp that is part of the
+    key of its entries. Invalidating a prefix writes a new stamp, so all the
+    pages cached for it become unreachable and expire on their own. Stamps
+    are time based instead of counters so an evicted stamp can never bring
+    back an old generation.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[settings.LISTING_CACHE_ALIAS]
+
+    @staticmethod
+    def _digest(*parts):
+        return hashlib.sha1('\x00'.join(str(part) for part in parts).encode()).hexdigest()
+
+    def _generation_key(self, bucket_name, prefix):
+        return f'listing-gen:{self._digest(bucket_name, prefix)}'
+
+    def _generation(self, bucket_name, prefix):
+        key = self._generation_key(bucket_name, prefix)
+        generation = self.cache.get(key)
+        if generation is None:
+            self.cache.add(key, time.time_ns(), None)
+            generation = self.cache.get(key)
+        return generation
+
+    def get_or_set(self, bucket_name, prefix, variant, compute):
+        """
+        Return the cached listing or compute and store it
+        @param bucket_name: str
+        @param prefix: str - folder the listing belongs to
+        @param variant: str - distinguishes several listings of the same prefix (pages, filters)
+        @param compute: callable that returns the listing
+        """
+        if not settings.LISTING_CACHE_ENABLED:
+            return compute()
+
+        key = f'listing:{self._digest(bucket_name, prefix, variant, self._generation(bucket_name, prefix))}'
+        value = self.cache.get(key)
+        if value is not None:
+            self._count(hit=True)
+            return value
+
+        self._count(hit=False)
+        value = compute()
+        self.cache.set(key, value, settings.LISTING_CACHE_TIMEOUT)
+        return value
+
+    def invalidate(self, bucket_name, prefixes):
+        """
+        Drop the listings of the given prefixes
+        @param bucket_name: str
+        @param prefixes: iterable of str
+        """
+        if not settings.LISTING_CACHE_ENABLED:
+            return
+
+        stamp = time.time_ns()
+        self.cache.set_many(
+            {self._generation_key(bucket_name, prefix): stamp for prefix in set(prefixes)},
+            None,
+        )
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+listing_cache = ListingCache()
@@ -0,0 +1,186 @@
+import re
+
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+from aws_files_api.services import InvalidRangeError
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(header):
+    """
+    Return the single byte range of a Range header in the form accepted by
+    S3, or None when it is missing, malformed or asks for several ranges
+    (in which case the whole file is sent with a 200)
+    @param header: str
+    @return: str
+    """
+    if not header:
+        return None
+
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if start and end and int(start) > int(end):
+        return None
+
+    return f'bytes={start}-{end}'
+
+
+def _strip_weak(etag):
+    return etag[2:] if etag.startswith('W/') else etag
+
+
+def etag_matches(request, etag):
+    """
+    Evaluate If-None-Match against an ETag (weak comparison)
+    @param request: HttpRequest
+    @param etag: str
+    @return: bool
+    """
+    etags = parse_etags(request.headers.get('If-None-Match', ''))
+    if '*' in etags:
+        return True
+    return _strip_weak(etag) in [_strip_weak(value) for value in etags]
+
+
+def is_not_modified(request, metadata):
+    """
+    Evaluate If-None-Match and If-Modified-Since against the object metadata
+    @param request: HttpRequest
+    @param metadata: dict - result of AWSFileService.head_file
+    @return: bool
+    """
+    if request.headers.get('If-None-Match'):
+        return etag_matches(request, metadata['etag'])
+
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    if if_modified_since is not None:
+        return int(metadata['last_modified'].timestamp()) <= if_modified_since
+
+    return False
+
+
+def if_range_matches(request, metadata):
+    """
+    Check the If-Range validator, a strong ETag or an exact HTTP date
+    @param request: HttpRequest
+    @param metadata: dict - result of AWSFileService.head_file
+    @return: bool
+    """
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        return not if_range.startswith('W/') and if_range == metadata['etag']
+
+    if_range_date = parse_http_date_safe(if_range)
+    return if_range_date is not None and if_range_date == int(metadata['last_modified'].timestamp())
+
+
+def set_validators(response, etag, last_modified):
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+
+
+def not_modified_response(metadata):
+    response = HttpResponseNotModified()
+    set_validators(response, metadata['etag'], metadata['last_modified'])
+    return response
+
+
+def range_not_satisfiable_response(error):
+    response = HttpResponse(status=416)
+    if error.object_size is not None:
+        response['Content-Range'] = f'bytes */{error.object_size}'
+    return response
+
+
+def file_response(file, file_key, streaming_content):
+    """
+    Build the streaming response of an opened file
+    @param file: dict - result of AWSFileService.stream_file
+    @param file_key: str
+    @param streaming_content: iterator or async iterator of the file chunks
+    @return: StreamingHttpResponse
+    """
+    response = StreamingHttpResponse(
+        streaming_content,
+        content_type='application/pdf',
+        status=206 if file['content_range'] else 200,
+    )
+    response['Content-Length'] = file['content_length']
+    response['Accept-Ranges'] = 'bytes'
+    if file['content_range']:
+        response['Content-Range'] = file['content_range']
+    set_validators(response, file['etag'], file['last_modified'])
+
+    file_name = file_key.split('/')[-1]
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
+
+
+def has_conditional_headers(request):
+    return any(header in request.headers for header in ('If-None-Match', 'If-Modified-Since', 'If-Range'))
+
+
+def build_download_response(request, file_service, bucket_name, file_key):
+    """
+    Build the streaming response of a download answering conditional and
+    byte-range requests. The conditional headers are checked with a HEAD
+    so a 304 never opens the object body.
+    @param request: HttpRequest
+    @param file_service: AWSFileService
+    @param bucket_name: str
+    @param file_key: str
+    @return: HttpResponse
+    """
+    byte_range = parse_range(request.headers.get('Range'))
+
+    if has_conditional_headers(request):
+        metadata = file_service.head_file(bucket_name, file_key)
+
+        if is_not_modified(request, metadata):
+            return not_modified_response(metadata)
+
+        if byte_range and not if_range_matches(request, metadata):
+            byte_range = None
+
+    try:
+        file = file_service.stream_file(bucket_name, file_key, byte_range=byte_range)
+    except InvalidRangeError as e:
+        return range_not_satisfiable_response(e)
+
+    return file_response(file, file_key, file['chunks'])
+
+
+async def abuild_download_response(request, async_file_service, bucket_name, file_key):
+    """
+    Async version of build_download_response for AsyncAWSFileService
+    """
+    byte_range = parse_range(request.headers.get('Range'))
+
+    if has_conditional_headers(request):
+        metadata = await async_file_service.head_file(bucket_name, file_key)
+
+        if is_not_modified(request, metadata):
+            return not_modified_response(metadata)
+
+        if byte_range and not if_range_matches(request, metadata):
+            byte_range = None
+
+    try:
+        file = await async_file_service.stream_file(bucket_name, file_key, byte_range=byte_range)
+    except InvalidRangeError as e:
+        return range_not_satisfiable_response(e)
+
+    return file_response(file, file_key, file['chunks'])
@@ -0,0 +1,48 @@
+# Background jobs of the folder operations and of the text extraction, run by `python manage.py run_jobs`
+
+from aws_files_api.services import AWSFileService
+from jobs.registry import register
+from shared_files.services import SharedFileService
+
+
+file_service = AWSFileService()
+shared_file_service = SharedFileService()
+
+
+@register('rename_folder')
+def rename_folder(job, progress):
+    payload = job.payload
+    response = file_service.update_folder_name(
+        payload['bucket_name'],
+        f"{payload['folder_key']}/",
+        f"{payload['new_folder_key']}/",
+        progress_callback=progress,
+        on_renamed=lambda: shared_file_service.update_folder_key(payload['folder_key'], payload['new_folder_key'], job.owner_user_id),
+        resume=job.attempts > 1,
+    )
+    return response
+
+
+@register('delete_folder')
+def delete_folder(job, progress):
+    payload = job.payload
+    response = file_service.delete_folder(payload['bucket_name'], f"{payload['folder_key']}/", progress_callback=progress)
+    deleted_keys = response.pop('deleted_keys')
+    if response['errors']:
+        shared_file_service.delete_many(deleted_keys, job.owner_user_id)
+        raise Exception(f"{len(response['errors'])} objects could not be deleted")
+
+    shared_file_service.delete_folder(payload['folder_key'], job.owner_user_id)
+    progress(response['deleted'], response['deleted'])
+    return response
+
+
+@register('extract_document_text')
+def extract_document_text(job, progress):
+    payload = job.payload
+    return file_service.extract_document_text(
+        payload['bucket_name'],
+        payload['file_key'],
+        force=payload.get('force', False),
+        progress_callback=progress,
+    )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from aws_files_api.services import BUCKET_SUFFIX
+
+
+class BucketCommand(BaseCommand):
+    """
+    Base of the commands run on the user buckets, selected by username or
+    with --all
+    """
+    # Completes "Users whose bucket is ..." in the help
+    action = 'processed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help=f'Users whose bucket is {self.action}')
+        parser.add_argument('--all', action='store_true', help=f'Every *{BUCKET_SUFFIX} bucket')
+
+    def get_buckets(self, file_service, options):
+        """
+        Return the names of the selected buckets
+        @param file_service: AWSFileService
+        @param options: dict - options of the command
+        @return: list of str
+        """
+        if not options['all'] and not options['usernames']:
+            raise CommandError('Pass the usernames or --all')
+        return file_service.get_user_buckets(None if options['all'] else options['usernames'])
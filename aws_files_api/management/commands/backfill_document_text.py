@@ -0,0 +1,61 @@
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+from django.db import close_old_connections, connection
+
+from aws_files_api.management.buckets import BucketCommand
+from aws_files_api.services import BUCKET_SUFFIX, AWSFileService
+from jobs.services import JobService
+
+
+class Command(BucketCommand):
+    help = 'Extract the text of the PDFs of the user buckets that are not in the full-text index yet'
+    action = 'extracted'
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument('--force', action='store_true', help='Extract every file again, even the unchanged ones')
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Queue one job per file for `run_jobs` instead of extracting them here')
+        parser.add_argument('--concurrency', type=int, default=4, help='Files downloaded and extracted at the same time')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        self.file_service = AWSFileService()
+
+        for bucket_name in self.get_buckets(self.file_service, options):
+            # The candidates come from the index, the files removed outside of the API lose their text
+            self.file_service.index.documents.prune(bucket_name)
+            keys = self.file_service.index.documents.pending(bucket_name, options['force'])
+
+            if options['enqueue']:
+                count = JobService().enqueue_many(
+                    bucket_name[:-len(BUCKET_SUFFIX)],
+                    'extract_document_text',
+                    ({'bucket_name': bucket_name, 'file_key': key, 'force': options['force']} for key in keys),
+                    options['batch_size'],
+                )
+                self.stdout.write(f'{bucket_name}: {count} files queued')
+            else:
+                self.extract(bucket_name, keys, options)
+
+    def extract(self, bucket_name, keys, options):
+        totals = {}
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            # Batches keep the pending keys of a large bucket out of memory
+            while batch := list(islice(keys, options['batch_size'])):
+                for key, result in zip(batch, executor.map(lambda key: self.extract_one(bucket_name, key, options['force']), batch)):
+                    totals[result['status']] = totals.get(result['status'], 0) + 1
+                    if result['status'] in ('failed', 'error'):
+                        self.stderr.write(f"{bucket_name}/{key}: {result['error']}")
+        summary = ', '.join(f'{count} {status}' for status, count in sorted(totals.items())) or 'nothing to extract'
+        self.stdout.write(f'{bucket_name}: {summary}')
+
+    def extract_one(self, bucket_name, key, force):
+        close_old_connections()
+        try:
+            return self.file_service.extract_document_text(bucket_name, key, force=force)
+        except Exception as e:
+            return {'status': 'error', 'error': str(e)}
+        finally:
+            connection.close()
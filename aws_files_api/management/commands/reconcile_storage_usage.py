@@ -0,0 +1,18 @@
+from aws_files_api.management.buckets import BucketCommand
+from aws_files_api.services import AWSFileService
+
+
+class Command(BucketCommand):
+    help = 'Recount the storage usage counters of the user buckets from the StoredObject index'
+    action = 'reconciled'
+
+    def handle(self, *args, **options):
+        file_service = AWSFileService()
+
+        for bucket_name in self.get_buckets(file_service, options):
+            result = file_service.reconcile_storage_usage(bucket_name)
+            drift = result['size_after'] - result['size_before']
+            self.stdout.write(
+                f"{bucket_name}: {result['size_after']} bytes in {result['file_count_after']} files "
+                f"(drift {drift:+d} bytes, {result['file_count_after'] - result['file_count_before']:+d} files)"
+            )
@@ -0,0 +1,14 @@
+from aws_files_api.management.buckets import BucketCommand
+from aws_files_api.services import AWSFileService
+
+
+class Command(BucketCommand):
+    help = 'Rebuild the StoredObject index and the storage usage counters of the user buckets from S3'
+    action = 'reindexed'
+
+    def handle(self, *args, **options):
+        file_service = AWSFileService()
+
+        for bucket_name in self.get_buckets(file_service, options):
+            count = file_service.reindex_bucket(bucket_name)
+            self.stdout.write(f'{bucket_name}: {count} files indexed')
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_files_api', '0002_delete_sharedfile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredObject',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('bucket_name', models.CharField(max_length=255)),
+                ('key', models.TextField()),
+                ('parent_prefix', models.TextField()),
+                ('size', models.BigIntegerField(default=0)),
+                ('last_modified', models.DateTimeField(null=True)),
+                ('etag', models.CharField(blank=True, default='', max_length=255)),
+                ('is_folder', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket_name', 'parent_prefix', 'key'], name='stored_object_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('bucket_name', 'key'), name='stored_object_bucket_key_uniq')],
+            },
+        ),
+    ]
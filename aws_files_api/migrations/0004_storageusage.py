@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_files_api', '0003_storedobject'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorageUsage',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('bucket_name', models.CharField(max_length=255)),
+                ('prefix', models.TextField()),
+                ('size', models.BigIntegerField(default=0)),
+                ('file_count', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket_name', 'prefix'), name='storage_usage_bucket_prefix_uniq')],
+            },
+        ),
+    ]
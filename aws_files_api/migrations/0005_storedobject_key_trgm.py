@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:43
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import BtreeGinExtension, TrigramExtension
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_files_api', '0004_storageusage'),
+    ]
+
+    operations = [
+        # pg_trgm for the gin_trgm_ops opclass, btree_gin to put the bucket in the same GIN index
+        BtreeGinExtension(),
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='storedobject',
+            index=django.contrib.postgres.indexes.GinIndex(models.F('bucket_name'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('key'), name='gin_trgm_ops'), name='stored_object_key_trgm_idx'),
+        ),
+    ]
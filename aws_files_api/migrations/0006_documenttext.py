@@ -0,0 +1,47 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:49
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('aws_files_api', '0005_storedobject_key_trgm'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentText',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('bucket_name', models.CharField(max_length=255)),
+                ('key', models.TextField()),
+                ('etag', models.CharField(max_length=255)),
+                ('status', models.CharField(choices=[('indexed', 'Indexed'), ('failed', 'Failed')], default='indexed', max_length=20)),
+                ('page_count', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('extracted_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket_name', 'key'), name='document_text_bucket_key_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentPage',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('bucket_name', models.CharField(max_length=255)),
+                ('page_number', models.IntegerField()),
+                ('text', models.TextField()),
+                ('search_vector', django.contrib.postgres.search.SearchVectorField(null=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='aws_files_api.documenttext')),
+            ],
+            options={
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['bucket_name', 'search_vector'], name='document_page_search_idx')],
+                'constraints': [models.UniqueConstraint(fields=('document', 'page_number'), name='document_page_number_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,112 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
+
+
+class StoredObject(models.Model):
+    """
+    Metadata of an object of a user bucket, kept in sync with S3 by
+    AWSFileService. Folders are stored with is_folder=True, including the
+    ones that only exist as a prefix of other keys.
+    """
+    id = models.AutoField(primary_key=True)
+    bucket_name = models.CharField(max_length=255)
+    key = models.TextField()
+    parent_prefix = models.TextField()
+    size = models.BigIntegerField(default=0)
+    last_modified = models.DateTimeField(null=True)
+    etag = models.CharField(max_length=255, blank=True, default='')
+    is_folder = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket_name', 'key'], name='stored_object_bucket_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['bucket_name', 'parent_prefix', 'key'], name='stored_object_parent_idx'),
+            # Substring search of the keys of a bucket: key__icontains is UPPER(key) LIKE '%...%'
+            GinIndex(F('bucket_name'), OpClass(Upper('key'), name='gin_trgm_ops'), name='stored_object_key_trgm_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket_name}/{self.key}"
+
+
+class StorageUsage(models.Model):
+    """
+    Bytes and files stored under a prefix of a user bucket, the whole bucket
+    for prefix ''. Kept up to date by FileIndexService on every change of
+    the index and rebuilt from S3 by `python manage.py reconcile_storage_usage`.
+    """
+    id = models.AutoField(primary_key=True)
+    bucket_name = models.CharField(max_length=255)
+    prefix = models.TextField()
+    size = models.BigIntegerField(default=0)
+    file_count = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket_name', 'prefix'], name='storage_usage_bucket_prefix_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket_name}/{self.prefix}: {self.size} bytes"
+
+
+class DocumentText(models.Model):
+    """
+    Text extracted from a PDF of a user bucket. etag is the ETag of the
+    version the text was read from: a file is only extracted again when it
+    changes. Renames and deletes are applied by FileIndexService.
+    """
+    STATUS_INDEXED = 'indexed'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_INDEXED, 'Indexed'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    id = models.AutoField(primary_key=True)
+    bucket_name = models.CharField(max_length=255)
+    key = models.TextField()
+    etag = models.CharField(max_length=255)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_INDEXED)
+    page_count = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    extracted_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['bucket_name', 'key'], name='document_text_bucket_key_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket_name}/{self.key} ({self.status})"
+
+
+class DocumentPage(models.Model):
+    """
+    Text of one page of a DocumentText and its full-text search vector
+    """
+    id = models.AutoField(primary_key=True)
+    document = models.ForeignKey(DocumentText, on_delete=models.CASCADE, related_name='pages')
+    # Copy of the document bucket, so the search index can filter by it
+    bucket_name = models.CharField(max_length=255)
+    page_number = models.IntegerField()
+    text = models.TextField()
+    search_vector = SearchVectorField(null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'page_number'], name='document_page_number_uniq'),
+        ]
+        indexes = [
+            # btree_gin puts the bucket in the same GIN index as the tsvector
+            GinIndex(fields=['bucket_name', 'search_vector'], name='document_page_search_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.document_id} page {self.page_number}"
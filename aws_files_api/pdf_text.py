@@ -0,0 +1,106 @@
+"""
+Text extraction of the PDFs, run in a pool of processes.
+
+pypdf is pure Python: parsing a large document holds the GIL for seconds,
+so the pages are read in separate processes and the job worker threads
+only wait for the result. The pool is started with spawn (forking the
+threaded worker is unsafe) and this module imports nothing from Django, so
+the children start quickly. Every child is replaced after a few documents
+to give back the memory pypdf keeps.
+"""
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+
+# PostgreSQL tsvectors are limited to 1 MB, longer pages are truncated
+MAX_PAGE_CHARS = 100_000
+TASKS_PER_CHILD = 20
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class PdfTextError(Exception):
+    """
+    The file is not a readable PDF (damaged, encrypted...). Extracting it
+    again gives the same error, unlike the errors of S3 or of the pool.
+    """
+
+
+def extract_pages(path, max_pages):
+    """
+    This function extract the text of the pages of a PDF. Runs in the pool.
+    @param path: str
+    @param max_pages: int - pages after this one are ignored
+    @return: list of str
+    """
+    try:
+        reader = PdfReader(path)
+        if reader.is_encrypted:
+            raise PdfTextError('The file is encrypted')
+
+        pages = []
+        for page in reader.pages[:max_pages]:
+            text = page.extract_text() or ''
+            # NUL is not allowed in PostgreSQL text
+            pages.append(text.replace('\x00', '')[:MAX_PAGE_CHARS])
+        return pages
+    except PdfTextError:
+        raise
+    except Exception as e:
+        raise PdfTextError(str(e))
+
+
+def _get_pool(workers):
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                max_tasks_per_child=TASKS_PER_CHILD,
+            )
+        return _pool
+
+
+def _reset_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_text(path, workers, max_pages, heartbeat=None, heartbeat_interval=30):
+    """
+    This function extract the text of a PDF in the process pool
+    @param path: str - file readable by the pool processes
+    @param workers: int - size of the pool, used when it is created
+    @param max_pages: int
+    @param heartbeat: callable - called while waiting, e.g. to keep a job lock
+    @param heartbeat_interval: int - seconds
+    @return: list of str - text of every page
+    """
+    if PdfReader is None:
+        raise Exception('pypdf is not installed, run `pip install pypdf`')
+
+    pool = _get_pool(workers)
+    try:
+        future = pool.submit(extract_pages, path, max_pages)
+        while True:
+            try:
+                return future.result(timeout=heartbeat_interval)
+            except TimeoutError:
+                if heartbeat:
+                    heartbeat()
+    except BrokenProcessPool:
+        # A child died (e.g. killed for its memory), the next call starts a new pool
+        _reset_pool(pool)
+        raise Exception('The text extraction process stopped unexpectedly')
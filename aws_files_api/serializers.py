@@ -2,6 +2,8 @@
 from rest_framework import serializers
 from django.core.validators import RegexValidator
 
+from config.metrics import serialize_timer
+
 
 class UploadFileSerializer(serializers.Serializer):
     file_name = serializers.CharField(
@@ -41,6 +43,16 @@ class GetFilesByFolderSerializer(serializers.Serializer):
         help_text='Only letters and numbers and spaces and underscores are allowed',
         validators=[RegexValidator(r'^[a-zA-Z0-9\s_-]+$', 'Only letters and numbers and spaces and underscores are allowed')]
     )
+    page_size = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=1000,
+        help_text='Number of items per page. When page_size or cursor is sent the response is paginated'
+    )
+    cursor = serializers.CharField(
+        required=False,
+        help_text='next_cursor returned by the previous page'
+    )
     
 
 
@@ -70,6 +82,81 @@ class FolderGetSerializer(serializers.Serializer):
     )
     
 
+class FolderTreeSerializer(serializers.Serializer):
+    folder_key = serializers.CharField(
+        default='',
+        allow_blank=True,
+        help_text='Folder at the root of the tree, the whole bucket when empty. Only letters and numbers and spaces and hyphens and underscores are allowed',
+        validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]*$', 'Only letters and numbers and spaces and hyphens and underscores are allowed')]
+    )
+    depth = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=50,
+        help_text='Levels of subfolders returned, all of them when omitted'
+    )
+
+    def validate_folder_key(self, value):
+        if value.endswith('/'):
+            raise serializers.ValidationError("Folder key must not end with '/'")
+        return value
+
+
+class FileSearchSerializer(serializers.Serializer):
+    # Results past this position are never returned, refine the query instead
+    MAX_RESULTS = 1000
+
+    q = serializers.CharField(
+        min_length=2,
+        max_length=100,
+        help_text='Text contained in the file key (own files) or file name (shared files)'
+    )
+    scope = serializers.ChoiceField(
+        choices=['all', 'own', 'shared'],
+        default='all',
+        help_text='Search the own files, the files shared with the user or both'
+    )
+    page = serializers.IntegerField(default=1, min_value=1)
+    page_size = serializers.IntegerField(default=20, min_value=1, max_value=100)
+
+    def validate(self, data):
+        if data['page'] * data['page_size'] > self.MAX_RESULTS:
+            raise serializers.ValidationError(f"Only the first {self.MAX_RESULTS} results can be paged through")
+        return data
+
+
+class DocumentSearchSerializer(serializers.Serializer):
+    # Results past this position are never returned, refine the query instead
+    MAX_RESULTS = 1000
+
+    q = serializers.CharField(
+        min_length=2,
+        max_length=200,
+        help_text='Words to find in the text of the files. "Quoted phrases", or and -word are supported'
+    )
+    page = serializers.IntegerField(default=1, min_value=1)
+    page_size = serializers.IntegerField(default=20, min_value=1, max_value=100)
+
+    def validate(self, data):
+        if data['page'] * data['page_size'] > self.MAX_RESULTS:
+            raise serializers.ValidationError(f"Only the first {self.MAX_RESULTS} results can be paged through")
+        return data
+
+
+class StorageUsageSerializer(serializers.Serializer):
+    folder_key = serializers.CharField(
+        default='',
+        allow_blank=True,
+        help_text='Folder to measure, the whole bucket when empty. Only letters and numbers and spaces and hyphens and underscores are allowed',
+        validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]*$', 'Only letters and numbers and spaces and hyphens and underscores are allowed')]
+    )
+
+    def validate_folder_key(self, value):
+        if value.endswith('/'):
+            raise serializers.ValidationError("Folder key must not end with '/'")
+        return value
+
+
 class UpdateFolderNameSerializer(serializers.Serializer):
     folder_key = serializers.CharField(
         default='',
@@ -111,6 +198,106 @@ class DownloadFileSerializer(serializers.Serializer):
     )
 
 
+class ArchiveSerializer(serializers.Serializer):
+    MAX_FILE_KEYS = 1000
+
+    folder_key = serializers.CharField(
+        required=False,
+        help_text='Folder exported with its subfolders. Only letters and numbers and spaces and hyphens and underscores are allowed',
+        validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]+$', 'Only letters and numbers and spaces and hyphens and underscores are allowed')]
+    )
+    file_keys = serializers.ListField(
+        required=False,
+        allow_empty=False,
+        max_length=MAX_FILE_KEYS,
+        help_text='Files exported, instead of a folder',
+        child=serializers.CharField(
+            validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]+\.pdf$', 'Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf')]
+        )
+    )
+
+    def validate_folder_key(self, value):
+        if value.endswith('/'):
+            raise serializers.ValidationError("Folder key must not end with '/'")
+        return value
+
+    def validate(self, data):
+        if ('folder_key' in data) == ('file_keys' in data):
+            raise serializers.ValidationError("Send either folder_key or file_keys")
+        return data
+
+
+class StreamUploadSerializer(serializers.Serializer):
+    file_name = serializers.CharField(
+        default='',
+        help_text='Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf',
+        validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]+\.pdf$', 'Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf')]
+    )
+
+
+class PresignedUploadSerializer(serializers.Serializer):
+    file_name = serializers.CharField(
+        default='',
+        help_text='Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf',
+        validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]+\.pdf$', 'Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf')]
+    )
+    file_size = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        help_text='Size of the file in bytes. The presigned post only accepts a file up to this size'
+    )
+
+
+class UploadCompleteSerializer(serializers.Serializer):
+    file_key = serializers.CharField(
+        default='',
+        help_text='Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf',
+        validators=[RegexValidator(r'^[a-zA-Z0-9\s_\-/]+\.pdf$', 'Only letters, numbers, spaces, hyphens, underscores and forward slashes are allowed. File must end with .pdf')]
+    )
+
+
+def format_last_modified(last_modified):
+    """
+    Same output as strftime('%Y-%m-%d %H:%M:%S'), several times faster
+    """
+    return last_modified.isoformat(' ')[:19]
+
+
+class FileListSerializer(serializers.ListSerializer):
+    """
+    Serialize a listing without running the field machinery of
+    ResponseFileSerializer once per object. The output is identical. Objects
+    uploaded together share their LastModified, so each distinct date is
+    only formatted once.
+    """
+
+    def to_representation(self, data):
+        with serialize_timer():
+            return self._to_representation(data)
+
+    def _to_representation(self, data):
+        dates = {None: None}
+        files = []
+        append = files.append
+        for obj in data:
+            key = obj['Key']
+            last_modified = obj['LastModified']
+            date = dates.get(last_modified)
+            if date is None and last_modified is not None:
+                date = dates[last_modified] = format_last_modified(last_modified)
+            if key.endswith('/'):
+                file_name = key[key.rfind('/', 0, -1) + 1:-1]
+            else:
+                file_name = key[key.rfind('/') + 1:]
+            append({
+                'file_name': file_name,
+                'file_key': key,
+                'file_size': obj['Size'],
+                'file_last_modified': date,
+            })
+        return files
+
+
 class ResponseFileSerializer(serializers.Serializer):
     file_name = serializers.SerializerMethodField()
     file_key = serializers.CharField( source='Key')
@@ -124,5 +311,12 @@ class ResponseFileSerializer(serializers.Serializer):
             return obj['Key'].split('/')[-1]
         
     def get_file_last_modified(self, obj):
-        return obj['LastModified'].strftime('%Y-%m-%d %H:%M:%S')
+        # Subfolders listed through CommonPrefixes have no date
+        if obj['LastModified'] is None:
+            return None
+        return format_last_modified(obj['LastModified'])
+
+    class Meta:
+        # many=True is served by the fast path, single objects by the fields above
+        list_serializer_class = FileListSerializer
 
@@ -1,19 +1,762 @@
-import boto3
+import hashlib
+import tempfile
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
 from django.conf import settings
-import re
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import transaction
+from django.utils import timezone
+from django.db.models import CharField, Count, Exists, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Concat, Substr
 
+from aws_files_api import pdf_text
+from aws_files_api.cache import listing_cache
+from aws_files_api.models import DocumentPage, DocumentText, StorageUsage, StoredObject
 from aws_files_api.serializers import ResponseFileSerializer
+from config.aws import get_client
+from config.renderers import dumps
+from config.search import search_rank
 
 
-class AWSFileService:
+def get_parent_prefix(key):
+    """
+    Return the folder that contains a key: a/b/c.pdf -> a/b/, a/b/ -> a/
+    @param key: str
+    @return: str
+    """
+    index = key.rstrip('/').rfind('/')
+    return key[:index + 1] if index != -1 else ''
+
+
+def get_ancestor_prefixes(key):
+    """
+    Return every folder above a key: a/b/c.pdf -> [a/, a/b/]
+    @param key: str
+    @return: list
+    """
+    parts = key.rstrip('/').split('/')[:-1]
+    return ['/'.join(parts[:i + 1]) + '/' for i in range(len(parts))]
+
+def build_folder_tree(objects, folder_key=''):
+    """
+    Build the folder tree below folder_key from a flat listing. Folders that
+    only exist as a prefix of other keys are included, only .pdf files are
+    counted, like in the folder listings.
+    @param objects: iterable of (key, size)
+    @param folder_key: str
+    @return: dict - root node
+    """
+    def new_node(key):
+        return {'folder_key': key, 'file_count': 0, 'size': 0, 'children': {}}
+
+    root = new_node(folder_key)
+    nodes = {folder_key: root}
+
+    for key, size in objects:
+        prefix = key[:key.rfind('/') + 1]
+        node = nodes.get(prefix)
+        if node is None:
+            # Create the missing folders from the closest known ancestor down
+            missing = []
+            while prefix not in nodes:
+                missing.append(prefix)
+                prefix = get_parent_prefix(prefix)
+            for prefix in reversed(missing):
+                node = nodes[prefix] = new_node(prefix)
+                nodes[get_parent_prefix(prefix)]['children'][prefix] = node
+
+        if key.endswith('.pdf'):
+            node['file_count'] += 1
+            node['size'] += size
+
+    return root
+
+
+def render_folder_tree(node, max_depth=None, depth=0):
+    """
+    Add the totals of the subfolders to every node of build_folder_tree and
+    drop the children below max_depth (they still count in the totals)
+    @param node: dict
+    @param max_depth: int
+    @param depth: int - depth of node
+    @return: dict
+    """
+    children = [render_folder_tree(node['children'][key], max_depth, depth + 1) for key in sorted(node['children'])]
+    folder_key = node['folder_key']
+
+    return {
+        'name': folder_key.rstrip('/').rsplit('/', 1)[-1],
+        'folder_key': folder_key,
+        'file_count': node['file_count'],
+        'size': node['size'],
+        'total_file_count': node['file_count'] + sum(child['total_file_count'] for child in children),
+        'total_size': node['size'] + sum(child['total_size'] for child in children),
+        'subfolder_count': len(children),
+        'children': children if max_depth is None or depth < max_depth else [],
+    }
+
+# DeleteObjects accepts at most 1000 keys per request
+DELETE_BATCH_SIZE = 1000
+# Every user has one bucket named <username>-security-project
+BUCKET_SUFFIX = '-security-project'
+# User metadata set on the copies of a folder rename, see AWSFileService._rename_marker
+RENAMED_FROM_METADATA = 'renamed-from'
+
+
+class InvalidRangeError(Exception):
+    """
+    Raised when the requested byte range lies outside of the object
+    """
+    def __init__(self, object_size=None):
+        super().__init__("Error: requested range not satisfiable")
+        self.object_size = object_size
+
+
+class QuotaExceededError(Exception):
+    """
+    Raised when an uploaded file does not fit in the storage quota of the user
+    """
     def __init__(self):
-        self.s3_client = boto3.client(
-            's3',
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-            region_name=settings.AWS_S3_REGION_NAME,
-            
+        super().__init__("Error: storage quota exceeded")
+
+
+class StorageUsageService:
+    """
+    Counters of the bytes and files stored under every folder of a bucket.
+    A file counts in the row of the bucket (prefix '') and in the row of
+    each folder containing it, so the usage of any folder is one read.
+    """
+    def __init__(self):
+        self.model = StorageUsage
+
+    @staticmethod
+    def usage_prefixes(key):
+        return [''] + get_ancestor_prefixes(key)
+
+    @classmethod
+    def accumulate(cls, deltas, key, size, sign=1):
+        """
+        Add a file to the per-prefix deltas
+        @param deltas: defaultdict(lambda: [0, 0]) - prefix -> [size, file_count]
+        """
+        for prefix in cls.usage_prefixes(key):
+            delta = deltas[prefix]
+            delta[0] += sign * size
+            delta[1] += sign
+
+    @staticmethod
+    def new_deltas():
+        return defaultdict(lambda: [0, 0])
+
+    def lock(self, bucket_name):
+        """
+        Lock the row of the bucket until the end of the transaction, creating
+        it when it is missing. Every change of the index of a bucket takes it
+        first: the changes of a bucket are serialized, so a new key uploaded
+        twice at the same time is counted once, and the rows are always
+        locked in the same order.
+        @param bucket_name: str
+        """
+        self.model.objects.bulk_create([self.model(bucket_name=bucket_name, prefix='')], ignore_conflicts=True)
+        self.model.objects.select_for_update().filter(bucket_name=bucket_name, prefix='').values_list('pk', flat=True).first()
+
+    def apply(self, bucket_name, deltas):
+        """
+        Add the deltas to the counters, creating the missing rows. Prefixes
+        sharing the same delta (e.g. every folder above one file) are
+        updated by a single UPDATE.
+        @param bucket_name: str
+        @param deltas: dict - prefix -> (size, file_count)
+        """
+        groups = defaultdict(list)
+        for prefix, (size, file_count) in deltas.items():
+            if size or file_count:
+                groups[(size, file_count)].append(prefix)
+        if not groups:
+            return
+
+        with transaction.atomic():
+            self.model.objects.bulk_create(
+                [self.model(bucket_name=bucket_name, prefix=prefix) for prefixes in groups.values() for prefix in prefixes],
+                ignore_conflicts=True,
+            )
+            now = timezone.now()
+            for (size, file_count), prefixes in sorted(groups.items()):
+                self.model.objects.filter(bucket_name=bucket_name, prefix__in=sorted(prefixes)).update(
+                    size=F('size') + size,
+                    file_count=F('file_count') + file_count,
+                    updated_at=now,
+                )
+
+    def add_files(self, bucket_name, files, sign=1):
+        """
+        Count (sign=1) or discount (sign=-1) files
+        @param bucket_name: str
+        @param files: iterable of (key, size)
+        @param sign: int
+        """
+        deltas = self.new_deltas()
+        for key, size in files:
+            self.accumulate(deltas, key, size, sign)
+        self.apply(bucket_name, deltas)
+
+    def replace(self, bucket_name, prefix, totals, batch_size=1000):
+        """
+        Replace the counters of prefix and of every folder below it
+        @param bucket_name: str
+        @param prefix: str
+        @param totals: dict - prefix -> [size, file_count], as built by accumulate
+        @return: tuple - (size, file_count) of prefix
+        """
+        with transaction.atomic():
+            self.model.objects.filter(bucket_name=bucket_name, prefix__startswith=prefix).delete()
+            self.model.objects.bulk_create(
+                [
+                    self.model(bucket_name=bucket_name, prefix=key, size=size, file_count=file_count)
+                    for key, (size, file_count) in totals.items()
+                    if key.startswith(prefix)
+                ],
+                batch_size=batch_size,
+            )
+        size, file_count = totals.get(prefix, (0, 0))
+        return size, file_count
+
+    def remove_prefix(self, bucket_name, prefix):
+        return self.model.objects.filter(bucket_name=bucket_name, prefix__startswith=prefix).delete()
+
+    def get(self, bucket_name, prefix=''):
+        """
+        Return the usage of a prefix, zero when nothing was ever stored in it
+        @param bucket_name: str
+        @param prefix: str
+        @return: dict
+        """
+        row = (
+            self.model.objects
+            .filter(bucket_name=bucket_name, prefix=prefix)
+            .values('size', 'file_count', 'updated_at')
+            .first()
+        )
+        return row or {'size': 0, 'file_count': 0, 'updated_at': None}
+
+
+class DocumentTextService:
+    """
+    Text of the pages of the PDFs and its full-text search. Every page has
+    a tsvector in a GIN index, so it needs PostgreSQL.
+    """
+    def __init__(self):
+        self.model = DocumentText
+        self.page_model = DocumentPage
+
+    def get(self, bucket_name, key):
+        return self.model.objects.filter(bucket_name=bucket_name, key=key).first()
+
+    def save(self, bucket_name, key, etag, pages, batch_size=500, progress_callback=None):
+        """
+        Replace the text of a file. Blank pages (e.g. scans) are not stored.
+        @param bucket_name: str
+        @param key: str
+        @param etag: str - ETag of the version the text was read from
+        @param pages: list of str
+        @param progress_callback: callable(done, total)
+        @return: DocumentText
+        """
+        with transaction.atomic():
+            document = self.model.objects.update_or_create(
+                bucket_name=bucket_name,
+                key=key,
+                defaults={'etag': etag, 'status': DocumentText.STATUS_INDEXED, 'page_count': len(pages), 'error': ''},
+            )[0]
+            document.pages.all().delete()
+
+            for start in range(0, len(pages), batch_size):
+                self.page_model.objects.bulk_create([
+                    self.page_model(document=document, bucket_name=bucket_name, page_number=number, text=text)
+                    for number, text in enumerate(pages[start:start + batch_size], start + 1)
+                    if text.strip()
+                ])
+                if progress_callback:
+                    progress_callback(min(start + batch_size, len(pages)), len(pages))
+
+            document.pages.update(search_vector=SearchVector('text', config=settings.DOCUMENT_SEARCH_CONFIG))
+        return document
+
+    def save_failed(self, bucket_name, key, etag, error):
+        """
+        Record that a version of a file has no readable text, so it is not
+        extracted again until it changes
+        """
+        with transaction.atomic():
+            document = self.model.objects.update_or_create(
+                bucket_name=bucket_name,
+                key=key,
+                defaults={'etag': etag, 'status': DocumentText.STATUS_FAILED, 'page_count': 0, 'error': error},
+            )[0]
+            document.pages.all().delete()
+        return document
+
+    def rename(self, bucket_name, key, new_key, etag=None, new_etag=None):
+        """
+        Move the text of key to new_key. A copy has the same content, so
+        text read from the copied version (etag) takes the new ETag.
+        """
+        self.model.objects.filter(bucket_name=bucket_name, key=new_key).delete()
+        documents = self.model.objects.filter(bucket_name=bucket_name, key=key)
+        if etag and new_etag:
+            documents.filter(etag=etag).update(etag=new_etag)
+        documents.update(key=new_key)
+
+    def rename_prefix(self, bucket_name, prefix, new_prefix):
+        start = len(prefix) + 1
+        new_key = Concat(Value(new_prefix), Substr('key', start), output_field=CharField())
+        new_keys = self.model.objects.filter(bucket_name=bucket_name, key__startswith=prefix).annotate(new_key=new_key).values('new_key')
+        self.model.objects.filter(bucket_name=bucket_name, key__in=Subquery(new_keys)).delete()
+        self.model.objects.filter(bucket_name=bucket_name, key__startswith=prefix).update(key=new_key)
+
+    def remove_many(self, bucket_name, keys):
+        return self.model.objects.filter(bucket_name=bucket_name, key__in=keys).delete()
+
+    def remove_prefix(self, bucket_name, prefix):
+        return self.model.objects.filter(bucket_name=bucket_name, key__startswith=prefix).delete()
+
+    def prune(self, bucket_name):
+        """
+        Remove the text of the files that are no longer in the index
+        """
+        indexed = StoredObject.objects.filter(bucket_name=bucket_name, key=OuterRef('key'))
+        return self.model.objects.filter(bucket_name=bucket_name).exclude(Exists(indexed)).delete()
+
+    def pending(self, bucket_name, force=False):
+        """
+        Yield the keys of the PDFs of a bucket whose current version has no
+        extracted text, all of them with force
+        @param bucket_name: str
+        @param force: bool
+        @return: iterator of str
+        """
+        files = StoredObject.objects.filter(bucket_name=bucket_name, is_folder=False, key__endswith='.pdf')
+        if not force:
+            extracted = self.model.objects.filter(bucket_name=bucket_name, key=OuterRef('key'), etag=OuterRef('etag'))
+            files = files.exclude(Exists(extracted))
+        return files.order_by('key').values_list('key', flat=True).iterator(chunk_size=5000)
+
+    def search(self, bucket_name, query, limit):
+        """
+        Return the pages of a bucket matching a query, best matches first,
+        with an excerpt of their text around the matched words
+        @param bucket_name: str
+        @param query: str - web search syntax: words, "phrases", or, -word
+        @param limit: int
+        @return: list of dicts with key, page_number, score and snippet
+        """
+        pages = self.page_model.objects.filter(bucket_name=bucket_name)
+        config = settings.DOCUMENT_SEARCH_CONFIG
+        search_query = SearchQuery(query, search_type='websearch', config=config)
+        rows = list(
+            pages
+            .filter(search_vector=search_query)
+            .annotate(score=SearchRank(F('search_vector'), search_query))
+            .order_by('-score', 'document__key', 'page_number')
+            .values('id', 'document__key', 'page_number', 'score')[:limit]
+        )
+        # Headlines parse the whole page again, only the returned ones get one
+        snippets = dict(
+            self.page_model.objects
+            .filter(id__in=[row['id'] for row in rows])
+            .annotate(snippet=SearchHeadline('text', search_query, config=config, max_fragments=2))
+            .values_list('id', 'snippet')
+        )
+        return [
+            {'key': row['document__key'], 'page_number': row['page_number'], 'score': row['score'], 'snippet': snippets.get(row['id'], '')}
+            for row in rows
+        ]
+
+
+class FileIndexService:
+    """
+    Keep the StoredObject table in sync with the buckets and answer the
+    listings from it. Every change is also applied to the storage usage
+    counters and to the extracted text of the files.
+    """
+    def __init__(self):
+        self.model = StoredObject
+        self.usage = StorageUsageService()
+        self.documents = DocumentTextService()
+
+    def _ensure_folders(self, bucket_name, key):
+        folders = [
+            self.model(bucket_name=bucket_name, key=prefix, parent_prefix=get_parent_prefix(prefix), is_folder=True)
+            for prefix in get_ancestor_prefixes(key)
+        ]
+        if folders:
+            self.model.objects.bulk_create(folders, ignore_conflicts=True)
+
+    def _file_size(self, bucket_name, key):
+        # Read under the lock of the bucket usage row, see StorageUsageService.lock
+        return (
+            self.model.objects
+            .filter(bucket_name=bucket_name, key=key, is_folder=False)
+            .values_list('size', flat=True)
+            .first()
+        )
+
+    def upsert(self, bucket_name, key, size=0, last_modified=None, etag='', quota=None):
+        """
+        Index an object and count it in the usage. With a quota, a file that
+        would take the bucket over it is rejected under the lock of the
+        bucket, so concurrent uploads cannot pass the check together.
+        @param quota: int - bytes the bucket may store, None without quota
+        @raise QuotaExceededError: nothing is changed
+        """
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            self._ensure_folders(bucket_name, key)
+            if not key.endswith('/'):
+                previous_size = self._file_size(bucket_name, key)
+                added = size - (previous_size or 0)
+                if quota is not None and added > 0 and self.usage.get(bucket_name)['size'] + added > quota:
+                    raise QuotaExceededError()
+                self.usage.apply(bucket_name, {
+                    prefix: (size - (previous_size or 0), int(previous_size is None))
+                    for prefix in self.usage.usage_prefixes(key)
+                })
+            return self.model.objects.update_or_create(
+                bucket_name=bucket_name,
+                key=key,
+                defaults={
+                    'parent_prefix': get_parent_prefix(key),
+                    'size': size,
+                    'last_modified': last_modified,
+                    'etag': etag,
+                    'is_folder': key.endswith('/'),
+                },
+            )[0]
+
+    def rename(self, bucket_name, key, new_key, last_modified=None, etag=None):
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            self._ensure_folders(bucket_name, new_key)
+            size = self._file_size(bucket_name, key)
+            replaced_size = self._file_size(bucket_name, new_key)
+            previous_etag = self.model.objects.filter(bucket_name=bucket_name, key=key).values_list('etag', flat=True).first()
+            self.model.objects.filter(bucket_name=bucket_name, key=new_key).delete()
+            self.documents.rename(bucket_name, key, new_key, previous_etag, etag)
+
+            fields = {'key': new_key, 'parent_prefix': get_parent_prefix(new_key)}
+            if last_modified is not None:
+                fields['last_modified'] = last_modified
+            if etag is not None:
+                fields['etag'] = etag
+            updated = self.model.objects.filter(bucket_name=bucket_name, key=key).update(**fields)
+
+            deltas = self.usage.new_deltas()
+            if replaced_size is not None:
+                self.usage.accumulate(deltas, new_key, replaced_size, -1)
+            if size is not None:
+                self.usage.accumulate(deltas, key, size, -1)
+                self.usage.accumulate(deltas, new_key, size)
+            self.usage.apply(bucket_name, deltas)
+            return updated
+
+    def remove(self, bucket_name, key):
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            size = self._file_size(bucket_name, key)
+            if size is not None:
+                self.usage.add_files(bucket_name, [(key, size)], -1)
+            self.documents.remove_many(bucket_name, [key])
+            return self.model.objects.filter(bucket_name=bucket_name, key=key).delete()
+
+    def rename_prefix(self, bucket_name, prefix, new_prefix):
+        """
+        Move every row under prefix to new_prefix with two set-based UPDATEs
+        """
+        start = len(prefix) + 1
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            self._ensure_folders(bucket_name, new_prefix)
+
+            new_keys = (
+                self.model.objects
+                .filter(bucket_name=bucket_name, key__startswith=prefix)
+                .annotate(new_key=Concat(Value(new_prefix), Substr('key', start), output_field=CharField()))
+                .values('new_key')
+            )
+            self.model.objects.filter(bucket_name=bucket_name, key__in=Subquery(new_keys)).delete()
+
+            self.model.objects.filter(bucket_name=bucket_name, parent_prefix__startswith=prefix).update(
+                parent_prefix=Concat(Value(new_prefix), Substr('parent_prefix', start), output_field=CharField())
+            )
+            self.model.objects.filter(bucket_name=bucket_name, key__startswith=prefix).update(
+                key=Concat(Value(new_prefix), Substr('key', start), output_field=CharField())
+            )
+            self.model.objects.filter(bucket_name=bucket_name, key=new_prefix).update(
+                parent_prefix=get_parent_prefix(new_prefix)
+            )
+            self._move_usage(bucket_name, prefix, new_prefix)
+            self.documents.rename_prefix(bucket_name, prefix, new_prefix)
+
+    def _rebuild_usage(self, bucket_name, prefix):
+        """
+        Recount the usage of prefix and of its folders from the index
+        @return: tuple - change of (size, file_count) of prefix
+        """
+        previous = self.usage.get(bucket_name, prefix)
+        totals = self.usage.new_deltas()
+        files = (
+            self.model.objects
+            .filter(bucket_name=bucket_name, key__startswith=prefix, is_folder=False)
+            .values_list('key', 'size')
+            .iterator(chunk_size=5000)
+        )
+        for key, size in files:
+            self.usage.accumulate(totals, key, size)
+        size, file_count = self.usage.replace(bucket_name, prefix, totals)
+        return size - previous['size'], file_count - previous['file_count']
+
+    def _move_usage(self, bucket_name, prefix, new_prefix):
+        """
+        Update the usage counters after rename_prefix. The destination may
+        have been merged with existing files, so its counters are rebuilt
+        from the index and the folders above both sides get the difference.
+        """
+        deltas = self.usage.new_deltas()
+        if new_prefix.startswith(prefix) or prefix.startswith(new_prefix):
+            # One folder contains the other, recount the outer one
+            outer = min(prefix, new_prefix, key=len)
+            changed = self._rebuild_usage(bucket_name, outer)
+            for ancestor in self.usage.usage_prefixes(outer):
+                deltas[ancestor] = list(changed)
+        else:
+            moved = self.usage.get(bucket_name, prefix)
+            self.usage.remove_prefix(bucket_name, prefix)
+            added_size, added_files = self._rebuild_usage(bucket_name, new_prefix)
+            for ancestor in self.usage.usage_prefixes(prefix):
+                deltas[ancestor][0] -= moved['size']
+                deltas[ancestor][1] -= moved['file_count']
+            for ancestor in self.usage.usage_prefixes(new_prefix):
+                deltas[ancestor][0] += added_size
+                deltas[ancestor][1] += added_files
+        self.usage.apply(bucket_name, deltas)
+
+    def remove_prefix(self, bucket_name, prefix):
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            removed = self.usage.get(bucket_name, prefix)
+            self.usage.remove_prefix(bucket_name, prefix)
+            self.usage.apply(bucket_name, {
+                ancestor: (-removed['size'], -removed['file_count'])
+                for ancestor in self.usage.usage_prefixes(prefix)
+            })
+            self.documents.remove_prefix(bucket_name, prefix)
+            return self.model.objects.filter(bucket_name=bucket_name, key__startswith=prefix).delete()
+
+    def remove_many(self, bucket_name, keys, batch_size=1000):
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            for start in range(0, len(keys), batch_size):
+                rows = self.model.objects.filter(bucket_name=bucket_name, key__in=keys[start:start + batch_size])
+                self.usage.add_files(bucket_name, rows.filter(is_folder=False).values_list('key', 'size'), -1)
+                self.documents.remove_many(bucket_name, keys[start:start + batch_size])
+                rows.delete()
+
+    def rebuild_usage(self, bucket_name):
+        """
+        Recount the usage counters of a bucket from the index
+        """
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            self._rebuild_usage(bucket_name, '')
+
+    def replace_bucket(self, bucket_name, objects, batch_size=1000):
+        """
+        Rebuild the rows of a bucket from an iterable of S3 objects
+        @param bucket_name: str
+        @param objects: iterable of dicts with Key, Size, LastModified and ETag
+        @return: int - number of objects indexed
+        """
+        count = 0
+        with transaction.atomic():
+            self.usage.lock(bucket_name)
+            self.model.objects.filter(bucket_name=bucket_name).delete()
+
+            folders = set()
+            totals = self.usage.new_deltas()
+            batch = []
+            for obj in objects:
+                key = obj['Key']
+                folders.update(get_ancestor_prefixes(key))
+                if key.endswith('/'):
+                    folders.add(key)
+                    continue
+
+                self.usage.accumulate(totals, key, obj['Size'])
+                batch.append(self.model(
+                    bucket_name=bucket_name,
+                    key=key,
+                    parent_prefix=get_parent_prefix(key),
+                    size=obj['Size'],
+                    last_modified=obj['LastModified'],
+                    etag=obj.get('ETag', ''),
+                ))
+                count += 1
+                if len(batch) >= batch_size:
+                    self.model.objects.bulk_create(batch)
+                    batch = []
+
+            batch.extend(
+                self.model(bucket_name=bucket_name, key=folder, parent_prefix=get_parent_prefix(folder), is_folder=True)
+                for folder in folders
+            )
+            self.model.objects.bulk_create(batch, batch_size=batch_size)
+            self.usage.replace(bucket_name, '', totals, batch_size)
+            # The text of the files still in the bucket is kept, its ETag tells if it is stale
+            self.documents.prune(bucket_name)
+        return count
+
+    @staticmethod
+    def _as_s3_object(row):
+        return {'Key': row['key'], 'Size': row['size'], 'LastModified': row['last_modified']}
+
+    def _folder_queryset(self, bucket_name, folder_key):
+        return (
+            self.model.objects
+            .filter(bucket_name=bucket_name, parent_prefix=folder_key)
+            .filter(Q(is_folder=True) | Q(key__endswith='.pdf'))
+            .order_by('key')
+            .values('key', 'size', 'last_modified')
+        )
+
+    def list_folder(self, bucket_name, folder_key):
+        return [self._as_s3_object(row) for row in self._folder_queryset(bucket_name, folder_key)]
+
+    def list_folder_page(self, bucket_name, folder_key, page_size, cursor=None):
+        queryset = self._folder_queryset(bucket_name, folder_key)
+        if cursor:
+            queryset = queryset.filter(key__gt=cursor)
+
+        rows = list(queryset[:page_size + 1])
+        next_cursor = rows[page_size - 1]['key'] if len(rows) > page_size else None
+        return [self._as_s3_object(row) for row in rows[:page_size]], next_cursor
+
+    def list_files(self, bucket_name):
+        queryset = (
+            self.model.objects
+            .filter(bucket_name=bucket_name, is_folder=False)
+            .order_by('key')
+            .values('key', 'size', 'last_modified')
+        )
+        return [self._as_s3_object(row) for row in queryset]
+
+    def get(self, bucket_name, key):
+        return self.model.objects.filter(bucket_name=bucket_name, key=key).first()
+
+    def get_many(self, bucket_name, keys):
+        """
+        Return the indexed files among keys
+        @return: dict - key -> S3 object
+        """
+        rows = self.model.objects.filter(bucket_name=bucket_name, key__in=keys).values('key', 'size', 'last_modified')
+        return {row['key']: self._as_s3_object(row) for row in rows}
+
+    def iter_objects(self, bucket_name, prefix):
+        """
+        Yield (key, size) of every object below a prefix, folders included
+        """
+        return (
+            self.model.objects
+            .filter(bucket_name=bucket_name, key__startswith=prefix)
+            .values_list('key', 'size')
+            .iterator(chunk_size=5000)
+        )
+
+    def search(self, bucket_name, query, limit):
+        """
+        Return the best matches of a substring of the keys of a bucket
+        @param bucket_name: str
+        @param query: str
+        @param limit: int
+        @return: list of dicts with Key, Size, LastModified and score
+        """
+        rows = (
+            self.model.objects
+            .filter(bucket_name=bucket_name, is_folder=False, key__endswith='.pdf', key__icontains=query)
+            .annotate(score=search_rank(query, 'key'))
+            .order_by('-score', 'key')
+            .values('key', 'size', 'last_modified', 'score')[:limit]
         )
+        return [dict(self._as_s3_object(row), score=row['score']) for row in rows]
+
+    def get_folder_totals(self, bucket_name, folder_key=''):
+        """
+        Return the number of files and bytes stored under a folder
+        @param bucket_name: str
+        @param folder_key: str
+        @return: dict
+        """
+        return self.model.objects.filter(
+            bucket_name=bucket_name, key__startswith=folder_key, is_folder=False
+        ).aggregate(files=Count('id'), size=Sum('size', default=0))
+
+
+class AWSFileService:
+    def __init__(self, s3_client=None):
+        self._s3_client = s3_client
+        self.index = FileIndexService()
+        self.transfer_config = TransferConfig(
+            multipart_threshold=settings.AWS_S3_MULTIPART_THRESHOLD,
+            multipart_chunksize=settings.AWS_S3_MULTIPART_CHUNKSIZE,
+            max_concurrency=settings.AWS_S3_MAX_CONCURRENCY,
+        )
+
+    @property
+    def s3_client(self):
+        if self._s3_client is not None:
+            return self._s3_client
+        return get_client('s3')
+
+    def _index_object(self, bucket_name, key, metadata=None, quota=None):
+        """
+        Write the metadata of an object to the index, reading it with a HEAD
+        when it is not given. An object that does not fit in the quota is
+        removed from the bucket.
+        """
+        if metadata is None:
+            metadata = self.head_file(bucket_name, key)
+        try:
+            self.index.upsert(bucket_name, key, metadata['content_length'], metadata['last_modified'], metadata['etag'], quota)
+        except QuotaExceededError:
+            # It may have replaced a file, which is gone from S3 too
+            self.delete_file(bucket_name, key)
+            raise
+        return metadata
+
+    @staticmethod
+    def _invalidate_listings(bucket_name, keys):
+        """
+        Drop the cached listings that may show the given keys: the folders
+        containing them (which may gain or lose an implicit subfolder) and,
+        for folder keys, their own listing
+        """
+        prefixes = {''}
+        for key in keys:
+            prefixes.update(get_ancestor_prefixes(key))
+            if key.endswith('/'):
+                prefixes.add(key)
+        listing_cache.invalidate(bucket_name, prefixes)
+
+    def invalidate_folder_listings(self, bucket_name, folder_keys):
+        """
+        This function drop the cached listings of folders about to change,
+        e.g. when their rename or delete is queued as a job
+        @param bucket_name: str
+        @param folder_keys: list of str - ending with /
+        """
+        self._invalidate_listings(bucket_name, folder_keys)
         
  
  
@@ -32,35 +775,210 @@ class AWSFileService:
         
  
     # File functions
-    def upload_file(self,bucket_name,file_name,data):
+    def upload_file(self,bucket_name,file_name,data, quota=None):
         """
-        This function upload a file to the bucket
+        This function upload a file to the bucket. Files above the multipart
+        threshold are uploaded in parallel parts; data may also be a
+        non-seekable stream, which is then read one part at a time.
         @param bucket_name: str
         @param file_name: str
-        @param data: str
+        @param data: file-like object
+        @param quota: int - bytes the user may store, None without quota
+        @return: dict - etag, last modified date and content length
         """
         try:
             
-            return self.s3_client.upload_fileobj(data,bucket_name,file_name)
+            self.s3_client.upload_fileobj(
+                data,
+                bucket_name,
+                file_name,
+                ExtraArgs={'ContentType': 'application/pdf'},
+                Config=self.transfer_config,
+            )
+            metadata = self._index_object(bucket_name, file_name, quota=quota)
+            self._invalidate_listings(bucket_name, [file_name])
+            return metadata
+        except QuotaExceededError:
+            raise
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
         
 
-    def get_file(self, bucket_name, file_name):
+    def head_file(self, bucket_name, file_name):
         """
-        This function get a file from the bucket
+        This function get the metadata of a file without downloading it
         @param bucket_name: str
         @param file_name: str
-        @return: bytes - contenido del archivo
+        @return: dict - etag, last modified date and content length
         """
         try:
-            response = self.s3_client.get_object(Bucket=bucket_name, Key=file_name)
-            return response['Body'].read()
-   
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=file_name)
+
+            return {
+                'etag': response['ETag'],
+                'last_modified': response['LastModified'],
+                'content_length': response['ContentLength'],
+            }
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
-        
-        
+
+
+    def stream_file(self, bucket_name, file_name, chunk_size=None, byte_range=None):
+        """
+        This function open a file from the bucket without reading it into memory
+        @param bucket_name: str
+        @param file_name: str
+        @param chunk_size: int - size of every chunk yielded by the iterator
+        @param byte_range: str - HTTP range, e.g. bytes=0-1023
+        @return: dict - chunks iterator and the object metadata
+        """
+        params = {'Bucket': bucket_name, 'Key': file_name}
+        if byte_range:
+            params['Range'] = byte_range
+
+        try:
+            response = self.s3_client.get_object(**params)
+
+            return {
+                'chunks': self._iter_body(response['Body'], chunk_size or settings.AWS_S3_DOWNLOAD_CHUNK_SIZE),
+                'content_length': response['ContentLength'],
+                'content_type': response.get('ContentType'),
+                'content_range': response.get('ContentRange'),
+                'etag': response.get('ETag'),
+                'last_modified': response.get('LastModified'),
+            }
+        except ClientError as e:
+            if e.response['Error'].get('Code') == 'InvalidRange':
+                raise InvalidRangeError(e.response['Error'].get('ActualObjectSize'))
+            raise Exception(f"Error: {str(e)}")
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    @staticmethod
+    def _iter_body(body, chunk_size):
+        """
+        Yield the S3 body chunk by chunk and release the connection when the
+        response is consumed or closed by the client
+        """
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+
+
+    def generate_download_url(self, bucket_name, file_name):
+        """
+        This function generate a presigned url to download a file directly from the bucket
+        @param bucket_name: str
+        @param file_name: str
+        @return: str
+        """
+        try:
+            return self.s3_client.generate_presigned_url(
+                'get_object',
+                Params={
+                    'Bucket': bucket_name,
+                    'Key': file_name,
+                    'ResponseContentType': 'application/pdf',
+                    'ResponseContentDisposition': f'attachment; filename="{file_name.split("/")[-1]}"',
+                },
+                ExpiresIn=settings.AWS_S3_PRESIGNED_URL_EXPIRES,
+            )
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def generate_upload_post(self, bucket_name, file_name, max_size=None):
+        """
+        This function generate a presigned post to upload a pdf directly to the bucket.
+        S3 rejects the upload if it is not a pdf or exceeds the maximum size.
+        @param bucket_name: str
+        @param file_name: str
+        @param max_size: int - largest upload accepted, AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE by default
+        @return: dict - url and form fields
+        """
+        try:
+            return self.s3_client.generate_presigned_post(
+                Bucket=bucket_name,
+                Key=file_name,
+                Fields={'Content-Type': 'application/pdf'},
+                Conditions=[
+                    {'Content-Type': 'application/pdf'},
+                    ['content-length-range', 1, max_size or settings.AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE],
+                ],
+                ExpiresIn=settings.AWS_S3_PRESIGNED_URL_EXPIRES,
+            )
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def register_uploaded_file(self, bucket_name, file_name, quota=None):
+        """
+        This function check a file uploaded with a presigned post. Objects that
+        are not a pdf, exceed the maximum size or do not fit in the quota are
+        removed from the bucket.
+        @param bucket_name: str
+        @param file_name: str
+        @param quota: int - bytes the user may store, None without quota
+        @return: dict - etag, last modified date and content length
+        """
+        try:
+            response = self.s3_client.head_object(Bucket=bucket_name, Key=file_name)
+
+            if response.get('ContentType') != 'application/pdf' or response['ContentLength'] > settings.AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE:
+                self.s3_client.delete_object(Bucket=bucket_name, Key=file_name)
+                raise Exception("The uploaded file is not a valid pdf")
+
+            metadata = {
+                'etag': response['ETag'],
+                'last_modified': response['LastModified'],
+                'content_length': response['ContentLength'],
+            }
+            self._index_object(bucket_name, file_name, metadata, quota)
+            self._invalidate_listings(bucket_name, [file_name])
+            return metadata
+        except QuotaExceededError:
+            raise
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def _list_folder_pages(self, bucket_name, folder_key, page_size=1000, cursor=None):
+        """
+        Yield the pages of the first level of a folder. Subfolders come back
+        as CommonPrefixes, so nested keys are never transferred.
+        @param bucket_name: str
+        @param folder_key: str
+        @param page_size: int
+        @param cursor: str - continuation token of a previous page
+        @return: generator of (items, next_cursor)
+        """
+        params = {'Bucket': bucket_name, 'Prefix': folder_key, 'Delimiter': '/', 'MaxKeys': page_size}
+        if cursor:
+            params['ContinuationToken'] = cursor
+
+        while True:
+            response = self.s3_client.list_objects_v2(**params)
+
+            items = [
+                obj for obj in response.get('Contents', [])
+                if obj['Key'] != folder_key and obj['Key'].endswith('.pdf')
+            ]
+            items.extend(
+                {'Key': prefix['Prefix'], 'Size': 0, 'LastModified': None}
+                for prefix in response.get('CommonPrefixes', [])
+            )
+            items.sort(key=lambda obj: obj['Key'])
+
+            next_cursor = response.get('NextContinuationToken') if response.get('IsTruncated') else None
+            yield items, next_cursor
+
+            if not next_cursor:
+                return
+            params['ContinuationToken'] = next_cursor
+
+
     def get_files_by_folder_key(self,bucket_name,folder_key):
         """
         This function get the files and folders directly inside the specified folder_key
@@ -68,42 +986,48 @@ class AWSFileService:
         @param folder_key: str
         @return: list of files and folders in the first level only
         """
-        try:
-            response = self.s3_client.list_objects(Bucket=bucket_name, Prefix=folder_key)
-            
-            prefix_length = len(folder_key)
-            
-            filtered_items = []
-            seen_items = set()  
-            
-            files = response.get('Contents', [])
-            
-           
-            for obj in files:
-               
-                key = obj['Key']
-                
-                print(key)
-                
-                if key == f"{folder_key}":
-                    continue
-                
-                remaining_path = key[prefix_length:].lstrip('/')
-                
-                if re.search(r'/.', remaining_path):
-                    continue
-                
-                if not key.endswith('/'):
-                    if not key.endswith('.pdf'):
-                        continue
-                
-                if remaining_path not in seen_items:
-                    seen_items.add(remaining_path)
-                    filtered_items.append(obj)
-            
-            serializer = ResponseFileSerializer(filtered_items, many=True)
-            
+        def load():
+            if settings.FILE_INDEX_READS_ENABLED:
+                items = self.index.list_folder(bucket_name, folder_key)
+            else:
+                items = []
+                for page, _ in self._list_folder_pages(bucket_name, folder_key):
+                    items.extend(page)
+
+            serializer = ResponseFileSerializer(items, many=True)
+
             return serializer.data
+
+        try:
+            return listing_cache.get_or_set(bucket_name, folder_key, 'all', load)
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def get_files_page_by_folder_key(self, bucket_name, folder_key, page_size, cursor=None):
+        """
+        This function get one page of the files and folders directly inside the specified folder_key
+        @param bucket_name: str
+        @param folder_key: str
+        @param page_size: int
+        @param cursor: str - next_cursor of the previous page
+        @return: dict - files and the cursor of the next page
+        """
+        def load():
+            if settings.FILE_INDEX_READS_ENABLED:
+                items, next_cursor = self.index.list_folder_page(bucket_name, folder_key, page_size, cursor)
+            else:
+                items, next_cursor = next(self._list_folder_pages(bucket_name, folder_key, page_size, cursor))
+
+            serializer = ResponseFileSerializer(items, many=True)
+
+            return {
+                'files': serializer.data,
+                'next_cursor': next_cursor,
+            }
+
+        try:
+            return listing_cache.get_or_set(bucket_name, folder_key, f'page:{page_size}:{cursor or ""}', load)
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
         
@@ -120,6 +1044,11 @@ class AWSFileService:
             
             if response['ResponseMetadata']['HTTPStatusCode'] == 200:
                 self.s3_client.delete_object(Bucket=bucket_name, Key=file_key)
+
+                copy_result = response.get('CopyObjectResult', {})
+                if self.index.rename(bucket_name, file_key, new_file_key, copy_result.get('LastModified'), copy_result.get('ETag')) == 0:
+                    self._index_object(bucket_name, new_file_key)
+                self._invalidate_listings(bucket_name, [file_key, new_file_key])
                 return response
             else:
                 raise Exception(f"Error: {response['ResponseMetadata']['HTTPStatusCode']}")
@@ -134,7 +1063,10 @@ class AWSFileService:
         @param file_key: str
         """
         try:
-            return self.s3_client.delete_object(Bucket=bucket_name, Key=file_key)
+            response = self.s3_client.delete_object(Bucket=bucket_name, Key=file_key)
+            self.index.remove(bucket_name, file_key)
+            self._invalidate_listings(bucket_name, [file_key])
+            return response
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
             
@@ -147,6 +1079,10 @@ class AWSFileService:
         @return: list
         """
         try:  
+            if settings.FILE_INDEX_READS_ENABLED:
+                serializer = ResponseFileSerializer(self.index.list_files(f"{bucket_name}-security-project"), many=True)
+                return serializer.data
+
             response = self.s3_client.list_objects(
                 Bucket=f"{bucket_name}-security-project"  
             )
@@ -159,6 +1095,80 @@ class AWSFileService:
         
         
 
+    def reindex_bucket(self, bucket_name):
+        """
+        This function rebuild the index of a bucket from a full listing
+        @param bucket_name: str
+        @return: int - number of files indexed
+        """
+        try:
+            paginator = self.s3_client.get_paginator('list_objects_v2')
+            objects = (
+                obj
+                for page in paginator.paginate(Bucket=bucket_name)
+                for obj in page.get('Contents', [])
+            )
+            return self.index.replace_bucket(bucket_name, objects)
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def get_user_buckets(self, usernames=None):
+        """
+        This function get the buckets of some users, or of every user when
+        no usernames are given
+        @param usernames: list of str
+        @return: list of str
+        """
+        if usernames:
+            return [f'{username}{BUCKET_SUFFIX}' for username in usernames]
+        try:
+            return [
+                bucket['Name'] for bucket in self.s3_client.list_buckets().get('Buckets', [])
+                if bucket['Name'].endswith(BUCKET_SUFFIX)
+            ]
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+
+    def get_storage_usage(self, bucket_name, folder_key=''):
+        """
+        This function get the bytes and files stored in a bucket or a folder,
+        read from the usage counters
+        @param bucket_name: str
+        @param folder_key: str - '' for the whole bucket
+        @return: dict
+        """
+        try:
+            return self.index.usage.get(bucket_name, folder_key)
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def reconcile_storage_usage(self, bucket_name):
+        """
+        This function recount the usage counters of a bucket from the index
+        and report the drift that was corrected. reindex_bucket also rebuilds
+        them, together with the index, from S3.
+        @param bucket_name: str
+        @return: dict - usage before and after
+        """
+        before = self.get_storage_usage(bucket_name)
+        try:
+            self.index.rebuild_usage(bucket_name)
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+        after = self.get_storage_usage(bucket_name)
+        return {
+            'size_before': before['size'],
+            'size_after': after['size'],
+            'file_count_before': before['file_count'],
+            'file_count_after': after['file_count'],
+        }
+
+
+
 # Folder functions
 
     def create_folder(self, bucket_name,folder_key):
@@ -170,7 +1180,105 @@ class AWSFileService:
         """
         try:
            
-            return self.s3_client.put_object(Bucket=bucket_name, Key=f'{folder_key}/')
+            response = self.s3_client.put_object(Bucket=bucket_name, Key=f'{folder_key}/')
+            self.index.upsert(bucket_name, f'{folder_key}/', last_modified=timezone.now())
+            self._invalidate_listings(bucket_name, [f'{folder_key}/'])
+            return response
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def search_files(self, bucket_name, query, limit):
+        """
+        This function search the files of a bucket whose key contains query,
+        best matches first. It reads the index, which must be complete
+        (`python manage.py reindex_buckets`).
+        @param bucket_name: str
+        @param query: str
+        @param limit: int
+        @return: list
+        """
+        try:
+            objects = self.index.search(bucket_name, query, limit)
+            files = ResponseFileSerializer(objects, many=True).data
+            for file, obj in zip(files, objects):
+                file['score'] = obj['score']
+            return files
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def extract_document_text(self, bucket_name, file_key, force=False, progress_callback=None):
+        """
+        This function extract the text of a PDF and index its pages. The file
+        is streamed to a temporary file and read by the pdf_text process pool.
+        Nothing is downloaded when the text of the current version (same
+        ETag) is already indexed.
+        @param bucket_name: str
+        @param file_key: str
+        @param force: bool - extract the file even if its ETag did not change
+        @param progress_callback: callable(done, total) - pages stored, called without arguments while waiting for the pool
+        @return: dict - status and page count
+        """
+        progress = progress_callback or (lambda done=None, total=None: None)
+        documents = self.index.documents
+
+        stored = self.index.get(bucket_name, file_key)
+        if stored is None:
+            return {'status': 'missing', 'page_count': 0}
+        document = documents.get(bucket_name, file_key)
+        if not force and document is not None and document.etag == stored.etag:
+            return {'status': 'unchanged', 'page_count': document.page_count}
+
+        download = self.stream_file(bucket_name, file_key)
+        if not force and document is not None and document.etag == download['etag']:
+            download['chunks'].close()
+            return {'status': 'unchanged', 'page_count': document.page_count}
+
+        try:
+            with tempfile.NamedTemporaryFile(suffix='.pdf') as pdf:
+                for chunk in download['chunks']:
+                    pdf.write(chunk)
+                pdf.flush()
+                pages = pdf_text.extract_text(
+                    pdf.name,
+                    settings.DOCUMENT_TEXT_WORKERS,
+                    settings.DOCUMENT_TEXT_MAX_PAGES,
+                    heartbeat=progress,
+                )
+        except pdf_text.PdfTextError as e:
+            documents.save_failed(bucket_name, file_key, download['etag'], str(e))
+            return {'status': DocumentText.STATUS_FAILED, 'page_count': 0, 'error': str(e)}
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+        if self.index.get(bucket_name, file_key) is None:
+            # Deleted or renamed while it was being read
+            return {'status': 'missing', 'page_count': 0}
+        documents.save(bucket_name, file_key, download['etag'], pages, progress_callback=progress)
+        return {'status': DocumentText.STATUS_INDEXED, 'page_count': len(pages)}
+
+
+    def search_document_text(self, bucket_name, query, limit):
+        """
+        This function search the text of the PDFs of a bucket, returning the
+        matching pages best first
+        @param bucket_name: str
+        @param query: str
+        @param limit: int
+        @return: list
+        """
+        try:
+            pages = self.index.documents.search(bucket_name, query, limit)
+            objects = self.index.get_many(bucket_name, {page['key'] for page in pages})
+            # Text left by files removed outside of the API is skipped
+            pages = [page for page in pages if page['key'] in objects]
+            files = ResponseFileSerializer([objects[page['key']] for page in pages], many=True).data
+            for file, page in zip(files, pages):
+                file['page_number'] = page['page_number']
+                file['score'] = page['score']
+                file['snippet'] = page['snippet']
+            return files
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
 
@@ -181,76 +1289,323 @@ class AWSFileService:
         @param bucket_name: str
         @return: list
         """
-        try:
-            response = self.s3_client.list_objects(Bucket=bucket_name)
-            
-            folders = [obj for obj in response['Contents'] if obj['Key'].endswith('/') and obj['Key'].count('/') == 1]
-            
+        def load():
+            if settings.FILE_INDEX_READS_ENABLED:
+                folders = [obj for obj in self.index.list_folder(bucket_name, '') if obj['Key'].endswith('/')]
+                serializer = ResponseFileSerializer(folders, many=True)
+                return serializer.data
+
+            # Only the first level is listed, every page of it
+            folders = []
+            for page, _ in self._list_folder_pages(bucket_name, ''):
+                folders.extend(obj for obj in page if obj['Key'].endswith('/'))
+
             serializer = ResponseFileSerializer(folders, many=True)
             
             return serializer.data
+
+        try:
+            return listing_cache.get_or_set(bucket_name, '', 'principal-folders', load)
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def get_folder_tree(self, bucket_name, folder_key='', max_depth=None):
+        """
+        This function get the tree of the folders below folder_key with their
+        file counts and sizes. It is built from one paginated listing of the
+        whole prefix (or from the index) instead of one listing per folder.
+        @param bucket_name: str
+        @param folder_key: str - '' for the whole bucket
+        @param max_depth: int - levels of subfolders returned, None for all
+        @return: dict - tree and its etag
+        """
+        def load():
+            if settings.FILE_INDEX_READS_ENABLED:
+                objects = self.index.iter_objects(bucket_name, folder_key)
+            else:
+                paginator = self.s3_client.get_paginator('list_objects_v2')
+                objects = (
+                    (obj['Key'], obj['Size'])
+                    for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_key)
+                    for obj in page.get('Contents', [])
+                )
+
+            tree = render_folder_tree(build_folder_tree(objects, folder_key), max_depth)
+            return {
+                'etag': f'"{hashlib.sha1(dumps(tree)).hexdigest()}"',
+                'tree': tree,
+            }
+
+        try:
+            return listing_cache.get_or_set(bucket_name, folder_key, f'tree:{max_depth}', load)
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
         
         
-    def update_folder_name(self,bucket_name, folder_key, new_folder_key):
+    def iter_archive_entries(self, bucket_name, folder_key):
+        """
+        This function yield the PDFs below a folder, subfolders included, with
+        their path in an archive of the folder (a/b/ -> b/...). The folder
+        is listed one page at a time while the entries are consumed.
+        @param bucket_name: str
+        @param folder_key: str - ends with /
+        @return: iterator of (key, name in the archive)
+        """
+        start = len(get_parent_prefix(folder_key))
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_key):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.pdf'):
+                    yield obj['Key'], obj['Key'][start:]
+
+
+    def find_missing_files(self, bucket_name, keys):
+        """
+        This function check with concurrent HEAD requests that files exist
+        @param bucket_name: str
+        @param keys: list of str
+        @return: list - keys that do not exist
+        """
+        def exists(key):
+            try:
+                self.s3_client.head_object(Bucket=bucket_name, Key=key)
+                return True
+            except ClientError as e:
+                if e.response['Error'].get('Code') in ('404', 'NoSuchKey'):
+                    return False
+                raise
+
+        try:
+            with ThreadPoolExecutor(max_workers=settings.AWS_S3_MAX_CONCURRENCY) as executor:
+                return [key for key, found in zip(keys, executor.map(exists, keys)) if not found]
+        except Exception as e:
+            raise Exception(f"Error: {str(e)}")
+
+
+    def _list_all(self, bucket_name, prefix):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        return [
+            obj
+            for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix)
+            for obj in page.get('Contents', [])
+        ]
+
+
+    @staticmethod
+    def _rename_marker(obj):
+        """
+        Identify the version of an object copied by a rename. Keys may not be
+        ASCII, which S3 metadata must be, so the key and ETag are hashed.
+        @param obj: dict - S3 object with Key and ETag
+        @return: str
+        """
+        return hashlib.sha256(f"{obj['Key']}\n{obj.get('ETag', '')}".encode()).hexdigest()
+
+
+    def _copy_object(self, bucket_name, obj, new_key):
+        """
+        Server-side copy of one object. Objects above the multipart threshold
+        are copied with UploadPartCopy (required above 5 GB), which does not
+        keep the metadata of the source, so both copies set the content type
+        and the rename marker themselves.
+        """
+        copy_source = {'Bucket': bucket_name, 'Key': obj['Key']}
+        extra_args = {'Metadata': {RENAMED_FROM_METADATA: self._rename_marker(obj)}}
+        if not obj['Key'].endswith('/'):
+            extra_args['ContentType'] = 'application/pdf'
+
+        if obj['Size'] >= settings.AWS_S3_MULTIPART_THRESHOLD:
+            self.s3_client.copy(copy_source, bucket_name, new_key, ExtraArgs=extra_args, Config=self.transfer_config)
+        else:
+            self.s3_client.copy_object(Bucket=bucket_name, CopySource=copy_source, Key=new_key, MetadataDirective='REPLACE', **extra_args)
+
+
+    def _is_copy_of(self, bucket_name, obj, target):
+        """
+        Tell if target is a copy of obj made by a previous rename attempt. The
+        same ETag means the same content; a multipart copy has another ETag,
+        so it must carry the marker of this version of obj. A matching size
+        alone proves nothing and the target is copied over.
+        """
+        if target is None or target['Size'] != obj['Size']:
+            return False
+        if obj.get('ETag') and target.get('ETag') == obj.get('ETag'):
+            return True
+        metadata = self.s3_client.head_object(Bucket=bucket_name, Key=target['Key']).get('Metadata', {})
+        return metadata.get(RENAMED_FROM_METADATA) == self._rename_marker(obj)
+
+
+    def _commit_rename(self, bucket_name, folder_key, new_folder_key, on_renamed):
+        # The index and the caller's own bookkeeping (e.g. the shares) move together
+        with transaction.atomic():
+            self.index.rename_prefix(bucket_name, folder_key, new_folder_key)
+            if on_renamed:
+                on_renamed()
+
+    def update_folder_name(self,bucket_name, folder_key, new_folder_key, progress_callback=None, on_renamed=None, resume=False):
         """
         Safely rename a 'folder' in an S3 bucket by copying and then deleting.
+        The copies run concurrently and the sources are only deleted once
+        every copy succeeded. Objects already in the destination with the
+        same ETag, or marked as a copy of the same version of the source, are
+        not copied again, so calling it again after an interrupted rename
+        resumes it. Any other object in the destination is overwritten.
         @param bucket_name: str
         @param folder_key: str
         @param new_folder_key: str
+        @param progress_callback: callable(done, total) - optional
+        @param on_renamed: callable() - optional, runs in the transaction that renames the index
+        @param resume: bool - retry of an interrupted rename: an empty source with an existing destination was already moved
+        @return: dict - copied, skipped and deleted counts and delete errors
         """
         try:
-            paginator = self.s3_client.get_paginator('list_objects_v2')
-            all_objects = []
-
-            for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_key):
-                all_objects.extend(page.get('Contents', []))
+            all_objects = self._list_all(bucket_name, folder_key)
+            existing = {obj['Key']: obj for obj in self._list_all(bucket_name, new_folder_key)}
 
             if not all_objects:
+                if resume and existing:
+                    # The previous attempt deleted the sources but did not commit the rename
+                    self._commit_rename(bucket_name, folder_key, new_folder_key, on_renamed)
+                    return {'copied': 0, 'skipped': 0, 'deleted': 0}
                 raise Exception(f"No se encontraron objetos bajo {folder_key}")
 
-            for obj in all_objects:
-                if obj['Key'].endswith('/'):
-                    continue  
+            pending = [
+                obj for obj in all_objects
+                if not self._is_copy_of(bucket_name, obj, existing.get(obj['Key'].replace(folder_key, new_folder_key, 1)))
+            ]
+            total = len(all_objects)
+            done = total - len(pending)
+            if progress_callback:
+                progress_callback(done, total)
 
-                old_key = obj['Key']
-                new_key = old_key.replace(folder_key, new_folder_key, 1)
+            with ThreadPoolExecutor(max_workers=settings.AWS_S3_COPY_CONCURRENCY) as executor:
+                futures = [
+                    executor.submit(self._copy_object, bucket_name, obj, obj['Key'].replace(folder_key, new_folder_key, 1))
+                    for obj in pending
+                ]
+                for future in as_completed(futures):
+                    future.result()
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, total)
 
-                self.s3_client.copy_object(
-                    Bucket=bucket_name,
-                    CopySource={'Bucket': bucket_name, 'Key': old_key},
-                    Key=new_key
-                )
+            if new_folder_key not in existing and not any(obj['Key'] == folder_key for obj in all_objects):
+                self.s3_client.put_object(Bucket=bucket_name, Key=new_folder_key)
 
-            for obj in all_objects:
-                if obj['Key'].endswith('/'):
-                    continue
-                self.s3_client.delete_object(Bucket=bucket_name, Key=obj['Key'])
-                                
-            self.s3_client.put_object(Bucket=bucket_name, Key=f"{new_folder_key}")
+            result = self.delete_keys(bucket_name, [obj['Key'] for obj in all_objects])
+            if result['errors']:
+                raise Exception(f"{len(result['errors'])} objetos no se pudieron eliminar de {folder_key}")
 
-            self.s3_client.delete_object(Bucket=bucket_name, Key=folder_key)
+            self._commit_rename(bucket_name, folder_key, new_folder_key, on_renamed)
 
-            return True
+            self._invalidate_listings(
+                bucket_name,
+                [folder_key, new_folder_key]
+                + [obj['Key'] for obj in all_objects]
+                + [obj['Key'].replace(folder_key, new_folder_key, 1) for obj in all_objects],
+            )
+
+            return {
+                'copied': len(pending),
+                'skipped': total - len(pending),
+                'deleted': len(result['deleted']),
+            }
 
         except Exception as e:
             raise Exception(f"Error al renombrar la carpeta: {str(e)}")
 
         
         
-    def delete_folder(self,bucket_name,folder_key):
+    def _delete_batch(self, bucket_name, keys):
+        """
+        Delete up to 1000 keys with a single DeleteObjects request
+        @return: list of errors, one dict per key that could not be deleted
         """
-        This function delete a folder from the bucket
+        response = self.s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True},
+        )
+        return [
+            {'key': error['Key'], 'code': error.get('Code'), 'message': error.get('Message')}
+            for error in response.get('Errors', [])
+        ]
+
+
+    def delete_keys(self, bucket_name, keys, progress_callback=None):
+        """
+        This function delete many keys in batches of 1000 sent concurrently
+        @param bucket_name: str
+        @param keys: iterable of str - may be a generator, batches are sent while it is consumed
+        @param progress_callback: callable(done, total) - called after every batch, total counts the keys read so far
+        @return: dict - deleted keys and per-key errors
+        """
+        deleted = []
+        errors = []
+        listed = 0
+
+        def collect(batch, future):
+            try:
+                batch_errors = future.result()
+            except Exception as e:
+                batch_errors = [{'key': key, 'code': 'RequestFailed', 'message': str(e)} for key in batch]
+
+            failed = {error['key'] for error in batch_errors}
+            deleted.extend(key for key in batch if key not in failed)
+            errors.extend(batch_errors)
+            if progress_callback:
+                progress_callback(len(deleted) + len(errors), listed)
+
+        with ThreadPoolExecutor(max_workers=settings.AWS_S3_MAX_CONCURRENCY) as executor:
+            pending = deque()
+            batch = []
+            for key in keys:
+                batch.append(key)
+                if len(batch) == DELETE_BATCH_SIZE:
+                    pending.append((batch, executor.submit(self._delete_batch, bucket_name, batch)))
+                    listed += len(batch)
+                    batch = []
+                    # Report the finished batches while the rest is still being listed
+                    while pending and pending[0][1].done():
+                        collect(*pending.popleft())
+            if batch:
+                pending.append((batch, executor.submit(self._delete_batch, bucket_name, batch)))
+                listed += len(batch)
+
+            while pending:
+                collect(*pending.popleft())
+
+        return {'deleted': deleted, 'errors': errors}
+
+
+    def delete_folder(self,bucket_name,folder_key, progress_callback=None):
+        """
+        This function delete a folder from the bucket. Keys are removed with
+        DeleteObjects batches while the folder is still being listed.
         @param bucket_name: str
         @param folder_key: str
+        @param progress_callback: callable(done, total) - optional
+        @return: dict - number of deleted keys, deleted keys and per-key errors
         """
         try:
             paginator = self.s3_client.get_paginator('list_objects_v2')
-            response = paginator.paginate(Bucket=bucket_name, Prefix=folder_key)
-            for page in response:
-                for obj in page.get('Contents', []):
-                    self.s3_client.delete_object(Bucket=bucket_name, Key=obj['Key'])
-            return True
+            keys = (
+                obj['Key']
+                for page in paginator.paginate(Bucket=bucket_name, Prefix=folder_key)
+                for obj in page.get('Contents', [])
+            )
+            result = self.delete_keys(bucket_name, keys, progress_callback)
+
+            if result['errors']:
+                self.index.remove_many(bucket_name, result['deleted'])
+            else:
+                self.index.remove_prefix(bucket_name, folder_key)
+            self._invalidate_listings(bucket_name, [folder_key] + result['deleted'])
+
+            return {
+                'deleted': len(result['deleted']),
+                'deleted_keys': result['deleted'],
+                'errors': result['errors'],
+            }
         except Exception as e:
             raise Exception(f"Error: {str(e)}")
@@ -1,3 +1,281 @@
-from django.test import TestCase
+import io
+import tracemalloc
+from unittest import mock
 
-# Create your tests here.
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from aws_auth_service.models import CognitoUser
+from aws_files_api import views
+from aws_files_api.models import StorageUsage
+from aws_files_api.services import AWSFileService, QuotaExceededError
+from benchmarks.fake_s3 import InMemoryS3Client
+
+
+class StubBody:
+    """
+    S3 body that makes every chunk when it is read, like a socket would
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.closed = False
+
+    def iter_chunks(self, chunk_size):
+        sent = 0
+        while sent < self.size:
+            length = min(chunk_size, self.size - sent)
+            sent += length
+            yield b'\x00' * length
+
+    def close(self):
+        self.closed = True
+
+
+class StubS3Client:
+
+    def __init__(self, size):
+        self.body = StubBody(size)
+
+    def get_object(self, **params):
+        return {
+            'Body': self.body,
+            'ContentLength': self.body.size,
+            'ContentType': 'application/pdf',
+            'ETag': '"stub"',
+        }
+
+
+@override_settings(AWS_S3_DOWNLOAD_CHUNK_SIZE=256 * 1024)
+class DownloadFileStreamingTests(SimpleTestCase):
+
+    def download(self, s3_client):
+        request = APIRequestFactory().get('/api/files/download/', {'file_key': 'reports/large.pdf'})
+        force_authenticate(request, CognitoUser(username='alice'))
+        with mock.patch.object(views.file_service, '_s3_client', s3_client):
+            return views.DownloadFile.as_view()(request)
+
+    def test_large_object_is_streamed_in_chunks(self):
+        size = 64 * 1024 * 1024
+        s3_client = StubS3Client(size)
+
+        tracemalloc.start()
+        try:
+            response = self.download(s3_client)
+            chunks = 0
+            received = 0
+            for chunk in response.streaming_content:
+                chunks += 1
+                received += len(chunk)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(size))
+        self.assertEqual(received, size)
+        self.assertEqual(chunks, size // (256 * 1024))
+        # A few chunks at most are alive at the same time, never the whole object
+        self.assertLess(peak, 4 * 1024 * 1024)
+        self.assertTrue(s3_client.body.closed)
+
+    def test_body_is_closed_when_the_client_disconnects(self):
+        s3_client = StubS3Client(8 * 1024 * 1024)
+
+        response = self.download(s3_client)
+        next(iter(response.streaming_content))
+        response.close()
+
+        self.assertTrue(s3_client.body.closed)
+
+
+class StreamUploadContentLengthTests(SimpleTestCase):
+
+    def upload(self, content_length):
+        request = APIRequestFactory().put(
+            '/api/files/stream-upload/?file_name=reports/new.pdf', b'%PDF-1.4',
+            content_type='application/pdf', CONTENT_LENGTH=content_length,
+        )
+        force_authenticate(request, CognitoUser(username='alice'))
+        return views.StreamUpload.as_view()(request)
+
+    def test_missing_content_length(self):
+        self.assertEqual(self.upload('').status_code, 411)
+
+    def test_invalid_content_length(self):
+        self.assertEqual(self.upload('eight').status_code, 400)
+        self.assertEqual(self.upload('-8').status_code, 400)
+
+
+@override_settings(AWS_S3_MULTIPART_THRESHOLD=1024, LISTING_CACHE_ENABLED=False)
+class UpdateFolderNameTests(TestCase):
+    bucket_name = 'alice-security-project'
+
+    def setUp(self):
+        self.s3_client = InMemoryS3Client()
+        self.s3_client.create_bucket(Bucket=self.bucket_name)
+        self.file_service = AWSFileService(s3_client=self.s3_client)
+
+    def put(self, key, body):
+        self.s3_client.put_object(Bucket=self.bucket_name, Key=key, Body=body, ContentType='application/pdf')
+        self.file_service.reindex_bucket(self.bucket_name)
+
+    def read(self, key):
+        return self.s3_client.get_object(Bucket=self.bucket_name, Key=key)['Body'].read()
+
+    def test_multipart_copy_keeps_the_content_type(self):
+        self.put('src/large.pdf', b'a' * 4096)
+        self.put('src/small.pdf', b'b' * 16)
+
+        self.file_service.update_folder_name(self.bucket_name, 'src/', 'dst/')
+
+        for key in ('dst/large.pdf', 'dst/small.pdf'):
+            self.assertEqual(self.s3_client.head_object(Bucket=self.bucket_name, Key=key)['ContentType'], 'application/pdf')
+
+    def test_object_of_the_same_size_is_not_taken_for_a_copy(self):
+        self.put('src/report.pdf', b'a' * 4096)
+        self.put('dst/report.pdf', b'z' * 4096)
+
+        result = self.file_service.update_folder_name(self.bucket_name, 'src/', 'dst/')
+
+        self.assertEqual(result['copied'], 1)
+        self.assertEqual(self.read('dst/report.pdf'), b'a' * 4096)
+
+    def test_interrupted_rename_is_resumed(self):
+        self.put('src/copied.pdf', b'a' * 4096)
+        self.put('src/pending.pdf', b'b' * 4096)
+        source = self.s3_client.head_object(Bucket=self.bucket_name, Key='src/copied.pdf')
+        # Copied by the attempt that was interrupted
+        self.file_service._copy_object(self.bucket_name, {'Key': 'src/copied.pdf', 'Size': 4096, 'ETag': source['ETag']}, 'dst/copied.pdf')
+
+        result = self.file_service.update_folder_name(self.bucket_name, 'src/', 'dst/')
+
+        self.assertEqual((result['copied'], result['skipped']), (1, 1))
+        self.assertEqual(self.read('dst/copied.pdf'), b'a' * 4096)
+        self.assertEqual(self.read('dst/pending.pdf'), b'b' * 4096)
+        self.assertEqual(self.s3_client.list_objects_v2(Bucket=self.bucket_name, Prefix='src/').get('KeyCount', 0), 0)
+
+    def test_missing_folder_is_not_renamed_onto_an_existing_one(self):
+        self.put('dst/report.pdf', b'a' * 16)
+
+        with self.assertRaisesMessage(Exception, 'No se encontraron objetos bajo src/'):
+            self.file_service.update_folder_name(self.bucket_name, 'src/', 'dst/')
+
+    def test_retry_commits_a_rename_whose_sources_are_gone(self):
+        self.put('src/report.pdf', b'a' * 16)
+        self.s3_client.copy_object(Bucket=self.bucket_name, CopySource={'Bucket': self.bucket_name, 'Key': 'src/report.pdf'}, Key='dst/report.pdf')
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key='src/report.pdf')
+        renamed = mock.Mock()
+
+        self.file_service.update_folder_name(self.bucket_name, 'src/', 'dst/', on_renamed=renamed, resume=True)
+
+        renamed.assert_called_once_with()
+        self.assertIsNotNone(self.file_service.index.get(self.bucket_name, 'dst/report.pdf'))
+        self.assertIsNone(self.file_service.index.get(self.bucket_name, 'src/report.pdf'))
+
+
+@override_settings(LISTING_CACHE_ENABLED=False)
+class StorageUsageTests(TestCase):
+    bucket_name = 'alice-security-project'
+
+    def setUp(self):
+        self.s3_client = InMemoryS3Client()
+        self.s3_client.create_bucket(Bucket=self.bucket_name)
+        self.file_service = AWSFileService(s3_client=self.s3_client)
+
+    def upload(self, key, size, quota=None):
+        return self.file_service.upload_file(self.bucket_name, key, io.BytesIO(b'x' * size), quota)
+
+    def assertUsage(self, prefix, size, file_count):
+        usage = self.file_service.get_storage_usage(self.bucket_name, prefix)
+        self.assertEqual((usage['size'], usage['file_count']), (size, file_count), prefix)
+
+    def test_overwrite_counts_the_new_size_once(self):
+        self.upload('a/report.pdf', 100)
+        self.upload('a/report.pdf', 40)
+
+        self.assertUsage('', 40, 1)
+        self.assertUsage('a/', 40, 1)
+
+    def test_file_rename(self):
+        self.upload('a/report.pdf', 100)
+        self.upload('b/report.pdf', 30)
+
+        self.file_service.update_file_name(self.bucket_name, 'a/report.pdf', 'b/report.pdf')
+
+        self.assertUsage('', 100, 1)
+        self.assertUsage('a/', 0, 0)
+        self.assertUsage('b/', 100, 1)
+
+    def test_folder_rename(self):
+        self.upload('a/one.pdf', 100)
+        self.upload('a/c/two.pdf', 20)
+        self.upload('b/one.pdf', 5)
+        self.upload('b/three.pdf', 7)
+
+        self.file_service.update_folder_name(self.bucket_name, 'a/', 'b/')
+
+        self.assertUsage('', 127, 3)
+        self.assertUsage('a/', 0, 0)
+        self.assertUsage('b/', 127, 3)
+        self.assertUsage('b/c/', 20, 1)
+
+    def test_folder_rename_into_a_subfolder(self):
+        self.upload('a/one.pdf', 100)
+        self.upload('a/c/two.pdf', 20)
+
+        self.file_service.update_folder_name(self.bucket_name, 'a/', 'a/c/')
+
+        self.assertUsage('', 120, 2)
+        self.assertUsage('a/', 120, 2)
+        self.assertUsage('a/c/', 120, 2)
+        self.assertUsage('a/c/c/', 20, 1)
+
+    def test_folder_delete(self):
+        self.upload('a/one.pdf', 100)
+        self.upload('a/c/two.pdf', 20)
+        self.upload('b/three.pdf', 7)
+
+        self.file_service.delete_folder(self.bucket_name, 'a/')
+
+        self.assertUsage('', 7, 1)
+        self.assertUsage('a/', 0, 0)
+        self.assertUsage('a/c/', 0, 0)
+
+    def test_partial_delete(self):
+        self.upload('a/one.pdf', 100)
+        self.upload('a/c/two.pdf', 20)
+
+        self.file_service.index.remove_many(self.bucket_name, ['a/c/two.pdf', 'a/missing.pdf'])
+
+        self.assertUsage('', 100, 1)
+        self.assertUsage('a/', 100, 1)
+        self.assertUsage('a/c/', 0, 0)
+
+    def test_reindex_rebuilds_the_counters(self):
+        self.upload('a/one.pdf', 100)
+        self.upload('a/c/two.pdf', 20)
+        StorageUsage.objects.filter(bucket_name=self.bucket_name).update(size=999, file_count=9)
+        self.s3_client.delete_object(Bucket=self.bucket_name, Key='a/one.pdf')
+
+        self.file_service.reindex_bucket(self.bucket_name)
+
+        self.assertUsage('', 20, 1)
+        self.assertUsage('a/', 20, 1)
+        self.assertUsage('a/c/', 20, 1)
+
+    def test_upload_over_the_quota_is_removed(self):
+        self.upload('a/one.pdf', 100, quota=150)
+
+        with self.assertRaises(QuotaExceededError):
+            self.upload('a/two.pdf', 60, quota=150)
+
+        self.assertUsage('', 100, 1)
+        self.assertNotIn('a/two.pdf', self.s3_client.buckets[self.bucket_name])
+
+    def test_overwrite_is_checked_against_the_replaced_size(self):
+        self.upload('a/one.pdf', 100, quota=150)
+
+        self.upload('a/one.pdf', 150, quota=150)
+
+        self.assertUsage('', 150, 1)
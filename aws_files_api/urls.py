@@ -1,12 +1,23 @@
 
 from django.urls import path
 
-from .views import CreateBucket, FilesView, PrincipalFolder, DownloadFile, FolderCrud
+from .async_views import AsyncDownloadFile, AsyncFilesView, AsyncPrincipalFolder
+from .views import CreateBucket, DocumentSearch, FileArchive, FilesView, FileSearch, FolderTree, PrincipalFolder, StorageUsageView, DownloadFile, FolderCrud, PresignedDownload, PresignedUpload, StreamUpload, UploadComplete
 
 urlfilepatterns = [
     path('', FilesView.as_view(), name='get_docs'),
+    path('stream-upload/', StreamUpload.as_view(), name='stream_upload'),
     path('download-file/', DownloadFile.as_view(), name='download_file'),
+    path('archive/', FileArchive.as_view(), name='file_archive'),
     path('create-bucket/', CreateBucket.as_view(), name='create_bucket'),
+    path('presigned-download/', PresignedDownload.as_view(), name='presigned_download'),
+    path('presigned-upload/', PresignedUpload.as_view(), name='presigned_upload'),
+    path('upload-complete/', UploadComplete.as_view(), name='upload_complete'),
+    path('usage/', StorageUsageView.as_view(), name='storage_usage'),
+    path('search/', FileSearch.as_view(), name='file_search'),
+    path('content-search/', DocumentSearch.as_view(), name='document_search'),
+    path('async/', AsyncFilesView.as_view(), name='get_docs_async'),
+    path('async/download-file/', AsyncDownloadFile.as_view(), name='download_file_async'),
   
 ]
 
@@ -14,6 +25,8 @@ urlfilepatterns = [
 urlFolderpatterns = [
     path('', FolderCrud.as_view(), name='folder_crud'),
     path('principal-folders/', PrincipalFolder.as_view(), name='principal_folder'),
+    path('tree/', FolderTree.as_view(), name='folder_tree'),
+    path('async/principal-folders/', AsyncPrincipalFolder.as_view(), name='principal_folder_async'),
 ]
 
 
@@ -1,15 +1,54 @@
+from itertools import chain
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from aws_files_api.serializers import CreateFolderSerializer, DeleteFileSerializer, DownloadFileSerializer, FolderGetSerializer, GetFilesByFolderSerializer, UpdateFileSerializer, UploadFileSerializer, UpdateFolderNameSerializer, DeleteFolderSerializer
-from aws_files_api.services import AWSFileService
+from aws_files_api.serializers import ArchiveSerializer, CreateFolderSerializer, DeleteFileSerializer, DocumentSearchSerializer, DownloadFileSerializer, FileSearchSerializer, FolderGetSerializer, FolderTreeSerializer, GetFilesByFolderSerializer, PresignedUploadSerializer, StorageUsageSerializer, StreamUploadSerializer, UpdateFileSerializer, UploadCompleteSerializer, UploadFileSerializer, UpdateFolderNameSerializer, DeleteFolderSerializer
+from aws_files_api.services import AWSFileService, QuotaExceededError
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from shared_files.services import SharedFileService
+from jobs.services import JobService
+from aws_files_api.archives import archive_response
+from aws_files_api.downloads import build_download_response, etag_matches
 from django.http import HttpResponse
+from django.conf import settings
 
 file_service = AWSFileService()
 shared_file_service = SharedFileService()
+job_service = JobService()
+
+
+def quota_left(bucket_name):
+    """
+    Bytes the user may still store under STORAGE_QUOTA_BYTES, read from the
+    usage counters. None when there is no quota.
+    """
+    if not settings.STORAGE_QUOTA_BYTES:
+        return None
+    return max(settings.STORAGE_QUOTA_BYTES - file_service.get_storage_usage(bucket_name)['size'], 0)
+
+def exceeds_quota(bucket_name, upload_size):
+    """
+    Check an upload against STORAGE_QUOTA_BYTES with one read of the usage
+    counters, to reject it before it is sent to S3. Concurrent uploads may
+    all pass it; the index checks the quota again under the bucket lock.
+    """
+    left = quota_left(bucket_name)
+    return left is not None and upload_size > left
+
+def schedule_text_extraction(username, file_key, etag):
+    """
+    Queue the extraction of the text of an uploaded file. The ETag is part
+    of the payload, so a new version is queued even while the previous one
+    is being extracted.
+    """
+    if settings.DOCUMENT_TEXT_ENABLED:
+        job_service.enqueue(username, 'extract_document_text', {
+            'bucket_name': f"{username}-security-project",
+            'file_key': file_key,
+            'etag': etag,
+        })
 
 class CreateBucket(APIView):    
     def get(self, request):
@@ -36,6 +75,15 @@ class FilesView(APIView):
             
             folder_key = f"{folder_key}/" if folder_key else ""
 
+            if 'page_size' in serializer.validated_data or 'cursor' in serializer.validated_data:
+                page = file_service.get_files_page_by_folder_key(
+                    f'{request.user.username}-security-project',
+                    folder_key,
+                    serializer.validated_data.get('page_size', 100),
+                    serializer.validated_data.get('cursor'),
+                )
+                return Response(page, status=status.HTTP_200_OK)
+
             documentos = file_service.get_files_by_folder_key(f'{request.user.username}-security-project', f'{folder_key}')
             return Response(documentos, status=status.HTTP_200_OK)
         except Exception as e:
@@ -53,13 +101,19 @@ class FilesView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            response = file_service.upload_file(f"{request.user.username}-security-project",file_name,file)
+            if exceeds_quota(f"{request.user.username}-security-project", file.size):
+                return Response({"error": "Storage quota exceeded"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            metadata = file_service.upload_file(f"{request.user.username}-security-project",file_name,file, settings.STORAGE_QUOTA_BYTES or None)
+            schedule_text_extraction(request.user.username, file_name, metadata['etag'])
             
             return Response({
                 "message": "File uploaded successfully",
                
             }, status=status.HTTP_201_CREATED)
             
+        except QuotaExceededError as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -74,7 +128,7 @@ class FilesView(APIView):
         
         try:
             response = file_service.update_file_name(f"{request.user.username}-security-project",file_key,new_file_key)
-            shared_file_service.update_file_key(file_key, new_file_key)
+            shared_file_service.update_file_key(file_key, new_file_key, request.user.username)
             return Response({
                 "message": "File updated successfully",
                 "response": response
@@ -92,7 +146,7 @@ class FilesView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         try:
             response = file_service.delete_file(f"{request.user.username}-security-project",file_key)
-            shared_file_service.delete(file_key)
+            shared_file_service.delete(file_key, request.user.username)
             
             return Response({
                 "message": "File deleted successfully",
@@ -103,6 +157,164 @@ class FilesView(APIView):
         
         
         
+class FileSearch(APIView):
+    """
+    Search the files of the user and the files shared with them by name,
+    best matches first
+    """
+
+    @swagger_auto_schema(query_serializer=FileSearchSerializer)
+    def get(self, request):
+        serializer = FileSearchSerializer(data=request.query_params)
+        if serializer.is_valid():
+            query = serializer.validated_data['q']
+            scope = serializer.validated_data['scope']
+            page = serializer.validated_data['page']
+            page_size = serializer.validated_data['page_size']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Each source returns its best matches up to the end of the page, one more to know if there is a next page
+        offset = (page - 1) * page_size
+        limit = offset + page_size + 1
+
+        try:
+            results = []
+            if scope in ('all', 'own'):
+                results.extend(
+                    {"source": "own", **file}
+                    for file in file_service.search_files(f"{request.user.username}-security-project", query, limit)
+                )
+            if scope in ('all', 'shared'):
+                results.extend(
+                    {
+                        "source": "shared",
+                        "file_name": share['file_name'],
+                        "file_key": share['file_key'],
+                        "file_size": share['file_size'],
+                        "shared_file_id": share['id'],
+                        "owner_user_id": share['owner_user_id'],
+                        "owner_user_email": share['owner_user_email'],
+                        "shared_at": share['shared_at'],
+                        "score": share['score'],
+                    }
+                    for share in shared_file_service.search(request.user.username, query, limit)
+                )
+            # Stable sort: on equal scores own files come first, each source keeps its order
+            results.sort(key=lambda result: (-result['score'], result['source'] != 'own'))
+
+            return Response({
+                "results": results[offset:offset + page_size],
+                "page": page,
+                "page_size": page_size,
+                "has_next": len(results) > offset + page_size,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class DocumentSearch(APIView):
+    """
+    Search the text of the user's PDFs, one result per matching page
+    """
+
+    @swagger_auto_schema(query_serializer=DocumentSearchSerializer)
+    def get(self, request):
+        serializer = DocumentSearchSerializer(data=request.query_params)
+        if serializer.is_valid():
+            query = serializer.validated_data['q']
+            page = serializer.validated_data['page']
+            page_size = serializer.validated_data['page_size']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        offset = (page - 1) * page_size
+
+        try:
+            # One more result than the page to know if there is a next one
+            results = file_service.search_document_text(f"{request.user.username}-security-project", query, offset + page_size + 1)
+            return Response({
+                "results": results[offset:offset + page_size],
+                "page": page,
+                "page_size": page_size,
+                "has_next": len(results) > offset + page_size,
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class StorageUsageView(APIView):
+
+    @swagger_auto_schema(query_serializer=StorageUsageSerializer)
+    def get(self, request):
+        serializer = StorageUsageSerializer(data=request.query_params)
+        if serializer.is_valid():
+            folder_key = serializer.validated_data['folder_key']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        folder_key = f"{folder_key}/" if folder_key else ""
+
+        try:
+            usage = file_service.get_storage_usage(f"{request.user.username}-security-project", folder_key)
+            return Response({
+                "folder_key": folder_key,
+                "size": usage['size'],
+                "file_count": usage['file_count'],
+                "quota": settings.STORAGE_QUOTA_BYTES or None,
+                "updated_at": usage['updated_at'],
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class StreamUpload(APIView):
+    """
+    Upload the raw request body straight to S3. Unlike FilesView.post the
+    body is not spooled to a temporary file first, it is read one multipart
+    chunk at a time while the parts are uploaded in parallel.
+    """
+    parser_classes = []
+
+    @swagger_auto_schema(query_serializer=StreamUploadSerializer)
+    def put(self, request):
+        serializer = StreamUploadSerializer(data=request.query_params)
+        if serializer.is_valid():
+            file_name = serializer.validated_data['file_name']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if request.content_type != 'application/pdf':
+            return Response({"error": "Content-Type must be application/pdf"}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        if not request.META.get('CONTENT_LENGTH'):
+            return Response({"error": "Content-Length is required"}, status=status.HTTP_411_LENGTH_REQUIRED)
+        try:
+            content_length = int(request.META['CONTENT_LENGTH'])
+        except ValueError:
+            content_length = 0
+        if content_length <= 0:
+            return Response({"error": "Content-Length must be a positive integer"}, status=status.HTTP_400_BAD_REQUEST)
+        if content_length > settings.AWS_S3_MAX_UPLOAD_SIZE:
+            return Response({"error": "File is too large"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        try:
+            if exceeds_quota(f"{request.user.username}-security-project", content_length):
+                return Response({"error": "Storage quota exceeded"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+            metadata = file_service.upload_file(f"{request.user.username}-security-project", file_name, request.stream, settings.STORAGE_QUOTA_BYTES or None)
+            schedule_text_extraction(request.user.username, file_name, metadata['etag'])
+
+            return Response({
+                "message": "File uploaded successfully",
+            }, status=status.HTTP_201_CREATED)
+
+        except QuotaExceededError as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class DownloadFile(APIView):
     
     @swagger_auto_schema(query_serializer=DownloadFileSerializer)
@@ -114,20 +326,151 @@ class DownloadFile(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            file_content = file_service.get_file(f"{request.user.username}-security-project", file_key)
-            file_name = file_key.split('/')[-1]
-            
-            response = HttpResponse(
-                file_content,
-                content_type='application/pdf'
-            )
-            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-            return response
-            
+            return build_download_response(request, file_service, f"{request.user.username}-security-project", file_key)
+
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         
+class FileArchive(APIView):
+    """
+    Download a folder or a list of files as one ZIP archive, built while
+    the files are read from S3
+    """
+    parser_classes = [JSONParser]
+
+    @swagger_auto_schema(query_serializer=ArchiveSerializer)
+    def get(self, request):
+        return self.archive(request, ArchiveSerializer(data=request.query_params))
+
+    @swagger_auto_schema(request_body=ArchiveSerializer)
+    def post(self, request):
+        return self.archive(request, ArchiveSerializer(data=request.data))
+
+    def archive(self, request, serializer):
+        if serializer.is_valid():
+            folder_key = serializer.validated_data.get('folder_key')
+            file_keys = serializer.validated_data.get('file_keys')
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        bucket_name = f"{request.user.username}-security-project"
+
+        try:
+            # Errors are only reported before the archive starts, so the input is checked first
+            if folder_key:
+                entries = file_service.iter_archive_entries(bucket_name, f"{folder_key}/")
+                first = next(entries, None)
+                if first is None:
+                    return Response({"error": "The folder has no files"}, status=status.HTTP_404_NOT_FOUND)
+                entries = chain([first], entries)
+                file_name = f"{folder_key.split('/')[-1]}.zip"
+            else:
+                file_keys = list(dict.fromkeys(file_keys))
+                missing = file_service.find_missing_files(bucket_name, file_keys)
+                if missing:
+                    return Response({"error": "Files not found", "file_keys": missing}, status=status.HTTP_404_NOT_FOUND)
+                entries = [(file_key, file_key) for file_key in file_keys]
+                file_name = 'files.zip'
+
+            return archive_response(file_service, bucket_name, entries, file_name)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PresignedDownload(APIView):
+
+    @swagger_auto_schema(query_serializer=DownloadFileSerializer)
+    def get(self, request):
+        if not settings.AWS_S3_PRESIGNED_URLS_ENABLED:
+            return Response({"error": "Presigned URLs are disabled"}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = DownloadFileSerializer(data=request.query_params)
+        if serializer.is_valid():
+            file_key = serializer.validated_data['file_key']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            url = file_service.generate_download_url(f"{request.user.username}-security-project", file_key)
+            return Response({
+                "url": url,
+                "expires_in": settings.AWS_S3_PRESIGNED_URL_EXPIRES
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class PresignedUpload(APIView):
+    parser_classes = [JSONParser]
+
+    @swagger_auto_schema(request_body=PresignedUploadSerializer)
+    def post(self, request):
+        if not settings.AWS_S3_PRESIGNED_URLS_ENABLED:
+            return Response({"error": "Presigned URLs are disabled"}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = PresignedUploadSerializer(data=request.data)
+        if serializer.is_valid():
+            file_name = serializer.validated_data['file_name']
+            file_size = serializer.validated_data.get('file_size')
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        max_size = file_size or settings.AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE
+        if max_size > settings.AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE:
+            return Response({"error": "File is too large"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+        try:
+            # S3 enforces the size of the post, so the upload cannot go over the quota
+            # left now. Without a declared size it accepts up to what is left.
+            left = quota_left(f"{request.user.username}-security-project")
+            if left is not None:
+                if left == 0 or (file_size and file_size > left):
+                    return Response({"error": "Storage quota exceeded"}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+                max_size = min(max_size, left)
+
+            presigned_post = file_service.generate_upload_post(f"{request.user.username}-security-project", file_name, max_size)
+            return Response({
+                "url": presigned_post['url'],
+                "fields": presigned_post['fields'],
+                "file_key": file_name,
+                "max_size": max_size,
+                "expires_in": settings.AWS_S3_PRESIGNED_URL_EXPIRES
+            }, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class UploadComplete(APIView):
+    parser_classes = [JSONParser]
+
+    @swagger_auto_schema(request_body=UploadCompleteSerializer)
+    def post(self, request):
+        if not settings.AWS_S3_PRESIGNED_URLS_ENABLED:
+            return Response({"error": "Presigned URLs are disabled"}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = UploadCompleteSerializer(data=request.data)
+        if serializer.is_valid():
+            file_key = serializer.validated_data['file_key']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            bucket_name = f"{request.user.username}-security-project"
+            # Checked again under the bucket lock, other uploads may have used the quota since the post was signed
+            metadata = file_service.register_uploaded_file(bucket_name, file_key, settings.STORAGE_QUOTA_BYTES or None)
+            schedule_text_extraction(request.user.username, file_key, metadata['etag'])
+            return Response({
+                "message": "File uploaded successfully",
+                "file_key": file_key,
+                "file_size": metadata['content_length']
+            }, status=status.HTTP_201_CREATED)
+        except QuotaExceededError as e:
+            return Response({"error": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class PrincipalFolder(APIView):
     parser_classes = [ JSONParser]
     
@@ -139,6 +482,40 @@ class PrincipalFolder(APIView):
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
                
                 
+class FolderTree(APIView):
+    """
+    The whole folder tree in one request, with the file count and size of
+    every folder. Send the ETag back in If-None-Match to get a 304 when
+    nothing changed.
+    """
+
+    @swagger_auto_schema(query_serializer=FolderTreeSerializer)
+    def get(self, request):
+        serializer = FolderTreeSerializer(data=request.query_params)
+        if serializer.is_valid():
+            folder_key = serializer.validated_data['folder_key']
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        folder_key = f"{folder_key}/" if folder_key else ""
+
+        try:
+            result = file_service.get_folder_tree(
+                f'{request.user.username}-security-project',
+                folder_key,
+                serializer.validated_data.get('depth'),
+            )
+            if etag_matches(request, result['etag']):
+                response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = Response(result['tree'], status=status.HTTP_200_OK)
+            response['ETag'] = result['etag']
+            response['Cache-Control'] = 'private, no-cache'
+            return response
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+
 class FolderCrud(APIView):
     
     @swagger_auto_schema(request_body=CreateFolderSerializer)
@@ -170,9 +547,27 @@ class FolderCrud(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         try:
-            response = file_service.update_folder_name(f'{request.user.username}-security-project',f'{folder_key}/',f'{new_folder_key}/')
+            if settings.FOLDER_JOBS_ASYNC:
+                job = job_service.enqueue(request.user.username, 'rename_folder', {
+                    "bucket_name": f'{request.user.username}-security-project',
+                    "folder_key": folder_key,
+                    "new_folder_key": new_folder_key,
+                }, request.headers.get('Idempotency-Key'))
+                # The job invalidates them again when it is done
+                file_service.invalidate_folder_listings(f'{request.user.username}-security-project', [f'{folder_key}/', f'{new_folder_key}/'])
+                return Response({
+                    "message": "Folder update started",
+                    "job_id": job.id,
+                    "status": job.status
+                }, status=status.HTTP_202_ACCEPTED)
+
+            response = file_service.update_folder_name(
+                f'{request.user.username}-security-project',
+                f'{folder_key}/',
+                f'{new_folder_key}/',
+                on_renamed=lambda: shared_file_service.update_folder_key(folder_key, new_folder_key, request.user.username),
+            )
             
-            shared_file_service.update_folder_key(folder_key, new_folder_key)
             return Response({
                 "message": "Folder updated successfully",
                 "response": response
@@ -190,8 +585,28 @@ class FolderCrud(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
         try:
+            if settings.FOLDER_JOBS_ASYNC:
+                job = job_service.enqueue(request.user.username, 'delete_folder', {
+                    "bucket_name": f'{request.user.username}-security-project',
+                    "folder_key": folder_key,
+                }, request.headers.get('Idempotency-Key'))
+                file_service.invalidate_folder_listings(f'{request.user.username}-security-project', [f'{folder_key}/'])
+                return Response({
+                    "message": "Folder deletion started",
+                    "job_id": job.id,
+                    "status": job.status
+                }, status=status.HTTP_202_ACCEPTED)
+
             response = file_service.delete_folder(f'{request.user.username}-security-project',f'{folder_key}/')
-            shared_file_service.delete_folder(folder_key)
+            if response['errors']:
+                shared_file_service.delete_many(response.pop('deleted_keys'), request.user.username)
+                return Response({
+                    "message": "Folder partially deleted",
+                    "response": response
+                }, status=status.HTTP_207_MULTI_STATUS)
+
+            response.pop('deleted_keys')
+            shared_file_service.delete_folder(folder_key, request.user.username)
             return Response({
                 "message": "Folder deleted successfully",
                 "response": response
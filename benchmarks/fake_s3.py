@@ -0,0 +1,321 @@
+"""
+In-process stand-in for the subset of the S3 client used by AWSFileService.
+
+Objects can hold real bytes or a synthetic body of a given size (a
+repeated pattern generated on read), so multi-hundred-MB transfers can be
+benchmarked without holding them in memory. An optional latency is added
+to every call to imitate the round trip to S3.
+"""
+import bisect
+import datetime
+import hashlib
+import io
+import threading
+import time
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+
+PATTERN = bytes(range(256)) * 4096
+
+
+class SyntheticBody:
+    """
+    Body of a synthetic object: only its size is stored
+    """
+
+    def __init__(self, size):
+        self.size = size
+
+    def __len__(self):
+        return self.size
+
+    def reader(self, start=0, end=None):
+        return PatternReader((end if end is not None else self.size) - start, start)
+
+
+class PatternReader(io.RawIOBase):
+    """
+    Unseekable file-like object returning size bytes of PATTERN
+    """
+
+    def __init__(self, size, offset=0):
+        self.remaining = size
+        self.offset = offset
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.remaining
+        buffer = bytearray(min(size, self.remaining))
+        count = self.readinto(buffer)
+        return bytes(buffer[:count])
+
+    def readinto(self, buffer):
+        count = min(len(buffer), self.remaining)
+        written = 0
+        while written < count:
+            start = (self.offset + written) % len(PATTERN)
+            chunk = min(count - written, len(PATTERN) - start)
+            buffer[written:written + chunk] = PATTERN[start:start + chunk]
+            written += chunk
+        self.offset += count
+        self.remaining -= count
+        return count
+
+
+class _Paginator:
+    def __init__(self, client, operation):
+        self.client = client
+        self.operation = operation
+
+    def paginate(self, **params):
+        method = getattr(self.client, self.operation)
+        while True:
+            page = method(**params)
+            yield page
+            if not page.get('IsTruncated'):
+                return
+            params['ContinuationToken'] = page['NextContinuationToken']
+
+
+class InMemoryS3Client:
+    def __init__(self, latency=0.0, keep_uploads=True):
+        """
+        @param latency: float - seconds added to every call
+        @param keep_uploads: bool - store the uploaded bytes, or only their size
+        """
+        self.latency = latency
+        self.keep_uploads = keep_uploads
+        self.buckets = {}
+        self._sorted_keys = {}
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def _count(self, operation):
+        with self._lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _bucket(self, name):
+        if name not in self.buckets:
+            raise ClientError({'Error': {'Code': 'NoSuchBucket', 'Message': name}}, 'Bucket')
+        return self.buckets[name]
+
+    def _keys(self, name):
+        # Sorted keys, rebuilt after the bucket changed
+        keys = self._sorted_keys.get(name)
+        if keys is None:
+            keys = self._sorted_keys[name] = sorted(self._bucket(name))
+        return keys
+
+    def _object(self, bucket, key, operation):
+        obj = self._bucket(bucket).get(key)
+        if obj is None:
+            raise ClientError({'Error': {'Code': 'NoSuchKey', 'Message': key}}, operation)
+        return obj
+
+    def _store(self, bucket, key, data, content_type='binary/octet-stream', metadata=None):
+        if isinstance(data, SyntheticBody):
+            etag = hashlib.md5(f'synthetic-{len(data)}'.encode()).hexdigest()
+        else:
+            etag = hashlib.md5(data).hexdigest()
+        obj = {
+            'Body': data,
+            'ETag': f'"{etag}"',
+            'LastModified': datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0),
+            'ContentType': content_type,
+            'Metadata': dict(metadata or {}),
+        }
+        with self._lock:
+            bucket_objects = self._bucket(bucket)
+            if key not in bucket_objects:
+                self._sorted_keys.pop(bucket, None)
+            bucket_objects[key] = obj
+        return obj
+
+    def _delete(self, bucket, key):
+        with self._lock:
+            if self._bucket(bucket).pop(key, None) is not None:
+                self._sorted_keys.pop(bucket, None)
+
+    def put_synthetic_object(self, Bucket, Key, Size, ContentType='application/pdf'):
+        """
+        Store an object of Size bytes without allocating them
+        """
+        return self._store(Bucket, Key, SyntheticBody(Size), ContentType)
+
+    def create_bucket(self, Bucket, **kwargs):
+        self._count('CreateBucket')
+        self.buckets.setdefault(Bucket, {})
+        return {}
+
+    def list_buckets(self, **kwargs):
+        self._count('ListBuckets')
+        return {'Buckets': [{'Name': name} for name in sorted(self.buckets)]}
+
+    def put_object(self, Bucket, Key, Body=b'', ContentType='binary/octet-stream', **kwargs):
+        self._count('PutObject')
+        if hasattr(Body, 'read'):
+            Body = Body.read()
+        obj = self._store(Bucket, Key, Body, ContentType)
+        return {'ETag': obj['ETag'], 'ResponseMetadata': {'HTTPStatusCode': 200}}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        self._count('UploadFileobj')
+        chunk_size = Config.multipart_chunksize if Config else 8 * 1024 * 1024
+        parts, size = [], 0
+        while True:
+            chunk = Fileobj.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if self.keep_uploads:
+                parts.append(chunk)
+        body = b''.join(parts) if self.keep_uploads else SyntheticBody(size)
+        self._store(Bucket, Key, body, (ExtraArgs or {}).get('ContentType', 'binary/octet-stream'))
+
+    def head_object(self, Bucket, Key, **kwargs):
+        self._count('HeadObject')
+        obj = self._object(Bucket, Key, 'HeadObject')
+        return {
+            'ETag': obj['ETag'],
+            'LastModified': obj['LastModified'],
+            'ContentLength': len(obj['Body']),
+            'ContentType': obj['ContentType'],
+            'Metadata': obj['Metadata'],
+        }
+
+    def get_object(self, Bucket, Key, Range=None, **kwargs):
+        self._count('GetObject')
+        obj = self._object(Bucket, Key, 'GetObject')
+        data = obj['Body']
+        size = len(data)
+        response = {
+            'ETag': obj['ETag'],
+            'LastModified': obj['LastModified'],
+            'ContentType': obj['ContentType'],
+        }
+        start, end = 0, size - 1
+        if Range:
+            first, last = Range[len('bytes='):].split('-')
+            if not first:
+                start, end = max(size - int(last), 0), size - 1
+            else:
+                start, end = int(first), min(int(last) if last else size - 1, size - 1)
+            if start >= size:
+                raise ClientError({'Error': {'Code': 'InvalidRange', 'ActualObjectSize': str(size)}}, 'GetObject')
+            response['ContentRange'] = f'bytes {start}-{end}/{size}'
+
+        length = max(end - start + 1, 0)
+        if isinstance(data, SyntheticBody):
+            raw = data.reader(start, end + 1)
+        else:
+            raw = io.BytesIO(data[start:end + 1])
+        response['Body'] = StreamingBody(raw, length)
+        response['ContentLength'] = length
+        return response
+
+    def copy_object(self, Bucket, CopySource, Key, MetadataDirective='COPY', ContentType=None, Metadata=None, **kwargs):
+        self._count('CopyObject')
+        if isinstance(CopySource, str):
+            source_bucket, source_key = CopySource.split('/', 1)
+        else:
+            source_bucket, source_key = CopySource['Bucket'], CopySource['Key']
+        source = self._object(source_bucket, source_key, 'CopyObject')
+        if MetadataDirective == 'REPLACE':
+            obj = self._store(Bucket, Key, source['Body'], ContentType or 'binary/octet-stream', Metadata)
+        else:
+            obj = self._store(Bucket, Key, source['Body'], source['ContentType'], source['Metadata'])
+        return {
+            'CopyObjectResult': {'ETag': obj['ETag'], 'LastModified': obj['LastModified']},
+            'ResponseMetadata': {'HTTPStatusCode': 200},
+        }
+
+    def copy(self, CopySource, Bucket, Key, ExtraArgs=None, Config=None, **kwargs):
+        # Like the multipart copy of boto3, the metadata of the source is not kept
+        # and the copy gets a multipart ETag that differs from the source's
+        self.copy_object(Bucket=Bucket, CopySource=CopySource, Key=Key, MetadataDirective='REPLACE', **(ExtraArgs or {}))
+        obj = self._object(Bucket, Key, 'CopyObject')
+        parts = -(-len(obj['Body']) // (Config.multipart_chunksize if Config else 8 * 1024 * 1024)) or 1
+        obj['ETag'] = f'"{hashlib.md5(obj["ETag"].encode()).hexdigest()}-{parts}"'
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        self._count('DeleteObject')
+        self._delete(Bucket, Key)
+        return {'ResponseMetadata': {'HTTPStatusCode': 204}}
+
+    def delete_objects(self, Bucket, Delete, **kwargs):
+        self._count('DeleteObjects')
+        deleted = []
+        for item in Delete['Objects']:
+            self._delete(Bucket, item['Key'])
+            deleted.append({'Key': item['Key']})
+        return {'Deleted': deleted, 'Errors': []}
+
+    def list_objects_v2(self, Bucket, Prefix='', Delimiter=None, MaxKeys=1000, ContinuationToken=None, StartAfter=None, **kwargs):
+        self._count('ListObjectsV2')
+        with self._lock:
+            keys = self._keys(Bucket)
+            objects = self.buckets[Bucket]
+
+        marker = ContinuationToken or StartAfter
+        index = bisect.bisect_right(keys, marker) if marker and marker >= Prefix else bisect.bisect_left(keys, Prefix)
+
+        contents, prefixes = [], []
+        truncated = False
+        last = None
+        while index < len(keys):
+            key = keys[index]
+            if not key.startswith(Prefix):
+                break
+            if len(contents) + len(prefixes) >= MaxKeys:
+                truncated = True
+                break
+
+            if Delimiter:
+                position = key.find(Delimiter, len(Prefix))
+                if position != -1:
+                    common = key[:position + 1]
+                    prefixes.append(common)
+                    # Continue after every key under the common prefix
+                    last = common + '\U0010ffff'
+                    index = bisect.bisect_left(keys, last)
+                    continue
+
+            obj = objects[key]
+            contents.append({
+                'Key': key,
+                'Size': len(obj['Body']),
+                'LastModified': obj['LastModified'],
+                'ETag': obj['ETag'],
+            })
+            last = key
+            index += 1
+
+        response = {
+            'CommonPrefixes': [{'Prefix': prefix} for prefix in prefixes],
+            'IsTruncated': truncated,
+            'KeyCount': len(contents) + len(prefixes),
+        }
+        if contents:
+            response['Contents'] = contents
+        if truncated:
+            response['NextContinuationToken'] = last
+        return response
+
+    def list_objects(self, Bucket, Prefix='', **kwargs):
+        return self.list_objects_v2(Bucket=Bucket, Prefix=Prefix, **kwargs)
+
+    def get_paginator(self, operation):
+        return _Paginator(self, operation)
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        return f"https://{Params['Bucket']}.s3.local/{Params['Key']}?X-Amz-Expires={ExpiresIn}"
+
+    def generate_presigned_post(self, Bucket, Key, Fields=None, Conditions=None, ExpiresIn=3600):
+        return {'url': f'https://{Bucket}.s3.local/', 'fields': dict(Fields or {}, key=Key)}
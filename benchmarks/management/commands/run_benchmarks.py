@@ -0,0 +1,104 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings, setup_databases, teardown_databases
+
+from benchmarks.runner import compare, environment, run_benchmark
+from benchmarks.scenarios import BASE_SETTINGS, SCALES, SCENARIOS, BenchmarkEnv
+
+
+BASELINES_DIR = Path(__file__).resolve().parents[2] / 'baselines'
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the file and sharing APIs against an in-memory S3 and a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+        parser.add_argument('--scenario', action='append', default=[], help='Run the scenarios whose name starts with this, repeatable')
+        parser.add_argument('--iterations', type=int, help='Override the iterations of every scenario')
+        parser.add_argument('--latency', type=float, default=2.0, help='Milliseconds added to every S3 call')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--baseline', help='Results JSON to compare with, defaults to benchmarks/baselines/<scale>.json')
+        parser.add_argument('--save-baseline', action='store_true', help='Write the results as the baseline of the scale')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Relative change of p95 or throughput counted as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--keepdb', action='store_true', help='Keep the test database between runs')
+        parser.add_argument('--list', action='store_true', help='List the scenarios and exit')
+
+    def selected(self, scale, prefixes):
+        variants = []
+        for scenario in SCENARIOS.values():
+            for name, size in scenario.variants(scale):
+                if not prefixes or any(name.startswith(prefix) for prefix in prefixes):
+                    variants.append((scenario, name, size))
+        return variants
+
+    def handle(self, *args, **options):
+        scale = options['scale']
+        variants = self.selected(scale, options['scenario'])
+        if options['list']:
+            for _, name, _ in variants:
+                self.stdout.write(name)
+            return
+        if not variants:
+            raise CommandError('No scenario matches')
+
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        env = BenchmarkEnv(latency=options['latency'] / 1000)
+        env.install()
+        results = {}
+        try:
+            for scenario, name, size in variants:
+                with override_settings(**{**BASE_SETTINGS, **scenario.settings}):
+                    env.reset()
+                    benchmark = scenario.func(env, size)
+                    iterations = options['iterations'] or benchmark.iterations or 10
+                    results[name] = run_benchmark(benchmark, iterations)
+                self.write_row(name, results[name])
+        finally:
+            env.uninstall()
+            teardown_databases(old_config, verbosity=0, keepdb=options['keepdb'])
+
+        report = {
+            'environment': environment(),
+            'scale': scale,
+            'latency_ms': options['latency'],
+            'results': results,
+        }
+        if options['output']:
+            Path(options['output']).write_text(json.dumps(report, indent=2))
+
+        baseline_path = Path(options['baseline']) if options['baseline'] else BASELINES_DIR / f'{scale}.json'
+        if options['save_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+            self.stdout.write(f'Baseline written to {baseline_path}')
+            return
+
+        if baseline_path.exists():
+            self.report_comparison(results, json.loads(baseline_path.read_text()), options)
+
+    def write_row(self, name, result):
+        self.stdout.write(
+            f"{name:<36} p50 {result['p50_ms']:>10.2f} ms  p95 {result['p95_ms']:>10.2f} ms  "
+            f"p99 {result['p99_ms']:>10.2f} ms  {result['throughput']:>10.1f} {result['unit']}/s  "
+            f"peak rss {result['peak_rss_mb']:>7.1f} MB"
+        )
+
+    def report_comparison(self, results, baseline, options):
+        rows = compare(results, baseline['results'], options['threshold'])
+        regressions = [row for row in rows if row['regressed']]
+
+        self.stdout.write('')
+        for row in rows:
+            line = (
+                f"{row['scenario']:<36} p95 {row['baseline_p95_ms']:>10.2f} -> {row['p95_ms']:>10.2f} ms "
+                f"(x{row['p95_ratio']:.2f}), throughput x{row['throughput_ratio']:.2f}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row['regressed'] else line)
+
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f'{len(regressions)} scenario(s) regressed by more than {options["threshold"]:.0%}')
@@ -0,0 +1,152 @@
+import gc
+import math
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+
+
+class Benchmark:
+    """
+    What a scenario returns: the operation to time and how to count its work
+    @param operation: callable() - timed once per iteration, may return the
+        number of units it processed (defaults to units_per_call)
+    @param before: callable() - optional, run untimed before every iteration
+    @param unit: str - what the throughput counts (requests, MB, ...)
+    @param units_per_call: float
+    @param iterations: int - default number of iterations
+    """
+
+    def __init__(self, operation, before=None, unit='requests', units_per_call=1, iterations=None):
+        self.operation = operation
+        self.before = before
+        self.unit = unit
+        self.units_per_call = units_per_call
+        self.iterations = iterations
+
+
+class RssSampler:
+    """
+    Sample the resident set size of the process in a background thread and
+    keep the peak. Reads /proc/self/statm on Linux and falls back to the
+    lifetime maximum reported by getrusage elsewhere.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.start = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def current():
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, self.current())
+
+    def __enter__(self):
+        self.start = self.peak = self.current()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.current())
+
+
+def percentile(values, fraction):
+    """
+    Nearest-rank percentile of a list of numbers
+    """
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = max(math.ceil(fraction * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run_benchmark(benchmark, iterations, warmup=1):
+    """
+    Time a Benchmark and summarize the latencies
+    @param benchmark: Benchmark
+    @param iterations: int
+    @param warmup: int - untimed iterations run first
+    @return: dict
+    """
+    for _ in range(warmup):
+        if benchmark.before:
+            benchmark.before()
+        benchmark.operation()
+
+    gc.collect()
+    durations = []
+    units = 0.0
+    with RssSampler() as rss:
+        for _ in range(iterations):
+            if benchmark.before:
+                benchmark.before()
+            started_at = time.perf_counter()
+            result = benchmark.operation()
+            durations.append(time.perf_counter() - started_at)
+            units += result if isinstance(result, (int, float)) and not isinstance(result, bool) else benchmark.units_per_call
+
+    total = sum(durations)
+    return {
+        'iterations': iterations,
+        'mean_ms': round(total / iterations * 1000, 3),
+        'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+        'max_ms': round(max(durations) * 1000, 3),
+        'throughput': round(units / total, 3) if total else 0.0,
+        'unit': benchmark.unit,
+        'peak_rss_mb': round(rss.peak / 2 ** 20, 1),
+        'rss_growth_mb': round((rss.peak - rss.start) / 2 ** 20, 1),
+    }
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline. A scenario regresses when its p95 grew,
+    or its throughput dropped, by more than threshold (e.g. 0.2 for 20%).
+    @param results: dict - scenario -> summary
+    @param baseline: dict - scenario -> summary
+    @param threshold: float
+    @return: list of dicts - one per scenario present in both
+    """
+    rows = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        p95_ratio = result['p95_ms'] / previous['p95_ms'] if previous['p95_ms'] else 1.0
+        throughput_ratio = result['throughput'] / previous['throughput'] if previous['throughput'] else 1.0
+        rows.append({
+            'scenario': name,
+            'p95_ms': result['p95_ms'],
+            'baseline_p95_ms': previous['p95_ms'],
+            'p95_ratio': round(p95_ratio, 3),
+            'throughput_ratio': round(throughput_ratio, 3),
+            'regressed': p95_ratio > 1 + threshold or throughput_ratio < 1 - threshold,
+        })
+    return rows
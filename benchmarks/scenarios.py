@@ -0,0 +1,484 @@
+"""
+Benchmark scenarios.
+
+A scenario is a function decorated with @scenario that prepares its data
+in a BenchmarkEnv and returns a Benchmark. Scenarios with `sizes` are run
+once per size of the selected scale and reported as name[size].
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from datetime import timezone as dt_timezone
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.conf import settings
+from django.core.cache import caches
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+
+from aws_auth_service.authentication import CachedJSONWebTokenAuthentication, CachedTokenValidator, verified_tokens
+from aws_files_api import async_views as aws_async_views
+from aws_files_api import jobs as aws_jobs
+from aws_files_api import views as aws_views
+from aws_files_api.cache import listing_cache
+from aws_files_api.serializers import ResponseFileSerializer
+from benchmarks.fake_s3 import InMemoryS3Client, PatternReader
+from benchmarks.runner import Benchmark
+from config.renderers import FastJSONRenderer
+from shared_files.models import SharedFile
+from shared_files.services import SharedFileService, encode_shared_cursor
+from shared_files.views import SharedFileByFileKey, SharedFileView
+
+
+MB = 2 ** 20
+
+SCALES = {
+    'small': {
+        'listing': [10, 1000, 10000],
+        'transfer_mb': [1, 16, 64],
+        'folder_objects': [500],
+        'shares': [10000],
+        'concurrency': [100],
+    },
+    'full': {
+        'listing': [10, 1000, 100000],
+        'transfer_mb': [1, 50, 500],
+        'folder_objects': [5000],
+        'shares': [1000000],
+        'concurrency': [500],
+    },
+}
+
+# Settings every scenario starts from, so results do not depend on the local .env
+BASE_SETTINGS = {
+    'LISTING_CACHE_ENABLED': False,
+    'FILE_INDEX_READS_ENABLED': False,
+    'FOLDER_JOBS_ASYNC': False,
+    'REQUEST_METRICS_LOG': False,
+    'COGNITO_AWS_REGION': 'us-east-1',
+    'COGNITO_USER_POOL': 'us-east-1_benchmark',
+    'COGNITO_AUDIENCE': 'benchmark',
+}
+
+SCENARIOS = {}
+
+
+class Scenario:
+    def __init__(self, name, func, sizes=None, settings=None):
+        self.name = name
+        self.func = func
+        self.sizes = sizes
+        self.settings = settings or {}
+
+    def variants(self, scale):
+        """
+        Return the (name, size) pairs to run at a scale
+        """
+        if self.sizes is None:
+            return [(self.name, None)]
+        return [(f'{self.name}[{size}]', size) for size in SCALES[scale][self.sizes]]
+
+
+def scenario(name, sizes=None, settings=None):
+    def decorator(func):
+        SCENARIOS[name] = Scenario(name, func, sizes, settings)
+        return func
+    return decorator
+
+
+class BenchmarkEnv:
+    """
+    Shared state of a benchmark run: the fake S3 wired into the services
+    used by the views, a local RSA key standing in for the Cognito user pool
+    and helpers to build authenticated requests
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.s3 = InMemoryS3Client(latency=latency, keep_uploads=False)
+        self.factory = RequestFactory()
+        self.shared_file_service = SharedFileService()
+        self._services = [
+            aws_views.file_service,
+            aws_async_views.async_file_service.file_service,
+            aws_jobs.file_service,
+        ]
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self._tokens = {}
+        self._seeded = {}
+
+    @property
+    def file_service(self):
+        return aws_views.file_service
+
+    def install(self):
+        for service in self._services:
+            service._s3_client = self.s3
+
+    def uninstall(self):
+        for service in self._services:
+            service._s3_client = None
+
+    def reset(self):
+        """
+        Start a scenario with empty caches
+        """
+        self.s3.latency = self.latency
+        caches[settings.LISTING_CACHE_ALIAS].clear()
+        listing_cache.hits = listing_cache.misses = 0
+        verified_tokens.clear()
+
+        validator = CachedJSONWebTokenAuthentication().get_token_validator(None)
+        CachedTokenValidator._keys[validator.pool_url] = {'benchmark': self._private_key.public_key()}
+        CachedTokenValidator._fetched_at[validator.pool_url] = time.monotonic()
+
+    def token(self, username):
+        if username not in self._tokens:
+            validator = CachedJSONWebTokenAuthentication().get_token_validator(None)
+            payload = {
+                'username': username,
+                'email': f'{username}@example.com',
+                'aud': settings.COGNITO_AUDIENCE,
+                'iss': validator.pool_url,
+                'exp': int(time.time()) + 24 * 3600,
+            }
+            self._tokens[username] = jwt.encode(payload, self._private_key, algorithm='RS256', headers={'kid': 'benchmark'})
+        return self._tokens[username]
+
+    def bucket(self, username):
+        bucket_name = f'{username}-security-project'
+        self.s3.create_bucket(Bucket=bucket_name)
+        return bucket_name
+
+    def seed_folder(self, username, folder_key, count, size=100 * 1024):
+        bucket_name = self.bucket(username)
+        self.s3.put_synthetic_object(Bucket=bucket_name, Key=f'{folder_key}/', Size=0)
+        for index in range(count):
+            self.s3.put_synthetic_object(Bucket=bucket_name, Key=f'{folder_key}/file-{index:07d}.pdf', Size=size)
+        return bucket_name
+
+    def once(self, key, seed):
+        """
+        Run seed the first time key is seen and return its result afterwards
+        """
+        if key not in self._seeded:
+            self._seeded[key] = seed()
+        return self._seeded[key]
+
+    def request(self, method, path, username, data=None, **extra):
+        request = getattr(self.factory, method)(path, data, HTTP_AUTHORIZATION=f'Bearer {self.token(username)}', **extra)
+        return request
+
+    def call(self, view, method, username, data=None, **extra):
+        response = view.as_view()(self.request(method, '/', username, data, **extra))
+        if hasattr(response, 'render'):
+            response.render()
+        if response.status_code >= 400:
+            raise Exception(f'{view.__name__} returned {response.status_code}: {getattr(response, "content", b"")[:200]}')
+        return response
+
+    @staticmethod
+    def consume(response):
+        size = 0
+        for chunk in response.streaming_content:
+            size += len(chunk)
+        return size
+
+
+# LISTINGS
+
+@scenario('list_folder', sizes='listing')
+def list_folder(env, size):
+    username = f'list{size}'
+    env.once(('folder', username), lambda: env.seed_folder(username, 'docs', size))
+    return Benchmark(
+        lambda: env.call(aws_views.FilesView, 'get', username, {'folder_key': 'docs'}),
+        iterations=5 if size >= 50000 else 20,
+    )
+
+
+@scenario('list_folder_cached', sizes='listing', settings={'LISTING_CACHE_ENABLED': True})
+def list_folder_cached(env, size):
+    username = f'list{size}'
+    env.once(('folder', username), lambda: env.seed_folder(username, 'docs', size))
+    return Benchmark(lambda: env.call(aws_views.FilesView, 'get', username, {'folder_key': 'docs'}), iterations=50)
+
+
+@scenario('list_folder_index', sizes='listing', settings={'FILE_INDEX_READS_ENABLED': True})
+def list_folder_index(env, size):
+    username = f'list{size}'
+    bucket_name = env.once(('folder', username), lambda: env.seed_folder(username, 'docs', size))
+    env.once(('index', username), lambda: env.file_service.reindex_bucket(bucket_name))
+    return Benchmark(
+        lambda: env.call(aws_views.FilesView, 'get', username, {'folder_key': 'docs'}),
+        iterations=5 if size >= 50000 else 20,
+    )
+
+
+@scenario('list_folder_page', sizes='listing')
+def list_folder_page(env, size):
+    username = f'list{size}'
+    env.once(('folder', username), lambda: env.seed_folder(username, 'docs', size))
+    return Benchmark(
+        lambda: env.call(aws_views.FilesView, 'get', username, {'folder_key': 'docs', 'page_size': 100}),
+        iterations=50,
+    )
+
+
+# SERIALIZATION
+
+class DRFFileSerializer(ResponseFileSerializer):
+    """
+    ResponseFileSerializer without the fast list serializer, for reference
+    """
+
+    class Meta:
+        pass
+
+
+def listing_objects(size):
+    modified = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+    objects = [{'Key': f'docs/sub-{index}/', 'Size': 0, 'LastModified': None} for index in range(size // 100)]
+    objects += [
+        {'Key': f'docs/file-{index:07d}.pdf', 'Size': 100 * 1024, 'LastModified': modified + timedelta(seconds=index // 10)}
+        for index in range(size - len(objects))
+    ]
+    return objects
+
+
+@scenario('serialize_listing_drf', sizes='listing')
+def serialize_listing_drf(env, size):
+    objects = listing_objects(size)
+    renderer = JSONRenderer()
+    return Benchmark(lambda: renderer.render(DRFFileSerializer(objects, many=True).data), iterations=20)
+
+
+@scenario('serialize_listing', sizes='listing')
+def serialize_listing(env, size):
+    objects = listing_objects(size)
+    renderer = FastJSONRenderer()
+    return Benchmark(lambda: renderer.render(ResponseFileSerializer(objects, many=True).data), iterations=20)
+
+
+@scenario('search_files', sizes='listing')
+def search_files(env, size):
+    username = f'list{size}'
+    bucket_name = env.once(('folder', username), lambda: env.seed_folder(username, 'docs', size))
+    env.once(('index', username), lambda: env.file_service.reindex_bucket(bucket_name))
+    return Benchmark(lambda: env.call(aws_views.FileSearch, 'get', username, {'q': 'file-00012'}), iterations=20)
+
+
+# TRANSFERS
+
+@scenario('upload', sizes='transfer_mb')
+def upload(env, size):
+    username = 'transfer'
+    env.bucket(username)
+    length = size * MB
+
+    def operation():
+        request = env.factory.generic(
+            'PUT',
+            f'/?file_name=upload-{size}mb.pdf',
+            CONTENT_TYPE='application/pdf',
+            CONTENT_LENGTH=str(length),
+            HTTP_AUTHORIZATION=f'Bearer {env.token(username)}',
+            **{'wsgi.input': PatternReader(length)},
+        )
+        response = aws_views.StreamUpload.as_view()(request)
+        response.render()
+        if response.status_code != 201:
+            raise Exception(f'StreamUpload returned {response.status_code}: {response.content[:200]}')
+
+    return Benchmark(operation, unit='MB', units_per_call=size, iterations=5)
+
+
+@scenario('download', sizes='transfer_mb')
+def download(env, size):
+    username = 'transfer'
+    bucket_name = env.bucket(username)
+    env.s3.put_synthetic_object(Bucket=bucket_name, Key=f'download-{size}mb.pdf', Size=size * MB)
+
+    def operation():
+        response = env.call(aws_views.DownloadFile, 'get', username, {'file_key': f'download-{size}mb.pdf'})
+        return env.consume(response) / MB
+
+    return Benchmark(operation, unit='MB', iterations=5)
+
+
+@scenario('archive_folder', sizes='folder_objects')
+def archive_folder(env, size):
+    username = f'archive{size}'
+    env.seed_folder(username, 'export', size)
+
+    def operation():
+        response = env.call(aws_views.FileArchive, 'get', username, {'folder_key': 'export'})
+        return env.consume(response) / MB
+
+    return Benchmark(operation, unit='MB', iterations=5)
+
+
+# FOLDER OPERATIONS
+
+@scenario('rename_folder', sizes='folder_objects')
+def rename_folder(env, size):
+    username = f'rename{size}'
+    bucket_name = env.seed_folder(username, 'src', size)
+    names = ['src', 'dst']
+
+    def operation():
+        folder_key, new_folder_key = names
+        env.file_service.update_folder_name(
+            bucket_name,
+            f'{folder_key}/',
+            f'{new_folder_key}/',
+            on_renamed=lambda: env.shared_file_service.update_folder_key(folder_key, new_folder_key, username),
+        )
+        names.reverse()
+
+    return Benchmark(operation, unit='objects', units_per_call=size, iterations=5)
+
+
+@scenario('delete_folder', sizes='folder_objects')
+def delete_folder(env, size):
+    username = f'delete{size}'
+    bucket_name = env.bucket(username)
+
+    def operation():
+        response = env.file_service.delete_folder(bucket_name, 'trash/')
+        env.shared_file_service.delete_folder('trash', username)
+        return response['deleted']
+
+    return Benchmark(
+        operation,
+        before=lambda: env.seed_folder(username, 'trash', size),
+        unit='objects',
+        iterations=5,
+    )
+
+
+# SHARES
+
+def seed_shares(env, size):
+    """
+    size shares received by one recipient from 100 owners, 10 recipients per file
+    """
+    rows = []
+    for index in range(size):
+        owner = f'owner{index % 100}'
+        rows.append(SharedFile(
+            owner_user_id=owner,
+            owner_user_email=f'{owner}@example.com',
+            bucket_name=owner,
+            file_key=f'folder{index % 50}/file-{index // 10}.pdf',
+            file_name=f'file-{index // 10}.pdf',
+            file_size=1024,
+            shared_with_user_id='recipient' if index % 10 == 0 else f'user{index % 10}',
+            shared_with_user_email='recipient@example.com',
+        ))
+        if len(rows) == 10000:
+            SharedFile.objects.bulk_create(rows, ignore_conflicts=True)
+            rows = []
+    if rows:
+        SharedFile.objects.bulk_create(rows, ignore_conflicts=True)
+    return size
+
+
+@scenario('share_list_first_page', sizes='shares')
+def share_list_first_page(env, size):
+    env.once(('shares', size), lambda: seed_shares(env, size))
+    return Benchmark(lambda: env.call(SharedFileView, 'get', 'recipient', {'page_size': 100}), iterations=50)
+
+
+@scenario('share_list_deep_page', sizes='shares')
+def share_list_deep_page(env, size):
+    env.once(('shares', size), lambda: seed_shares(env, size))
+    middle = (
+        SharedFile.objects
+        .filter(shared_with_user_id='recipient')
+        .order_by('-shared_at', '-id')
+        .values('shared_at', 'id')[size // 20]
+    )
+    cursor = encode_shared_cursor(middle['shared_at'], middle['id'])
+    return Benchmark(
+        lambda: env.call(SharedFileView, 'get', 'recipient', {'page_size': 100, 'cursor': cursor}),
+        iterations=50,
+    )
+
+
+@scenario('share_by_file_key', sizes='shares')
+def share_by_file_key(env, size):
+    env.once(('shares', size), lambda: seed_shares(env, size))
+    return Benchmark(lambda: env.call(SharedFileByFileKey, 'get', 'owner0', {'file_key': 'folder0/file-0.pdf'}), iterations=50)
+
+
+# AUTHENTICATION
+
+@scenario('auth_verify')
+def auth_verify(env, size):
+    authentication = CachedJSONWebTokenAuthentication()
+    request = env.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {env.token("auth")}')
+
+    def operation():
+        # A token never seen before: signature verified with the cached keys
+        verified_tokens.clear()
+        authentication.authenticate(request)
+
+    return Benchmark(operation, iterations=200)
+
+
+@scenario('auth_cached')
+def auth_cached(env, size):
+    authentication = CachedJSONWebTokenAuthentication()
+    request = env.factory.get('/', HTTP_AUTHORIZATION=f'Bearer {env.token("auth")}')
+    authentication.authenticate(request)
+    return Benchmark(lambda: authentication.authenticate(request), iterations=1000)
+
+
+# CONCURRENCY (WSGI threads vs ASGI event loop)
+
+CONCURRENCY_LATENCY = 0.02
+
+
+@scenario('concurrent_listing_wsgi', sizes='concurrency')
+def concurrent_listing_wsgi(env, size):
+    """
+    size listing requests at once on one worker with WEB_WORKER_THREADS
+    threads, every S3 call taking CONCURRENCY_LATENCY
+    """
+    username = 'concurrency'
+    env.once(('folder', username), lambda: env.seed_folder(username, 'docs', 20))
+    env.s3.latency = CONCURRENCY_LATENCY
+
+    def operation():
+        with ThreadPoolExecutor(max_workers=settings.WEB_WORKER_THREADS) as executor:
+            list(executor.map(
+                lambda _: env.call(aws_views.FilesView, 'get', username, {'folder_key': 'docs'}),
+                range(size),
+            ))
+
+    return Benchmark(operation, units_per_call=size, iterations=3)
+
+
+@scenario('concurrent_listing_asgi', sizes='concurrency')
+def concurrent_listing_asgi(env, size):
+    """
+    The same load served by the async view on one event loop
+    """
+    username = 'concurrency'
+    env.once(('folder', username), lambda: env.seed_folder(username, 'docs', 20))
+    env.s3.latency = CONCURRENCY_LATENCY
+    view = aws_async_views.AsyncFilesView.as_view()
+
+    async def run():
+        responses = await asyncio.gather(*[
+            view(env.request('get', '/', username, {'folder_key': 'docs'}))
+            for _ in range(size)
+        ])
+        failed = [response.status_code for response in responses if response.status_code != 200]
+        if failed:
+            raise Exception(f'AsyncFilesView returned {failed[0]}')
+
+    return Benchmark(lambda: asyncio.run(run()), units_per_call=size, iterations=3)
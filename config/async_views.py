@@ -0,0 +1,39 @@
+from django.contrib.auth.models import AnonymousUser
+from django.http import JsonResponse
+from django.views import View
+from rest_framework import exceptions
+from rest_framework.settings import api_settings
+
+from aws_files_api.async_services import run_blocking
+
+
+class AsyncAPIView(View):
+    """
+    Base class of the async views. DRF's APIView is sync only, so this view
+    runs the configured DRF authentication classes itself, in the shared
+    thread pool because validating a Cognito token may fetch its public keys
+    and create the user. Handlers must be `async def` and return Django
+    responses (e.g. JsonResponse).
+    """
+
+    @staticmethod
+    def authenticate(request):
+        """
+        This function return the user of the request, AnonymousUser when it
+        has no token
+        @param request: HttpRequest
+        @return: User
+        """
+        for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+            result = authentication_class().authenticate(request)
+            if result is not None:
+                return result[0]
+        return AnonymousUser()
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.user = await run_blocking(self.authenticate, request)
+        except exceptions.AuthenticationFailed as e:
+            return JsonResponse({"error": str(e.detail)}, status=401)
+
+        return await super().dispatch(request, *args, **kwargs)
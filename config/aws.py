@@ -0,0 +1,137 @@
+"""
+Process-wide boto3 clients.
+
+Clients are created lazily, once per process and service, and shared by
+every thread. boto3 clients are thread-safe, but their sockets must not be
+shared between processes, so the cache is dropped when the process id
+changes (e.g. in a prefork server after the fork).
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+from django.conf import settings
+
+from config.metrics import register_client_hooks
+
+
+_lock = threading.Lock()
+_pid = None
+_clients = {}
+_stats = {}
+
+
+def _client_config():
+    return Config(
+        max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=settings.AWS_CONNECT_TIMEOUT,
+        read_timeout=settings.AWS_READ_TIMEOUT,
+        retries={
+            'mode': 'adaptive',
+            'max_attempts': settings.AWS_MAX_ATTEMPTS,
+        },
+    )
+
+
+def _register_counters(client, service_name):
+    stats = _stats[service_name] = {
+        'requests': 0,
+        'in_flight': 0,
+        'peak_in_flight': 0,
+        'saturated': 0,
+    }
+    stats_lock = threading.Lock()
+
+    def before_send(**kwargs):
+        with stats_lock:
+            stats['requests'] += 1
+            stats['in_flight'] += 1
+            stats['peak_in_flight'] = max(stats['peak_in_flight'], stats['in_flight'])
+            if stats['in_flight'] > settings.AWS_MAX_POOL_CONNECTIONS:
+                stats['saturated'] += 1
+
+    def after_send(**kwargs):
+        with stats_lock:
+            stats['in_flight'] -= 1
+
+    # needs-retry is emitted after every attempt, whether it failed or not
+    client.meta.events.register('before-send', before_send)
+    client.meta.events.register('needs-retry', after_send)
+
+
+def get_client(service_name):
+    """
+    This function return the shared client of an AWS service
+    @param service_name: str - e.g. s3, cognito-idp
+    @return: botocore client
+    """
+    global _pid
+
+    client = _clients.get(service_name)
+    if client is not None and _pid == os.getpid():
+        return client
+
+    with _lock:
+        if _pid != os.getpid():
+            _clients.clear()
+            _stats.clear()
+            _pid = os.getpid()
+
+        if service_name not in _clients:
+            session = boto3.session.Session(
+                aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+                region_name=settings.AWS_S3_REGION_NAME,
+            )
+            client = session.client(service_name, config=_client_config())
+            _register_counters(client, service_name)
+            if service_name == 's3':
+                register_client_hooks(client)
+            _clients[service_name] = client
+
+        return _clients[service_name]
+
+
+def _connections_created(client):
+    """
+    Connections opened by the urllib3 pools of a client. They are only
+    reachable through private attributes of botocore, so None is returned
+    when those are missing, e.g. after a botocore upgrade.
+    """
+    endpoint = getattr(client, '_endpoint', None)
+    http_session = getattr(endpoint, 'http_session', None)
+    manager = getattr(http_session, '_manager', None)
+    pools = getattr(manager, 'pools', None)
+    if pools is None:
+        return None
+
+    try:
+        return sum(
+            getattr(pools.get(key), 'num_connections', 0)
+            for key in list(pools.keys())
+        )
+    except (AttributeError, TypeError):
+        return None
+
+
+def client_stats():
+    """
+    This function return the connection counters of every client of the process.
+    connections_created lower than requests means connections are being
+    reused (it is missing when botocore does not expose it); saturated counts
+    requests sent while every pooled connection was busy.
+    @return: dict
+    """
+    result = {}
+    for service_name, client in list(_clients.items()):
+        stats = dict(_stats.get(service_name, {}))
+        stats['max_pool_connections'] = settings.AWS_MAX_POOL_CONNECTIONS
+
+        connections_created = _connections_created(client)
+        if connections_created is not None:
+            stats['connections_created'] = connections_created
+
+        result[service_name] = stats
+    return result
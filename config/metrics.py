@@ -0,0 +1,274 @@
+"""
+Request metrics.
+
+Every request gets a RequestMetrics in a context variable. The boto3 event
+hooks and the database execute wrapper add their timings to the metrics
+of the current request, if any, and to the process totals exported in
+Prometheus format by the /metrics endpoint. Context variables follow the
+request into the async views' thread pool (see run_blocking), but not into
+the threads of boto3 transfers or folder operations; their calls only
+count in the process totals.
+
+Totals are kept per process, so each worker exposes its own.
+"""
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+current_request = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.s3_calls = defaultdict(lambda: [0, 0.0])
+        self.sql_queries = 0
+        self.sql_time = 0.0
+        self.serialize_time = 0.0
+        self.render_time = 0.0
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def add_s3_call(self, operation, duration):
+        with self._lock:
+            call = self.s3_calls[operation]
+            call[0] += 1
+            call[1] += duration
+
+    def add_sql_query(self, duration):
+        with self._lock:
+            self.sql_queries += 1
+            self.sql_time += duration
+
+    def add_serialize_time(self, duration):
+        with self._lock:
+            self.serialize_time += duration
+
+    @property
+    def s3_count(self):
+        return sum(count for count, _ in self.s3_calls.values())
+
+    @property
+    def s3_time(self):
+        return sum(duration for _, duration in self.s3_calls.values())
+
+    def elapsed(self):
+        return time.perf_counter() - self.started_at
+
+    def server_timing(self):
+        """
+        This function return the Server-Timing header of the request
+        @return: str
+        """
+        return ', '.join([
+            f's3;desc="S3 ({self.s3_count} calls)";dur={self.s3_time * 1000:.1f}',
+            f'db;desc="SQL ({self.sql_queries} queries)";dur={self.sql_time * 1000:.1f}',
+            f'serialize;dur={self.serialize_time * 1000:.1f}',
+            f'render;dur={self.render_time * 1000:.1f}',
+            f'total;dur={self.elapsed() * 1000:.1f}',
+        ])
+
+    def as_log(self):
+        return {
+            'duration_ms': round(self.elapsed() * 1000, 1),
+            's3_calls': self.s3_count,
+            's3_ms': round(self.s3_time * 1000, 1),
+            's3_operations': {
+                operation: {'calls': count, 'ms': round(duration * 1000, 1)}
+                for operation, (count, duration) in self.s3_calls.items()
+            },
+            'sql_queries': self.sql_queries,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'serialize_ms': round(self.serialize_time * 1000, 1),
+            'render_ms': round(self.render_time * 1000, 1),
+            'bytes_sent': self.bytes_sent,
+        }
+
+
+class Histogram:
+    def __init__(self):
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        # Buckets are cumulative, as Prometheus expects
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if value <= bound:
+                self.buckets[index] += 1
+
+
+class ProcessMetrics:
+    """
+    Totals of every request served by the process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)
+        self.request_durations = defaultdict(Histogram)
+        self.bytes_sent = 0
+        self.s3_calls = defaultdict(int)
+        self.s3_errors = defaultdict(int)
+        self.s3_durations = defaultdict(Histogram)
+        self.sql_queries = 0
+        self.sql_time = 0.0
+
+    def add_request(self, method, route, status, duration):
+        with self._lock:
+            self.requests[(method, route, status)] += 1
+            self.request_durations[route].observe(duration)
+
+    def add_bytes(self, count):
+        with self._lock:
+            self.bytes_sent += count
+
+    def add_s3_call(self, operation, duration, failed):
+        with self._lock:
+            self.s3_calls[operation] += 1
+            if failed:
+                self.s3_errors[operation] += 1
+            self.s3_durations[operation].observe(duration)
+
+    def add_sql_query(self, duration):
+        with self._lock:
+            self.sql_queries += 1
+            self.sql_time += duration
+
+    def render(self, gauges=None, counters=None):
+        """
+        This function return the metrics in the Prometheus text format
+        @param gauges: dict - name -> list of (labels, value) exported as gauges
+        @param counters: dict - name -> list of (labels, value) of totals that only grow, exported as <name>_total counters
+        @return: str
+        """
+        lines = []
+
+        def histogram(name, label, histograms):
+            lines.append(f'# TYPE {name} histogram')
+            for value, hist in histograms.items():
+                for bound, count in zip(DURATION_BUCKETS, hist.buckets):
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {hist.count}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum:.6f}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {hist.count}')
+
+        with self._lock:
+            lines.append('# TYPE http_requests_total counter')
+            for (method, route, status), count in self.requests.items():
+                lines.append(f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {count}')
+            histogram('http_request_duration_seconds', 'route', self.request_durations)
+
+            lines.append('# TYPE http_response_bytes_total counter')
+            lines.append(f'http_response_bytes_total {self.bytes_sent}')
+
+            lines.append('# TYPE aws_s3_calls_total counter')
+            for operation, count in self.s3_calls.items():
+                lines.append(f'aws_s3_calls_total{{operation="{operation}"}} {count}')
+            lines.append('# TYPE aws_s3_call_errors_total counter')
+            for operation, count in self.s3_errors.items():
+                lines.append(f'aws_s3_call_errors_total{{operation="{operation}"}} {count}')
+            histogram('aws_s3_call_duration_seconds', 'operation', self.s3_durations)
+
+            lines.append('# TYPE db_queries_total counter')
+            lines.append(f'db_queries_total {self.sql_queries}')
+            lines.append('# TYPE db_query_duration_seconds_total counter')
+            lines.append(f'db_query_duration_seconds_total {self.sql_time:.6f}')
+
+        def samples(name, metric_type, values):
+            lines.append(f'# TYPE {name} {metric_type}')
+            for labels, value in values:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{name}{{{label_text}}} {value}' if label_text else f'{name} {value}')
+
+        for name, values in (counters or {}).items():
+            samples(f'{name}_total', 'counter', values)
+        for name, values in (gauges or {}).items():
+            samples(name, 'gauge', values)
+
+        return '\n'.join(lines) + '\n'
+
+
+process_metrics = ProcessMetrics()
+
+
+def register_client_hooks(client):
+    """
+    Time every API call of a boto3 client. before-call and after-call wrap
+    the whole call, retries included.
+    @param client: botocore client
+    """
+    if not settings.REQUEST_METRICS_ENABLED:
+        return
+
+    def before_call(model, context, **kwargs):
+        context['metrics_call'] = (model.name, time.perf_counter())
+
+    def record(context, failed):
+        call = context.pop('metrics_call', None)
+        if call is None:
+            return
+        operation, started_at = call
+        duration = time.perf_counter() - started_at
+        process_metrics.add_s3_call(operation, duration, failed)
+        metrics = current_request.get()
+        if metrics is not None:
+            metrics.add_s3_call(operation, duration)
+
+    def after_call(context, **kwargs):
+        record(context, False)
+
+    def after_call_error(context, **kwargs):
+        record(context, True)
+
+    # First, so a handler answering the call itself (e.g. a Stubber) cannot skip it
+    client.meta.events.register_first('before-call.*.*', before_call)
+    client.meta.events.register('after-call.*.*', after_call)
+    client.meta.events.register('after-call-error.*.*', after_call_error)
+
+
+def sql_timer(execute, sql, params, many, context):
+    """
+    Database execute wrapper installed on every connection
+    """
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started_at
+        process_metrics.add_sql_query(duration)
+        metrics = current_request.get()
+        if metrics is not None:
+            metrics.add_sql_query(duration)
+
+
+@contextmanager
+def serialize_timer():
+    """
+    Add the time spent in the block to the serialization time of the current
+    request, e.g. around building serializer.data before the Response
+    """
+    metrics = current_request.get()
+    if metrics is None:
+        yield
+        return
+    started_at = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_serialize_time(time.perf_counter() - started_at)
+
+
+def install_sql_timer(sender, connection, **kwargs):
+    # connection_created is sent on every (re)connection of the thread's wrapper
+    if sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_timer)
@@ -0,0 +1,123 @@
+import json
+import logging
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from config.metrics import RequestMetrics, current_request, install_sql_timer, process_metrics
+
+
+logger = logging.getLogger('config.metrics')
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure every request: S3 calls by operation, SQL queries, serialization
+    of the listings (see serialize_timer), rendering of the response by
+    DRF and bytes sent. The breakdown is returned in the
+    Server-Timing header, logged as one JSON line and added to the process
+    totals of /metrics. Streaming responses are logged once their last
+    chunk is sent.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = settings.REQUEST_METRICS_ENABLED
+        if self.enabled:
+            connection_created.connect(install_sql_timer, dispatch_uid='request_metrics_sql_timer')
+            for connection in connections.all(initialized_only=True):
+                install_sql_timer(None, connection)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.enabled:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        if not self.enabled:
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = current_request.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # DRF renders the Response after the view returns, time it separately
+        metrics = current_request.get()
+        if metrics is None:
+            return response
+
+        render = response.render
+
+        def timed_render():
+            started_at = metrics.elapsed()
+            try:
+                return render()
+            finally:
+                metrics.render_time += metrics.elapsed() - started_at
+
+        response.render = timed_render
+        return response
+
+    def finish(self, request, response, metrics):
+        response['Server-Timing'] = metrics.server_timing()
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = self._acount(response.streaming_content, request, response, metrics)
+            else:
+                response.streaming_content = self._count(response.streaming_content, request, response, metrics)
+            return response
+
+        metrics.bytes_sent = len(response.content)
+        self.record(request, response, metrics)
+        return response
+
+    def _count(self, chunks, request, response, metrics):
+        try:
+            for chunk in chunks:
+                metrics.bytes_sent += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, metrics)
+
+    async def _acount(self, chunks, request, response, metrics):
+        try:
+            async for chunk in chunks:
+                metrics.bytes_sent += len(chunk)
+                yield chunk
+        finally:
+            self.record(request, response, metrics)
+
+    def record(self, request, response, metrics):
+        match = request.resolver_match
+        route = match.route if match else 'unmatched'
+        process_metrics.add_request(request.method, route, response.status_code, metrics.elapsed())
+        process_metrics.add_bytes(metrics.bytes_sent)
+
+        if settings.REQUEST_METRICS_LOG:
+            logger.info(json.dumps({
+                'method': request.method,
+                'route': route,
+                'status': response.status_code,
+                **metrics.as_log(),
+            }))
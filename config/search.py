@@ -0,0 +1,18 @@
+"""
+Ranking of the file name searches.
+
+Results are ranked by the pg_trgm word similarity of the query in the
+searched column, the same trigrams the GIN indexes use to find the
+candidates. The indexes and the ranking need PostgreSQL.
+"""
+from django.contrib.postgres.search import TrigramWordSimilarity
+
+
+def search_rank(query, field):
+    """
+    This function return the expression ranking a row for a query
+    @param query: str
+    @param field: str - column searched
+    @return: Expression
+    """
+    return TrigramWordSimilarity(query, field)
@@ -21,10 +21,90 @@ AWS_SECRET_ACCESS_KEY = get_key(BASE_DIR / '.env', 'AWS_SECRET_ACCESS_KEY')
 AWS_S3_REGION_NAME = get_key(BASE_DIR / '.env', 'AWS_REGION')
 AWS_STORAGE_BUCKET_NAME = get_key(BASE_DIR / '.env', 'AWS_BUCKET_NAME')
 
+# AWS CLIENTS
+# Threads per web worker; the connection pool is sized from it
+WEB_WORKER_THREADS = int(get_key(BASE_DIR / '.env', 'WEB_WORKER_THREADS') or 8)
+AWS_CONNECT_TIMEOUT = int(get_key(BASE_DIR / '.env', 'AWS_CONNECT_TIMEOUT') or 5)
+AWS_READ_TIMEOUT = int(get_key(BASE_DIR / '.env', 'AWS_READ_TIMEOUT') or 60)
+AWS_MAX_ATTEMPTS = int(get_key(BASE_DIR / '.env', 'AWS_MAX_ATTEMPTS') or 5)
+# Threads running the boto3 calls of the async views (under ASGI)
+AWS_ASYNC_MAX_WORKERS = int(get_key(BASE_DIR / '.env', 'AWS_ASYNC_MAX_WORKERS') or 64)
+
+# S3 TRANSFERS
+# Size of the chunks read from the S3 body while streaming a download
+AWS_S3_DOWNLOAD_CHUNK_SIZE = int(get_key(BASE_DIR / '.env', 'AWS_S3_DOWNLOAD_CHUNK_SIZE') or 256 * 1024)
+
+# Multipart uploads: files above the threshold are sent in parallel parts
+AWS_S3_MULTIPART_THRESHOLD = int(get_key(BASE_DIR / '.env', 'AWS_S3_MULTIPART_THRESHOLD') or 8 * 1024 * 1024)
+AWS_S3_MULTIPART_CHUNKSIZE = int(get_key(BASE_DIR / '.env', 'AWS_S3_MULTIPART_CHUNKSIZE') or 8 * 1024 * 1024)
+AWS_S3_MAX_CONCURRENCY = int(get_key(BASE_DIR / '.env', 'AWS_S3_MAX_CONCURRENCY') or 10)
+# Objects copied in parallel when a folder is renamed
+AWS_S3_COPY_CONCURRENCY = int(get_key(BASE_DIR / '.env', 'AWS_S3_COPY_CONCURRENCY') or 16)
+# ZIP exports (files/archive/): objects read ahead concurrently and bytes buffered for each one
+ARCHIVE_PREFETCH_FILES = int(get_key(BASE_DIR / '.env', 'ARCHIVE_PREFETCH_FILES') or 4)
+ARCHIVE_PREFETCH_BYTES = int(get_key(BASE_DIR / '.env', 'ARCHIVE_PREFETCH_BYTES') or 1024 * 1024)
+# Every worker thread (or async pool thread under ASGI) may hold a connection while one
+# of them runs a multipart transfer or an export. Connections are only opened when they are needed.
+AWS_MAX_POOL_CONNECTIONS = int(get_key(BASE_DIR / '.env', 'AWS_MAX_POOL_CONNECTIONS') or max(WEB_WORKER_THREADS, AWS_ASYNC_MAX_WORKERS) + max(AWS_S3_MAX_CONCURRENCY, AWS_S3_COPY_CONCURRENCY, ARCHIVE_PREFETCH_FILES))
+# Largest body accepted by the streaming upload endpoint
+AWS_S3_MAX_UPLOAD_SIZE = int(get_key(BASE_DIR / '.env', 'AWS_S3_MAX_UPLOAD_SIZE') or 500 * 1024 * 1024)
+# Bytes each user may store, checked against the usage counters on upload. 0 disables it.
+STORAGE_QUOTA_BYTES = int(get_key(BASE_DIR / '.env', 'STORAGE_QUOTA_BYTES') or 0)
+
+# Serve listings from the StoredObject index instead of S3.
+# Run `python manage.py reindex_buckets --all` before enabling it.
+FILE_INDEX_READS_ENABLED = (get_key(BASE_DIR / '.env', 'FILE_INDEX_READS_ENABLED') or 'False') == 'True'
+
+# Folder listing cache, shared in Redis (install redis) by the web workers and run_jobs.
+# It is only enabled with REDIS_URL: a cache per process would keep serving the
+# listings changed by another process until they expire.
+REDIS_URL = get_key(BASE_DIR / '.env', 'REDIS_URL')
+LISTING_CACHE_ENABLED = bool(REDIS_URL) and (get_key(BASE_DIR / '.env', 'LISTING_CACHE_ENABLED') or 'True') == 'True'
+LISTING_CACHE_ALIAS = 'listings'
+LISTING_CACHE_TIMEOUT = int(get_key(BASE_DIR / '.env', 'LISTING_CACHE_TIMEOUT') or 60)
+LISTING_CACHE_MAX_ENTRIES = int(get_key(BASE_DIR / '.env', 'LISTING_CACHE_MAX_ENTRIES') or 5000)
+
+# Background jobs. With FOLDER_JOBS_ASYNC folder renames and deletes return
+# 202 and are run by `python manage.py run_jobs`. Off by default, the API
+# answers them with a 200 once they are done and needs no worker.
+FOLDER_JOBS_ASYNC = (get_key(BASE_DIR / '.env', 'FOLDER_JOBS_ASYNC') or 'False') == 'True'
+JOBS_WORKER_CONCURRENCY = int(get_key(BASE_DIR / '.env', 'JOBS_WORKER_CONCURRENCY') or 4)
+JOBS_MAX_ATTEMPTS = int(get_key(BASE_DIR / '.env', 'JOBS_MAX_ATTEMPTS') or 3)
+JOBS_RETRY_BACKOFF = int(get_key(BASE_DIR / '.env', 'JOBS_RETRY_BACKOFF') or 5)
+JOBS_LOCK_TIMEOUT = int(get_key(BASE_DIR / '.env', 'JOBS_LOCK_TIMEOUT') or 600)
+JOBS_POLL_INTERVAL = float(get_key(BASE_DIR / '.env', 'JOBS_POLL_INTERVAL') or 1)
+
+# Full-text search of the PDF contents (files/content-search/). When enabled uploads queue a
+# text extraction job, so `run_jobs` must be running; run
+# `python manage.py backfill_document_text --all` for the existing files.
+DOCUMENT_TEXT_ENABLED = (get_key(BASE_DIR / '.env', 'DOCUMENT_TEXT_ENABLED') or 'False') == 'True'
+# Processes reading the PDFs, shared by the threads of a job worker
+DOCUMENT_TEXT_WORKERS = int(get_key(BASE_DIR / '.env', 'DOCUMENT_TEXT_WORKERS') or 2)
+DOCUMENT_TEXT_MAX_PAGES = int(get_key(BASE_DIR / '.env', 'DOCUMENT_TEXT_MAX_PAGES') or 2000)
+# PostgreSQL text search configuration, e.g. spanish to match the word stems.
+# Changing it requires `backfill_document_text --all --force`.
+DOCUMENT_SEARCH_CONFIG = get_key(BASE_DIR / '.env', 'DOCUMENT_SEARCH_CONFIG') or 'simple'
+
+# Per-request metrics: Server-Timing header, one JSON log line per request
+# (REQUEST_METRICS_LOG) and the Prometheus endpoint /metrics
+REQUEST_METRICS_ENABLED = (get_key(BASE_DIR / '.env', 'REQUEST_METRICS_ENABLED') or 'True') == 'True'
+REQUEST_METRICS_LOG = (get_key(BASE_DIR / '.env', 'REQUEST_METRICS_LOG') or 'True') == 'True'
+# Bearer token required by /metrics, which is closed while it is empty
+METRICS_TOKEN = get_key(BASE_DIR / '.env', 'METRICS_TOKEN') or ''
+
+# Presigned URLs let the clients upload and download directly from S3
+AWS_S3_PRESIGNED_URLS_ENABLED = (get_key(BASE_DIR / '.env', 'AWS_S3_PRESIGNED_URLS_ENABLED') or 'False') == 'True'
+AWS_S3_PRESIGNED_URL_EXPIRES = int(get_key(BASE_DIR / '.env', 'AWS_S3_PRESIGNED_URL_EXPIRES') or 300)
+AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE = int(get_key(BASE_DIR / '.env', 'AWS_S3_PRESIGNED_MAX_UPLOAD_SIZE') or 100 * 1024 * 1024)
+
 # COGNITO
 COGNITO_AWS_REGION = get_key(BASE_DIR / '.env', 'COGNITO_AWS_REGION')
 COGNITO_USER_POOL = get_key(BASE_DIR / '.env', 'COGNITO_USER_POOL')
 COGNITO_AUDIENCE = get_key(BASE_DIR / '.env', 'COGNITO_AUDIENCE')
+# Verified tokens kept per process, so their signature is only checked once
+COGNITO_TOKEN_CACHE_SIZE = int(get_key(BASE_DIR / '.env', 'COGNITO_TOKEN_CACHE_SIZE') or 10000)
+# Minimum seconds between two downloads of the user pool keys
+COGNITO_JWKS_MIN_REFRESH_INTERVAL = int(get_key(BASE_DIR / '.env', 'COGNITO_JWKS_MIN_REFRESH_INTERVAL') or 60)
 
 # DATABASE
 DB_NAME = get_key(BASE_DIR / '.env', 'DB_NAME')
@@ -56,16 +136,20 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_cognito_jwt',
     'rest_framework',
     'aws_files_api',
     'aws_auth_service',
     'drf_yasg',
     'shared_files',
+    'jobs',
+    'benchmarks',
     'corsheaders',
 ]
 
 MIDDLEWARE = [
+    'config.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware', 
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -99,6 +183,21 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'range',
+    'if-range',
+    'if-none-match',
+    'if-modified-since',
+    'idempotency-key',
+]
+
+CORS_EXPOSE_HEADERS = [
+    'accept-ranges',
+    'content-disposition',
+    'content-length',
+    'content-range',
+    'etag',
+    'last-modified',
+    'server-timing',
 ]
 
 
@@ -137,17 +236,45 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # In Redis the size is bound by its maxmemory / allkeys-lru policy. The
+    # locmem fallback (LRU past MAX_ENTRIES) only serves single process uses
+    # that enable the cache themselves, like the benchmarks.
+    LISTING_CACHE_ALIAS: {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'TIMEOUT': LISTING_CACHE_TIMEOUT,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'listings',
+        'TIMEOUT': LISTING_CACHE_TIMEOUT,
+        'OPTIONS': {'MAX_ENTRIES': LISTING_CACHE_MAX_ENTRIES},
+    },
+}
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
+    "formatters": {
+        "message": {"format": "%(message)s"},
+    },
     "handlers": {
         "console": {"class": "logging.StreamHandler"},
+        "metrics": {"class": "logging.StreamHandler", "formatter": "message"},
     },
     "loggers": {
         "django_cognito_jwt": {
             "handlers": ["console"],
             "level": "DEBUG",
         },
+        "config.metrics": {
+            "handlers": ["metrics"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
 
@@ -160,8 +287,12 @@ REST_FRAMEWORK = {
     #     # 'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly',
     # ]
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'django_cognito_jwt.JSONWebTokenAuthentication',
-    ]
+        'aws_auth_service.authentication.CachedJSONWebTokenAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'config.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
 }
 
 
@@ -19,6 +19,8 @@ from django.urls import include, path
 from aws_files_api.urls import urlfilepatterns as aws_urls
 from aws_files_api.urls import urlFolderpatterns as aws_urls_folders
 from shared_files.urls import urlpatterns as shared_files_urls
+from jobs.urls import urlpatterns as jobs_urls
+from config.views import metrics_view
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
@@ -40,12 +42,14 @@ schema_view = get_schema_view(
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics', metrics_view, name='metrics'),
     path('api/v1/', include([
         path('files/', include(aws_urls)),
         path('folders/', include(aws_urls_folders)),
         path('docs/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
         path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
         path('shared-files/', include(shared_files_urls)),
+        path('jobs/', include(jobs_urls)),
         ])),
 ]
 
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from aws_auth_service.authentication import verified_tokens
+from aws_files_api.cache import listing_cache
+from config.aws import client_stats
+from config.metrics import process_metrics
+
+
+# Last word of the statistics that only grow: requests, saturated, connections_created, hits, misses
+COUNTER_NAMES = {'requests', 'saturated', 'created', 'hits', 'misses'}
+
+
+def metrics_view(request):
+    """
+    Prometheus endpoint with the totals of this process. The scraper must
+    send METRICS_TOKEN as a Bearer token; without it the endpoint is closed.
+    """
+    if not settings.METRICS_TOKEN:
+        return HttpResponseForbidden('Set METRICS_TOKEN to enable /metrics')
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+        return HttpResponseForbidden()
+
+    gauges = {}
+    counters = {}
+
+    def add(name, labels, value):
+        # The totals since the process started are counters, the current values gauges
+        metrics = counters if name.rsplit('_', 1)[-1] in COUNTER_NAMES else gauges
+        metrics.setdefault(name, []).append((labels, value))
+
+    for service_name, stats in client_stats().items():
+        for name, value in stats.items():
+            add(f'aws_client_{name}', {'service': service_name}, value)
+    for name, value in listing_cache.stats().items():
+        add(f'listing_cache_{name}', {}, value)
+    for name, value in verified_tokens.stats().items():
+        add(f'token_cache_{name}', {}, value)
+
+    return HttpResponse(process_metrics.render(gauges, counters), content_type='text/plain; version=0.0.4')
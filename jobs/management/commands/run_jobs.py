@@ -0,0 +1,62 @@
+import os
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+
+from jobs.services import JobService
+
+
+class Command(BaseCommand):
+    help = 'Process the queued background jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.JOBS_WORKER_CONCURRENCY,
+                            help='Number of jobs processed at the same time')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit when there are no runnable jobs left instead of polling')
+
+    def handle(self, *args, **options):
+        self.job_service = JobService()
+        self.once = options['once']
+        self.stopped = threading.Event()
+        prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+        threads = [
+            threading.Thread(target=self.work, args=(f'{prefix}:{index}',), daemon=True)
+            for index in range(options['concurrency'])
+        ]
+        self.stdout.write(f'Starting {len(threads)} job workers')
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stopped.set()
+            self.stdout.write('Stopping, waiting for the running jobs to finish')
+            for thread in threads:
+                thread.join()
+
+    def work(self, worker_id):
+        try:
+            while not self.stopped.is_set():
+                close_old_connections()
+                self.job_service.requeue_stale()
+
+                job = self.job_service.claim(worker_id)
+                if job is None:
+                    if self.once:
+                        return
+                    time.sleep(settings.JOBS_POLL_INTERVAL)
+                    continue
+
+                self.stdout.write(f'[{worker_id}] running {job}')
+                self.job_service.run(job)
+        finally:
+            connection.close()
@@ -0,0 +1,23 @@
+# Job handlers by kind. Apps register theirs from AppConfig.ready().
+
+_handlers = {}
+
+
+def register(kind):
+    """
+    Decorator that registers the function that runs the jobs of a kind.
+    The function receives the Job and a progress(done, total) callable and
+    returns a JSON serializable result. progress() without arguments only
+    keeps the lock of the job, for long steps with nothing to report. It must be safe to run again after
+    a failure, since failed jobs are retried.
+    """
+    def decorator(handler):
+        _handlers[kind] = handler
+        return handler
+    return decorator
+
+
+def get_handler(kind):
+    if kind not in _handlers:
+        raise Exception(f"No handler registered for job kind {kind}")
+    return _handlers[kind]
@@ -0,0 +1,14 @@
+from rest_framework import serializers
+
+from jobs.models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    progress = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Job
+        fields = ('id', 'kind', 'status', 'progress', 'attempts', 'result', 'error', 'created_at', 'updated_at')
+
+    def get_progress(self, obj):
+        return {'done': obj.progress_done, 'total': obj.progress_total}
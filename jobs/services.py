@@ -0,0 +1,179 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from jobs.models import Job
+from jobs.registry import get_handler
+
+
+class JobService:
+    def __init__(self):
+        self.model = Job
+
+    @staticmethod
+    def _default_idempotency_key(kind, payload):
+        data = json.dumps({'kind': kind, 'payload': payload}, sort_keys=True)
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def enqueue(self, owner_user_id, kind, payload, idempotency_key=None):
+        """
+        Create a job, or return the existing one for the same operation.
+        With an explicit idempotency key (Idempotency-Key header) any earlier
+        job with that key is returned; otherwise only a pending or running
+        job with the same kind and payload is reused.
+        @param owner_user_id: str
+        @param kind: str
+        @param payload: dict
+        @param idempotency_key: str
+        @return: Job
+        """
+        jobs = self.model.objects.filter(owner_user_id=owner_user_id)
+        if idempotency_key:
+            existing = jobs.filter(idempotency_key=idempotency_key).order_by('-id').first()
+        else:
+            idempotency_key = self._default_idempotency_key(kind, payload)
+            existing = jobs.filter(idempotency_key=idempotency_key, status__in=Job.ACTIVE_STATUSES).first()
+        if existing:
+            return existing
+
+        try:
+            with transaction.atomic():
+                return self.model.objects.create(
+                    owner_user_id=owner_user_id,
+                    kind=kind,
+                    payload=payload,
+                    idempotency_key=idempotency_key,
+                    max_attempts=settings.JOBS_MAX_ATTEMPTS,
+                )
+        except IntegrityError:
+            # Another request enqueued the same operation concurrently
+            return jobs.get(idempotency_key=idempotency_key, status__in=Job.ACTIVE_STATUSES)
+
+    def enqueue_many(self, owner_user_id, kind, payloads, batch_size=1000):
+        """
+        Create many jobs with bulk INSERTs, e.g. for a backfill. Payloads
+        that already have an active job are skipped by the database.
+        @param owner_user_id: str
+        @param kind: str
+        @param payloads: iterable of dict
+        @param batch_size: int
+        @return: int - number of payloads submitted
+        """
+        count = 0
+        batch = []
+        for payload in payloads:
+            batch.append(self.model(
+                owner_user_id=owner_user_id,
+                kind=kind,
+                payload=payload,
+                idempotency_key=self._default_idempotency_key(kind, payload),
+                max_attempts=settings.JOBS_MAX_ATTEMPTS,
+            ))
+            if len(batch) >= batch_size:
+                self.model.objects.bulk_create(batch, ignore_conflicts=True)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.model.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+        return count
+
+    def get_by_id(self, job_id, owner_user_id):
+        return self.model.objects.filter(id=job_id, owner_user_id=owner_user_id).first()
+
+    def claim(self, worker_id):
+        """
+        Lock the next runnable job for this worker. SKIP LOCKED lets many
+        workers poll the table concurrently without taking the same job.
+        @param worker_id: str
+        @return: Job or None
+        """
+        with transaction.atomic():
+            job = (
+                self.model.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=Job.STATUS_PENDING, run_after__lte=timezone.now())
+                .order_by('run_after', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+
+            job.status = Job.STATUS_RUNNING
+            job.attempts += 1
+            job.locked_by = worker_id
+            job.locked_at = timezone.now()
+            job.save(update_fields=['status', 'attempts', 'locked_by', 'locked_at', 'updated_at'])
+            return job
+
+    def requeue_stale(self):
+        """
+        Put back in the queue the running jobs whose worker stopped sending
+        progress, e.g. because it was killed
+        @return: int
+        """
+        deadline = timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT)
+        return self.model.objects.filter(status=Job.STATUS_RUNNING, locked_at__lt=deadline).update(
+            status=Job.STATUS_PENDING,
+            locked_by='',
+            locked_at=None,
+            error='Worker lost',
+            updated_at=timezone.now(),
+        )
+
+    def heartbeat(self, job):
+        # Keeps the lock of a job that has no progress to report
+        self.model.objects.filter(id=job.id).update(locked_at=timezone.now(), updated_at=timezone.now())
+
+    def update_progress(self, job, done, total):
+        # Progress writes also act as the heartbeat of the lock
+        self.model.objects.filter(id=job.id).update(
+            progress_done=done,
+            progress_total=total,
+            locked_at=timezone.now(),
+            updated_at=timezone.now(),
+        )
+
+    def run(self, job):
+        """
+        Run a claimed job and store its result, scheduling a retry with
+        exponential backoff when it fails
+        @param job: Job
+        """
+        last_update = [0.0]
+
+        def progress(done=None, total=None):
+            now = time.monotonic()
+            if done is None:
+                if now - last_update[0] >= 1:
+                    last_update[0] = now
+                    self.heartbeat(job)
+            elif done == total or now - last_update[0] >= 1:
+                last_update[0] = now
+                self.update_progress(job, done, total)
+
+        try:
+            result = get_handler(job.kind)(job, progress)
+        except Exception as e:
+            job.error = str(e)
+            job.locked_by = ''
+            job.locked_at = None
+            if job.attempts < job.max_attempts:
+                job.status = Job.STATUS_PENDING
+                job.run_after = timezone.now() + timedelta(seconds=settings.JOBS_RETRY_BACKOFF * 2 ** (job.attempts - 1))
+            else:
+                job.status = Job.STATUS_FAILED
+            job.save(update_fields=['status', 'error', 'run_after', 'locked_by', 'locked_at', 'updated_at'])
+            return
+
+        job.status = Job.STATUS_SUCCEEDED
+        job.result = result
+        job.error = ''
+        job.locked_by = ''
+        job.locked_at = None
+        job.save(update_fields=['status', 'result', 'error', 'locked_by', 'locked_at', 'updated_at'])
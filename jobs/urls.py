@@ -0,0 +1,8 @@
+from django.urls import path
+
+from jobs.views import JobStatus
+
+
+urlpatterns = [
+    path('<int:job_id>/', JobStatus.as_view(), name='job_status'),
+]
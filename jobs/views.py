@@ -0,0 +1,22 @@
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+
+from jobs.serializers import JobSerializer
+from jobs.services import JobService
+
+
+job_service = JobService()
+
+
+class JobStatus(APIView):
+
+    def get(self, request, job_id):
+        try:
+            job = job_service.get_by_id(job_id, request.user.username)
+            if job is None:
+                return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+            return Response(JobSerializer(job).data, status=status.HTTP_200_OK)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
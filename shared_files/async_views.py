@@ -0,0 +1,51 @@
+from django.http import JsonResponse
+from rest_framework import status
+
+from aws_files_api.async_services import run_blocking
+from config.async_views import AsyncAPIView
+from config.renderers import FastJsonResponse
+from shared_files.serializers import SharedFilesPageSerializer
+from shared_files.services import SharedFileService
+
+shared_file_service = SharedFileService()
+
+
+class AsyncSharedFileView(AsyncAPIView):
+    """
+    Async version of SharedFileView.get. The queries run in the shared
+    thread pool rather than through the async ORM, which sends every query
+    of the process to a single thread.
+    """
+
+    async def get(self, request):
+        try:
+            username = request.user.username
+            if username == "":
+                return JsonResponse({"error": "Token is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = SharedFilesPageSerializer(data=request.GET)
+            if not serializer.is_valid():
+                return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            page_size = serializer.get_page_size()
+            if page_size is None:
+                shared_files = await run_blocking(
+                    lambda: list(shared_file_service.filter_received(
+                        username,
+                        serializer.validated_data.get('owner'),
+                        serializer.validated_data.get('name_prefix'),
+                    ).values())
+                )
+                return FastJsonResponse({"message": "Shared files retrieved successfully", "shared_files": shared_files}, status=status.HTTP_200_OK)
+
+            page = await run_blocking(
+                shared_file_service.get_page_by_shared_with_user_id,
+                username,
+                page_size,
+                serializer.validated_data.get('cursor'),
+                serializer.validated_data.get('owner'),
+                serializer.validated_data.get('name_prefix'),
+            )
+            return FastJsonResponse({"message": "Shared files retrieved successfully", **page}, status=status.HTTP_200_OK)
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:24
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def delete_duplicate_shares(apps, schema_editor):
+    # Keep the oldest share of every (owner, file, recipient) before adding the constraint
+    SharedFile = apps.get_model('shared_files', 'SharedFile')
+    duplicates = (
+        SharedFile.objects
+        .values('owner_user_id', 'file_key', 'shared_with_user_id')
+        .annotate(first_id=Min('id'), total=Count('id'))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        SharedFile.objects.filter(
+            owner_user_id=duplicate['owner_user_id'],
+            file_key=duplicate['file_key'],
+            shared_with_user_id=duplicate['shared_with_user_id'],
+        ).exclude(id=duplicate['first_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_files', '0004_sharedfile_owner_user_email'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='sharedfile',
+            constraint=models.UniqueConstraint(fields=('owner_user_id', 'file_key', 'shared_with_user_id'), name='shared_file_owner_key_user_uniq'),
+        ),
+    ]
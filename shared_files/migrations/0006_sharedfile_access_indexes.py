@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_files', '0005_sharedfile_unique_share'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=models.Index(fields=['shared_with_user_id', '-shared_at'], name='shared_file_recipient_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=models.Index(fields=['owner_user_id', 'file_key'], name='shared_file_owner_key_idx', opclasses=['varchar_pattern_ops', 'text_pattern_ops']),
+        ),
+    ]
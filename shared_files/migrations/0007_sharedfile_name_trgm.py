@@ -0,0 +1,21 @@
+# Generated by Django 5.1.7 on 2026-10-17 18:43
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_files', '0006_sharedfile_access_indexes'),
+        # Creates the pg_trgm and btree_gin extensions
+        ('aws_files_api', '0005_storedobject_key_trgm'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sharedfile',
+            index=django.contrib.postgres.indexes.GinIndex(models.F('shared_with_user_id'), django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('file_name'), name='gin_trgm_ops'), name='shared_file_name_trgm_idx'),
+        ),
+    ]
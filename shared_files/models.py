@@ -1,4 +1,7 @@
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models import F
+from django.db.models.functions import Upper
 
 class SharedFile(models.Model):
     id = models.AutoField(primary_key=True)
@@ -12,5 +15,25 @@ class SharedFile(models.Model):
     shared_with_user_email = models.CharField(max_length=255)
     shared_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['owner_user_id', 'file_key', 'shared_with_user_id'],
+                name='shared_file_owner_key_user_uniq',
+            ),
+        ]
+        indexes = [
+            # Shares received by a user, newest first
+            models.Index(fields=['shared_with_user_id', '-shared_at'], name='shared_file_recipient_idx'),
+            # Shares of a file or of every file under a folder (file_key LIKE 'folder/%')
+            models.Index(
+                fields=['owner_user_id', 'file_key'],
+                opclasses=['varchar_pattern_ops', 'text_pattern_ops'],
+                name='shared_file_owner_key_idx',
+            ),
+            # Search of the names of the files shared with a user (file_name__icontains)
+            GinIndex(F('shared_with_user_id'), OpClass(Upper('file_name'), name='gin_trgm_ops'), name='shared_file_name_trgm_idx'),
+        ]
+
     def __str__(self):
         return f"{self.owner_user_id} compartió {self.file_key} con {self.shared_with_user_id}"
@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from shared_files.models import SharedFile
+from shared_files.services import decode_shared_cursor
 
 class SharedUserSerializer(serializers.Serializer):
     id = serializers.CharField()
@@ -40,3 +41,53 @@ class GetSharedFilesByFileKeySerializer(serializers.ModelSerializer):
         fields = ('file_key',)
 
 
+
+
+class SharedFileItemSerializer(serializers.Serializer):
+    file_key = serializers.CharField()
+    file_name = serializers.CharField()
+    file_size = serializers.IntegerField()
+
+
+class SharedFilesBatchSerializer(serializers.Serializer):
+    files = SharedFileItemSerializer(many=True, allow_empty=False, max_length=1000)
+    shared_with_users = SharedUserSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class SharedFilesPageSerializer(serializers.Serializer):
+    """
+    Without page_size or cursor the whole list is returned, as before the
+    pagination was added
+    """
+    page_size = serializers.IntegerField(
+        required=False,
+        min_value=1,
+        max_value=500,
+        help_text='Number of shares per page (100 when only cursor is given). Pass it to get pages with next_cursor'
+    )
+    cursor = serializers.CharField(
+        required=False,
+        help_text='next_cursor returned by the previous page'
+    )
+    owner = serializers.CharField(
+        required=False,
+        help_text='Only the files shared by this user'
+    )
+    name_prefix = serializers.CharField(
+        required=False,
+        help_text='Only the files whose name starts with this text'
+    )
+
+    def validate_cursor(self, value):
+        try:
+            return decode_shared_cursor(value)
+        except ValueError as e:
+            raise serializers.ValidationError(str(e))
+
+    def get_page_size(self):
+        """
+        Return the page size, None when the whole list is requested
+        """
+        if 'page_size' not in self.validated_data and 'cursor' not in self.validated_data:
+            return None
+        return self.validated_data.get('page_size', 100)
@@ -1,8 +1,42 @@
 # GUARDAR, EDITAR, REMOVER Y RECUPERAR DE LA BD
 
+import base64
+import json
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q, TextField, Value
+from django.db.models.functions import Concat, Substr
+from django.utils.dateparse import parse_datetime
+
+from config.search import search_rank
 from shared_files.models import SharedFile
 
 
+# Columns returned by the shared-files listing
+SHARED_FILE_LIST_FIELDS = ('id', 'owner_user_id', 'owner_user_email', 'file_key', 'file_name', 'file_size', 'shared_at')
+
+
+def encode_shared_cursor(shared_at, shared_file_id):
+    data = json.dumps([shared_at.isoformat(), shared_file_id])
+    return base64.urlsafe_b64encode(data.encode()).decode()
+
+
+def decode_shared_cursor(cursor):
+    """
+    Return the (shared_at, id) position encoded in a listing cursor
+    @param cursor: str
+    @return: tuple
+    """
+    try:
+        shared_at, shared_file_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        shared_at = parse_datetime(shared_at)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if shared_at is None or not isinstance(shared_file_id, int):
+        raise ValueError("Invalid cursor")
+    return shared_at, shared_file_id
+
+
 class SharedFileService:
     def __init__(self):
         self.model = SharedFile
@@ -10,43 +44,176 @@ class SharedFileService:
     def save(self, shared_file):
         return self.model.objects.create(**shared_file)
 
+    def save_many(self, shared_files, batch_size=1000):
+        """
+        This function create many shares in one transaction, with one INSERT
+        per batch. Shares that already exist (same owner, file and recipient)
+        are skipped instead of being duplicated, and are not counted.
+        @param shared_files: list of dict
+        @param batch_size: int
+        @return: int - number of shares created
+        """
+        # The repeated shares of the request are dropped first, then those already stored
+        shares = {
+            (shared_file['owner_user_id'], shared_file['file_key'], shared_file['shared_with_user_id']): shared_file
+            for shared_file in shared_files
+        }
+        keys = list(shares)
+        created = 0
+        with transaction.atomic():
+            for start in range(0, len(keys), batch_size):
+                batch = keys[start:start + batch_size]
+                # Exact (owner, file, recipient) matches, served by the unique constraint
+                existing = set(
+                    self.model.objects
+                    .filter(Q(
+                        *(Q(owner_user_id=owner, file_key=file_key, shared_with_user_id=user) for owner, file_key, user in batch),
+                        _connector=Q.OR,
+                    ))
+                    .values_list('owner_user_id', 'file_key', 'shared_with_user_id')
+                )
+                objects = [self.model(**shares[key]) for key in batch if key not in existing]
+                # A concurrent request may still have created some of them
+                self.model.objects.bulk_create(objects, ignore_conflicts=True)
+                created += len(objects)
+        return created
+
 
     def update(self, shared_file):
         return self.model.objects.filter(id=shared_file.id).update(**shared_file)
     
-    def update_file_key(self, file_key, new_file_key):
+    def update_file_key(self, file_key, new_file_key, owner_user_id):
         
        
         if '/' in file_key:
             file_name = file_key.split('/')[-1]
-            return self.model.objects.filter(file_key=file_key).update(file_key=new_file_key, file_name=file_name)
+            return self.model.objects.filter(owner_user_id=owner_user_id, file_key=file_key).update(file_key=new_file_key, file_name=file_name)
         else:
-            return self.model.objects.filter(file_key=file_key).update(file_key=new_file_key)
+            return self.model.objects.filter(owner_user_id=owner_user_id, file_key=file_key).update(file_key=new_file_key)
     
-    def update_folder_key(self, folder_key, new_folder_key):
-        files = self.model.objects.filter(file_key__contains=folder_key)
-        
-        for file in files:
-            if folder_key in file.file_key:
-                new_file_key = file.file_key.replace(folder_key, new_folder_key)
-                self.model.objects.filter(id=file.id).update(file_key=new_file_key)
-        
-        return self.model.objects.filter(folder_key=folder_key).update(folder_key=new_folder_key)
+    def update_folder_key(self, folder_key, new_folder_key, owner_user_id):
+        """
+        This function move the shares of every file under a folder of the
+        owner to the new folder with a single UPDATE. Shares already present
+        at the destination for the same recipient are replaced, as S3
+        overwrites the objects they point to.
+        @param folder_key: str
+        @param new_folder_key: str
+        @param owner_user_id: str
+        @return: int - number of shares moved
+        """
+        prefix = f"{folder_key}/"
+        new_file_key = Concat(Value(f"{new_folder_key}/"), Substr('file_key', len(prefix) + 1), output_field=TextField())
+        files = self.model.objects.filter(owner_user_id=owner_user_id, file_key__startswith=prefix)
+
+        with transaction.atomic():
+            moved = (
+                files
+                .filter(shared_with_user_id=OuterRef('shared_with_user_id'))
+                .annotate(new_file_key=new_file_key)
+                .filter(new_file_key=OuterRef('file_key'))
+            )
+            self.model.objects.filter(
+                owner_user_id=owner_user_id,
+                file_key__startswith=f"{new_folder_key}/",
+            ).filter(Exists(moved)).delete()
 
+            return files.update(file_key=new_file_key)
 
-    def delete(self, file_key):
-        return self.model.objects.filter(file_key=file_key).delete()
+
+    def delete(self, file_key, owner_user_id):
+        return self.model.objects.filter(owner_user_id=owner_user_id, file_key=file_key).delete()
+
+    def delete_by_id(self, shared_file_id, owner_user_id):
+        return self.model.objects.filter(id=shared_file_id, owner_user_id=owner_user_id).delete()
     
-    def delete_folder(self, folder_key):
-        files_with_folder = self.model.objects.filter(file_key__contains=folder_key)
-        files_with_folder.delete()
-        
-        return self.model.objects.filter(folder_key=folder_key).delete()
+    def delete_folder(self, folder_key, owner_user_id):
+        return self.model.objects.filter(owner_user_id=owner_user_id, file_key__startswith=f"{folder_key}/").delete()
+
+    def delete_many(self, file_keys, owner_user_id, batch_size=1000):
+        with transaction.atomic():
+            for start in range(0, len(file_keys), batch_size):
+                self.model.objects.filter(owner_user_id=owner_user_id, file_key__in=file_keys[start:start + batch_size]).delete()
 
 
     def get_by_shared_with_user_id(self, shared_with_user_id ):
         return self.model.objects.filter(shared_with_user_id=shared_with_user_id).all()
+
+    def filter_received(self, shared_with_user_id, owner_user_id=None, name_prefix=None):
+        """
+        This function return the shares received by a user
+        @param shared_with_user_id: str
+        @param owner_user_id: str - optional filter
+        @param name_prefix: str - optional filter on the file name
+        @return: QuerySet
+        """
+        queryset = self.get_by_shared_with_user_id(shared_with_user_id)
+        if owner_user_id:
+            queryset = queryset.filter(owner_user_id=owner_user_id)
+        if name_prefix:
+            queryset = queryset.filter(file_name__startswith=name_prefix)
+        return queryset
+
+    def estimate_count(self, queryset):
+        """
+        This function return the number of rows of a queryset, estimated from
+        the PostgreSQL query plan so it does not scan every row
+        @param queryset: QuerySet
+        @return: int
+        """
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        if isinstance(plan, list):
+            plan = plan[0]
+        return int(plan['Plan']['Plan Rows'])
+
+    def get_page_by_shared_with_user_id(self, shared_with_user_id, page_size, cursor=None, owner_user_id=None, name_prefix=None):
+        """
+        This function return one page of the shares received by a user, newest
+        first. The page starts after the (shared_at, id) of the cursor, so
+        every page costs the same no matter how deep it is.
+        @param shared_with_user_id: str
+        @param page_size: int
+        @param cursor: tuple - (shared_at, id) from decode_shared_cursor
+        @param owner_user_id: str - optional filter
+        @param name_prefix: str - optional filter on the file name
+        @return: dict - shared_files, next_cursor and count_estimate
+        """
+        queryset = self.filter_received(shared_with_user_id, owner_user_id, name_prefix)
+
+        page = queryset
+        if cursor:
+            shared_at, shared_file_id = cursor
+            page = page.filter(Q(shared_at__lt=shared_at) | Q(shared_at=shared_at, id__lt=shared_file_id))
+
+        rows = list(page.order_by('-shared_at', '-id').values(*SHARED_FILE_LIST_FIELDS)[:page_size + 1])
+        next_cursor = None
+        if len(rows) > page_size:
+            last = rows[page_size - 1]
+            next_cursor = encode_shared_cursor(last['shared_at'], last['id'])
+
+        return {
+            'shared_files': rows[:page_size],
+            'next_cursor': next_cursor,
+            'count_estimate': self.estimate_count(queryset),
+        }
     
+    def search(self, shared_with_user_id, query, limit):
+        """
+        This function return the shares received by a user whose file name
+        contains query, best matches first
+        @param shared_with_user_id: str
+        @param query: str
+        @param limit: int
+        @return: list of dicts
+        """
+        return list(
+            self.model.objects
+            .filter(shared_with_user_id=shared_with_user_id, file_name__icontains=query)
+            .annotate(score=search_rank(query, 'file_name'))
+            .order_by('-score', 'file_name', '-id')
+            .values(*SHARED_FILE_LIST_FIELDS, 'score')[:limit]
+        )
+
     def get_by_file_key(self, file_key, owner_user_id):
         return self.model.objects.filter(file_key=file_key, owner_user_id=owner_user_id).all()
     
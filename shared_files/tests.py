@@ -1,3 +1,147 @@
+from datetime import datetime, timedelta, timezone
+
 from django.test import TestCase
 
-# Create your tests here.
+from shared_files.models import SharedFile
+from shared_files.services import SharedFileService, decode_shared_cursor
+
+
+def share(file_key, owner_user_id='alice', shared_with_user_id='bob', **fields):
+    return {
+        'owner_user_id': owner_user_id,
+        'owner_user_email': f'{owner_user_id}@example.com',
+        'bucket_name': f'{owner_user_id}-security-project',
+        'file_key': file_key,
+        'file_name': file_key.rsplit('/', 1)[-1],
+        'file_size': 1024,
+        'shared_with_user_id': shared_with_user_id,
+        'shared_with_user_email': f'{shared_with_user_id}@example.com',
+        **fields,
+    }
+
+
+class UpdateFolderKeyTests(TestCase):
+
+    def setUp(self):
+        self.service = SharedFileService()
+
+    def file_keys(self, **filters):
+        return sorted(SharedFile.objects.filter(**filters).values_list('file_key', flat=True))
+
+    def test_folder_is_renamed(self):
+        for file_key in ('a/b/one.pdf', 'a/b/c/two.pdf', 'a/other.pdf'):
+            self.service.save(share(file_key))
+
+        moved = self.service.update_folder_key('a/b', 'x/y', 'alice')
+
+        self.assertEqual(moved, 2)
+        self.assertEqual(self.file_keys(), ['a/other.pdf', 'x/y/c/two.pdf', 'x/y/one.pdf'])
+
+    def test_moved_share_replaces_the_share_at_the_destination(self):
+        moved = self.service.save(share('a/report.pdf'))
+        replaced = self.service.save(share('b/report.pdf'))
+        other_recipient = self.service.save(share('b/report.pdf', shared_with_user_id='carol'))
+
+        self.service.update_folder_key('a', 'b', 'alice')
+
+        self.assertFalse(SharedFile.objects.filter(id=replaced.id).exists())
+        self.assertEqual(SharedFile.objects.get(id=moved.id).file_key, 'b/report.pdf')
+        self.assertEqual(SharedFile.objects.get(id=other_recipient.id).file_key, 'b/report.pdf')
+
+    def test_other_owners_are_not_changed(self):
+        self.service.save(share('a/report.pdf'))
+        self.service.save(share('a/report.pdf', owner_user_id='dave'))
+        self.service.save(share('b/report.pdf', owner_user_id='dave'))
+
+        self.service.update_folder_key('a', 'b', 'alice')
+
+        self.assertEqual(self.file_keys(owner_user_id='alice'), ['b/report.pdf'])
+        self.assertEqual(self.file_keys(owner_user_id='dave'), ['a/report.pdf', 'b/report.pdf'])
+
+    def test_folder_sharing_a_string_prefix_is_not_changed(self):
+        self.service.save(share('a/b/one.pdf'))
+        self.service.save(share('a/bc/two.pdf'))
+        self.service.save(share('a/b.pdf'))
+
+        self.service.update_folder_key('a/b', 'a/z', 'alice')
+
+        self.assertEqual(self.file_keys(), ['a/b.pdf', 'a/bc/two.pdf', 'a/z/one.pdf'])
+
+
+class SaveManyTests(TestCase):
+
+    def setUp(self):
+        self.service = SharedFileService()
+
+    def test_repeated_and_existing_shares_are_not_counted(self):
+        self.service.save(share('a/one.pdf', shared_with_user_id='bob'))
+
+        created = self.service.save_many([
+            share('a/one.pdf', shared_with_user_id='bob'),
+            share('a/one.pdf', shared_with_user_id='carol'),
+            share('a/one.pdf', shared_with_user_id='carol'),
+            share('a/two.pdf', shared_with_user_id='bob'),
+        ])
+
+        self.assertEqual(created, 2)
+        self.assertEqual(SharedFile.objects.count(), 3)
+
+    def test_existing_shares_of_other_combinations_do_not_match(self):
+        # Each value of the new share exists, but never all three in the same row
+        self.service.save(share('a/one.pdf', shared_with_user_id='carol'))
+        self.service.save(share('a/two.pdf', shared_with_user_id='bob'))
+        self.service.save(share('a/one.pdf', owner_user_id='dave', shared_with_user_id='bob'))
+
+        created = self.service.save_many([share('a/one.pdf', shared_with_user_id='bob')], batch_size=1)
+
+        self.assertEqual(created, 1)
+        self.assertTrue(SharedFile.objects.filter(owner_user_id='alice', file_key='a/one.pdf', shared_with_user_id='bob').exists())
+
+
+class SharedFilesPageTests(TestCase):
+
+    def setUp(self):
+        self.service = SharedFileService()
+
+    def pages(self, page_size, **filters):
+        cursor = None
+        while True:
+            page = self.service.get_page_by_shared_with_user_id('bob', page_size, cursor, **filters)
+            yield page
+            if page['next_cursor'] is None:
+                return
+            cursor = decode_shared_cursor(page['next_cursor'])
+
+    def test_pages_with_equal_shared_at_have_no_gaps_or_duplicates(self):
+        ids = [self.service.save(share(f'a/{number}.pdf')).id for number in range(10)]
+        self.service.save(share('a/other.pdf', shared_with_user_id='carol'))
+        # Shared in three groups at the same instant, the id breaks the ties
+        shared_at = datetime(2024, 5, 1, 12, 0, 0, 123456, tzinfo=timezone.utc)
+        SharedFile.objects.filter(id__in=ids[:4]).update(shared_at=shared_at)
+        SharedFile.objects.filter(id__in=ids[4:8]).update(shared_at=shared_at - timedelta(seconds=1))
+        SharedFile.objects.filter(id__in=ids[8:]).update(shared_at=shared_at + timedelta(seconds=1))
+
+        pages = list(self.pages(3))
+        received = [row['id'] for page in pages for row in page['shared_files']]
+
+        self.assertEqual([len(page['shared_files']) for page in pages], [3, 3, 3, 1])
+        self.assertEqual(received, sorted(ids[8:], reverse=True) + sorted(ids[:4], reverse=True) + sorted(ids[4:8], reverse=True))
+
+    def test_last_full_page_has_no_cursor(self):
+        for number in range(4):
+            self.service.save(share(f'a/{number}.pdf'))
+
+        pages = list(self.pages(2))
+
+        self.assertEqual(len(pages), 2)
+        self.assertIsNone(pages[-1]['next_cursor'])
+
+    def test_count_estimate(self):
+        for number in range(3):
+            self.service.save(share(f'a/{number}.pdf'))
+
+        page = self.service.get_page_by_shared_with_user_id('bob', 2)
+
+        # Read from the query plan: a positive number of rows, not an exact count
+        self.assertIsInstance(page['count_estimate'], int)
+        self.assertGreater(page['count_estimate'], 0)
@@ -1,11 +1,14 @@
 
 from django.urls import path
 
-from shared_files.views import SharedFileByFileKey, SharedFileView
+from shared_files.async_views import AsyncSharedFileView
+from shared_files.views import SharedFileBatchView, SharedFileByFileKey, SharedFileView
 
 
 urlpatterns = [
     path('', SharedFileView.as_view(), name='shared_files'),
+    path('batch/', SharedFileBatchView.as_view(), name='shared_files_batch'),
+    path('async/', AsyncSharedFileView.as_view(), name='shared_files_async'),
     path('by-file-key', SharedFileByFileKey.as_view(), name='shared_files_by_file_key'),
 ]
 
@@ -1,6 +1,6 @@
 
 
-from shared_files.serializers import DeleteSharedFileSerializer, GetSharedFilesByFileKeySerializer, GetSharedFilesSerializer, SharedFileSerializer
+from shared_files.serializers import DeleteSharedFileSerializer, SharedFilesBatchSerializer, SharedFilesPageSerializer, GetSharedFilesByFileKeySerializer, GetSharedFilesSerializer, SharedFileSerializer
 from shared_files.services import SharedFileService
 from rest_framework.response import Response
 from rest_framework import status
@@ -13,19 +13,62 @@ from rest_framework.parsers import JSONParser
 shared_file_service = SharedFileService()
 
 
+def build_shares(owner, files, shared_with_users):
+    """
+    This function build the rows sharing every file with every user
+    @param owner: User
+    @param files: list of dict - file_key, file_name, file_size
+    @param shared_with_users: list of dict - id, email
+    @return: list of dict
+    """
+    return [
+        {
+            "owner_user_id": owner.username,
+            "owner_user_email": owner.email,
+            "bucket_name": owner.username,
+            "file_key": file["file_key"],
+            "file_name": file["file_name"],
+            "file_size": file["file_size"],
+            "shared_with_user_email": user["email"],
+            "shared_with_user_id": user["id"]
+        }
+        for file in files
+        for user in shared_with_users
+    ]
+
+
 
 class SharedFileView(APIView):
     parser_classes = [ JSONParser]
    
+    @swagger_auto_schema(query_serializer=SharedFilesPageSerializer)
     def get(self, request):
         try:
             username = request.user.username
             if username == "":
                 return Response({"error": "Token is required"}, status=status.HTTP_400_BAD_REQUEST)
             
-            shared_files = shared_file_service.get_by_shared_with_user_id(username)
-            print(shared_files)
-            return Response({"message": "Shared files retrieved successfully", "shared_files": shared_files.values()}, status=status.HTTP_200_OK)
+            serializer = SharedFilesPageSerializer(data=request.query_params)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+            page_size = serializer.get_page_size()
+            if page_size is None:
+                shared_files = shared_file_service.filter_received(
+                    username,
+                    serializer.validated_data.get('owner'),
+                    serializer.validated_data.get('name_prefix'),
+                )
+                return Response({"message": "Shared files retrieved successfully", "shared_files": shared_files.values()}, status=status.HTTP_200_OK)
+
+            page = shared_file_service.get_page_by_shared_with_user_id(
+                username,
+                page_size,
+                serializer.validated_data.get('cursor'),
+                serializer.validated_data.get('owner'),
+                serializer.validated_data.get('name_prefix'),
+            )
+            return Response({"message": "Shared files retrieved successfully", **page}, status=status.HTTP_200_OK)
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
@@ -42,17 +85,7 @@ class SharedFileView(APIView):
             
             if serializer.is_valid():
                 
-                for user in serializer.validated_data["shared_with_users"]:
-                    shared_file_service.save({
-                        "owner_user_id": username,
-                        "owner_user_email": request.user.email,
-                        "bucket_name": username,    
-                        "file_key": serializer.validated_data["file_key"],
-                        "file_name": serializer.validated_data["file_name"],
-                        "file_size": serializer.validated_data["file_size"],
-                        "shared_with_user_email": user["email"],
-                        "shared_with_user_id": user["id"]
-                })
+                shared_file_service.save_many(build_shares(request.user, [serializer.validated_data], serializer.validated_data["shared_with_users"]))
                     
                 return Response({"message": "Shared file created successfully"}, status=status.HTTP_201_CREATED)
             else:
@@ -73,7 +106,7 @@ class SharedFileView(APIView):
             
             serializer = DeleteSharedFileSerializer(data=request.query_params)
             if serializer.is_valid():   
-                shared_file_service.delete(serializer.validated_data["id"])
+                shared_file_service.delete_by_id(serializer.validated_data["id"], username)
                 return Response({"message": "Shared file deleted successfully"}, status=status.HTTP_200_OK)
             else:
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -106,3 +139,22 @@ class SharedFileByFileKey(APIView):
     
 
 
+class SharedFileBatchView(APIView):
+    parser_classes = [ JSONParser]
+
+    @swagger_auto_schema(request_body=SharedFilesBatchSerializer)
+    def post(self, request):
+        try:
+            username = request.user.username
+            if username == "":
+                return Response({"error": "Token is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+            serializer = SharedFilesBatchSerializer(data=request.data)
+            if serializer.is_valid():
+                shared = shared_file_service.save_many(build_shares(request.user, serializer.validated_data["files"], serializer.validated_data["shared_with_users"]))
+                return Response({"message": "Shared files created successfully", "shared": shared}, status=status.HTTP_201_CREATED)
+            else:
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)